@@ -21,4 +21,12 @@ write_data() {
     --catalog /local/catalog.json
 }
 
-read_data #| write_data
\ No newline at end of file
+ingest_data() {
+    uv run --project ../tools/data_product_manager --extra ingest \
+    dpm ingest - \
+    --catalog $PWD/catalog.json \
+    --output $PWD/../rw_volumes/airbyte \
+    --emit-state
+}
+
+read_data | ingest_data  # or: read_data | write_data
\ No newline at end of file
@@ -8,18 +8,7 @@ is_admin if {
     input.context.identity.user == "admin"
 }
 
-columnMask := {"expression": "NULL"} if {
+columnMask := column_mask if {
     not is_admin
-    column_resource.catalogName == "sample_catalog"
-    column_resource.schemaName == "sample_schema"
-    column_resource.tableName == "restricted_table"
-    column_resource.columnName == "user_phone"
+    column_mask := data.trino.policies[column_resource.catalogName][column_resource.schemaName][column_resource.tableName].columns[column_resource.columnName]
 }
-
-columnMask := {"expression": "'****' || substring(user_name, -3)"} if {
-    not is_admin
-    column_resource.catalogName == "sample_catalog"
-    column_resource.schemaName == "sample_schema"
-    column_resource.tableName == "restricted_table"
-    column_resource.columnName == "user_name"
-}
\ No newline at end of file
@@ -9,9 +9,9 @@ is_admin if {
     input.context.identity.user == "admin"
 }
 
-rowFilters contains {"expression": "user_type <> 'customer'"} if {
+# data.trino.policies is keyed catalog -> schema -> table, generated by the
+# data product manager: one lookup per check instead of one rule per table.
+rowFilters contains row_filter if {
     not is_admin
-    table_resource.catalogName == "sample_catalog"
-    table_resource.schemaName == "sample_schema"
-    table_resource.tableName == "restricted_table"
-}
\ No newline at end of file
+    some row_filter in data.trino.policies[table_resource.catalogName][table_resource.schemaName][table_resource.tableName].row_filters
+}
@@ -0,0 +1,58 @@
+"""Compare the cold start of `dpm list` with booting the API.
+
+    python -m bench.bench_cold_start --repeat 10 --products 10000
+
+`dpm list` runs the whole command in a fresh interpreter, against a store
+seeded with `--products` records. `api import` only imports data_product_manager.main (the
+FastAPI app and everything it loads), before any request is served. Prints
+one JSON line per command with the median and minimum wall time.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from data_product_manager.db import LocalDB, DataProductState
+
+
+def measure(command, cwd: str, env: dict, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {"median_s": round(statistics.median(timings), 4), "min_s": round(min(timings), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--products", type=int, default=10000)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory(prefix="dpm-cold-start-") as workdir:
+        with LocalDB(path=os.path.join(workdir, "products_db.sqlite"), legacy_path=None) as db:
+            for i in range(args.products):
+                db.insert(DataProductState(name=f"product_{i:06d}", domain=f"domain_{i % 20}", description="seeded", admin_emails=["a@b.co"]))
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])),
+            "CODE_REPOSITORY_URL": workdir,
+            "TRINO_CATALOG_DIR": os.path.join(workdir, "catalogs"),
+        }
+        commands = {
+            "interpreter": [sys.executable, "-c", "pass"],
+            "dpm list": [sys.executable, "-m", "data_product_manager.cli", "list", "--domain", "domain_3", "--limit", "100"],
+            "api import": [sys.executable, "-c", "import data_product_manager.main"],
+        }
+        for name, command in commands.items():
+            print(json.dumps({"command": name, "repeat": args.repeat, **measure(command, workdir, env, args.repeat)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare template forking modes of LocalRepositoryConnector on a large synthetic template.
+
+    python -m bench.bench_fork --files 5000 --size 16384 --repeat 5
+
+The template gets `--files` tracked files plus as many build artifacts under
+target/, dbt_packages/ and .venv/ (ignored by its .gitignore). `legacy` is the
+former plain shutil.copytree of the whole template. Prints one JSON line per mode.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+from data_product_manager.componants.code_repository import LocalRepositoryConnector, ForkMode, template_manifest, _manifests
+
+
+def make_template(root: str, files: int, size: int):
+    template = os.path.join(root, "_template")
+    payload = os.urandom(size)
+    for i in range(files):
+        path = os.path.join(template, "dbt", "models", f"group_{i % 50}", f"model_{i}.sql")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(payload)
+    for artifact in ("target", "dbt_packages", ".venv"):
+        for i in range(files):
+            path = os.path.join(template, "dbt", artifact, f"dir_{i % 50}", f"file_{i}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(payload)
+    with open(os.path.join(template, "dbt", ".gitignore"), "w") as f:
+        f.write("*__pycache__/\n*.venv/\ntarget/\ndbt_packages/\nlogs/\n")
+    return template
+
+
+def bench(name: str, fork, root: str, template: str, repeat: int):
+    timings = []
+    for i in range(repeat):
+        target = os.path.join(root, f"dp-{name}-{i}")
+        start = time.perf_counter()
+        fork(template, target)
+        timings.append(time.perf_counter() - start)
+    copied = sum(len(files) for _, _, files in os.walk(os.path.join(root, f"dp-{name}-0")))
+    for i in range(repeat):
+        shutil.rmtree(os.path.join(root, f"dp-{name}-{i}"))
+    return {
+        "mode": name,
+        "files": copied,
+        "first_s": round(timings[0], 4),
+        "median_s": round(statistics.median(timings), 4),
+        "min_s": round(min(timings), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=16384)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dir", default=None, help="directory to build the template in (defaults to a temp dir)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_fork_", dir=args.dir)
+    try:
+        template = make_template(root, args.files, args.size)
+        print(json.dumps(bench("legacy", shutil.copytree, root, template, args.repeat)))
+        for mode in ForkMode:
+            connector = LocalRepositoryConnector(root, mode)
+            _manifests.clear()
+            try:
+                print(json.dumps(bench(mode.value, connector.fork, root, template, args.repeat)))
+            except OSError as e:
+                print(json.dumps({"mode": mode.value, "error": str(e)}))
+        _manifests.clear()
+        start = time.perf_counter()
+        template_manifest(template)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        template_manifest(template)
+        warm = time.perf_counter() - start
+        print(json.dumps({"manifest": "scan", "cold_s": round(cold, 4), "cached_s": round(warm, 4)}))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measure the logging overhead paid by a request thread, before and after the queue pipeline.
+
+    python -m bench.bench_logging --requests 20000
+
+A simulated request makes the log calls of `POST /data-product` (one info,
+the create parameters and the store debug lines). `legacy` is the former
+handler of data_product_manager/main.py with eager f-string messages; the other setups use
+`configure_logging` with deferred %-style messages. Output goes to
+/dev/null and the timing covers only the calling thread, not the listener.
+Prints one JSON line per setup and level.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+from data_product_manager.logging_config import configure_logging, stop_logging
+
+
+def legacy_configure(level: str, stream):
+    root = logging.getLogger()
+    root.handlers[:] = []
+    logging.basicConfig(**{
+        'level': level,
+        'format': '{{"asctime": "{asctime}", "levelname": "{levelname}", "logger": "{name}", "funcName": "{funcName}", "pathname": "{pathname}", "lineno": {lineno}, "message": {message}}}',
+        'handlers': [type("H",(logging.Handler,),{"emit": lambda self,r: stream.write(f'{self.format(logging.makeLogRecord({**r.__dict__, "msg": json.dumps(r.msg)}))}\n')})()],
+        'style': '{',
+        'force': True,
+    })
+
+
+def legacy_request(logger: logging.Logger, i: int):
+    name, path, kwargs = f"product_{i}", "./products_db.sqlite", {"code_repository": True}
+    params = {"command": "create", "domain": "sales", "name": name, "description": "benchmark data product", "admin_emails": ["a@b.co"]}
+    logger.info(f"Creating data product {name}.")
+    logger.debug(params)
+    logger.debug(f"Inserted data product {name} into database.")
+    logger.debug(f"Saved {1} data products to {path}.")
+    logger.debug(f"Updated data product {name} with {kwargs}.")
+    logger.debug(f"Flushed database to {path}.")
+
+
+def deferred_request(logger: logging.Logger, i: int):
+    name, path, kwargs = f"product_{i}", "./products_db.sqlite", {"code_repository": True}
+    logger.info("Creating data product %s.", name)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug({"command": "create", "domain": "sales", "name": name, "description": "benchmark data product", "admin_emails": ["a@b.co"]})
+    logger.debug("Inserted data product %s into database.", name)
+    logger.debug("Saved %s data products to %s.", 1, path)
+    logger.debug("Updated data product %s with %s.", name, kwargs)
+    logger.debug("Flushed database to %s.", path)
+
+
+def bench(setup: str, level: str, request, requests: int, drain=None):
+    logger = logging.getLogger("bench.logging")
+    start = time.perf_counter()
+    for i in range(requests):
+        request(logger, i)
+    elapsed = time.perf_counter() - start
+    if drain is not None:
+        drain()
+    return {
+        "setup": setup,
+        "level": level,
+        "requests": requests,
+        "per_request_us": round(elapsed / requests * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as sink:
+        for level in ("DEBUG", "INFO"):
+            legacy_configure(level, sink)
+            print(json.dumps(bench("legacy", level, legacy_request, args.requests)))
+
+            for setup, rate in (("queue", 1.0), ("queue_sampled_10%", 0.1)):
+                if level != "DEBUG" and rate < 1.0:
+                    continue
+                configure_logging(level=level, debug_sample_rate=rate, stream=sink)
+                print(json.dumps(bench(setup, level, deferred_request, args.requests, drain=stop_logging)))
+    logging.getLogger().handlers[:] = [logging.StreamHandler(sys.stderr)]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Check LocalDB under concurrent writer processes and measure write throughput by process count.
+
+    python -m bench.bench_writers --processes 1,2,4,8 --products 200
+
+Every process inserts its own products, races the others to insert the same
+contested names, and sets its own state flag on every shared product, each
+operation in its own LocalDB session (read, modify, flush), like concurrent
+API workers do. Afterwards every shared product must carry the flags of all
+processes, every contested name must have exactly one winner, and nothing
+may be missing. Prints one JSON line per process count.
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from data_product_manager.db import LocalDB, DataProductState, FLAG_FIELDS, DataProductExistsError
+
+
+def worker(path: str, index: int, products: int, start: multiprocessing.Event, result: multiprocessing.Queue):
+    flag = FLAG_FIELDS[index % len(FLAG_FIELDS)]
+    won, ops = 0, 0
+    start.wait()
+    began = time.perf_counter()
+    for i in range(products):
+        with LocalDB(path=path, legacy_path=None) as db:
+            db.insert(DataProductState(name=f"own_{index}_{i}", domain="bench", description="bench", admin_emails=["a@b.co"]))
+        with LocalDB(path=path, legacy_path=None) as db:
+            db.update(f"shared_{i}", **{flag: True})
+        try:
+            with LocalDB(path=path, legacy_path=None) as db:
+                db.insert(DataProductState(name=f"contested_{i}", domain="bench", description=f"won by {index}", admin_emails=["a@b.co"]))
+            won += 1
+        except DataProductExistsError:
+            pass
+        ops += 3
+    result.put({"ops": ops, "won": won, "elapsed": time.perf_counter() - began})
+
+
+def run(processes: int, products: int):
+    with tempfile.TemporaryDirectory(prefix="dpm-writers-") as workdir:
+        path = os.path.join(workdir, "products_db.sqlite")
+        with LocalDB(path=path, legacy_path=None) as db:
+            for i in range(products):
+                db.insert(DataProductState(name=f"shared_{i}", domain="bench", description="bench", admin_emails=["a@b.co"]))
+
+        start, result = multiprocessing.Event(), multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(path, p, products, start, result)) for p in range(processes)]
+        for w in workers:
+            w.start()
+        began = time.perf_counter()
+        start.set()
+        reports = [result.get() for _ in workers]
+        elapsed = time.perf_counter() - began
+        for w in workers:
+            w.join()
+
+        expected_flags = {FLAG_FIELDS[p % len(FLAG_FIELDS)] for p in range(processes)}
+        with LocalDB(path=path, legacy_path=None) as db:
+            lost_updates = sum(
+                1 for i in range(products)
+                for flag in expected_flags if not getattr(db.data_products[f"shared_{i}"], flag)
+            )
+            missing = sum(1 for p in range(processes) for i in range(products) if f"own_{p}_{i}" not in db.data_products)
+            total = len(db.data_products)
+        return {
+            "processes": processes,
+            "ops": sum(r["ops"] for r in reports),
+            "ops_per_s": round(sum(r["ops"] for r in reports) / elapsed, 1),
+            "lost_updates": lost_updates,
+            "missing_inserts": missing,
+            "contested_winners": sum(r["won"] for r in reports),
+            "contested_names": products,
+            "records": total,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", default="1,2,4,8")
+    parser.add_argument("--products", type=int, default=200)
+    args = parser.parse_args()
+    for processes in (int(p) for p in args.processes.split(",")):
+        print(json.dumps(run(processes, args.products)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""In-memory stand-in for the Keycloak admin API.
+
+Implements the token endpoint and the admin endpoints used by the master
+bootstrap, over real HTTP/1.1 with keep-alive, and counts what clients do to
+it: token grants, TCP connections and requests per route.
+
+    with FakeKeycloak() as kc:
+        client = KeycloakClient(kc.url, "admin", "admin")
+        client.get_groups()
+        assert kc.token_requests == 1
+
+Run `python -m bench.fake_keycloak --port 8081` to serve it standalone.
+"""
+import re
+import json
+import uuid
+import argparse
+import threading
+import collections
+from urllib.parse import parse_qs, unquote, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _State:
+    def __init__(self, username: str, password: str, token_lifetime: int):
+        self.lock = threading.Lock()
+        self.username = username
+        self.password = password
+        self.token_lifetime = token_lifetime
+        self.tokens: set = set()
+        self.refresh_tokens: set = set()
+        self.groups: dict = {}
+        self.client_scopes: dict = {}
+        self.optional_client_scopes: list = []
+        self.clients: dict = {}
+        self.authz: dict = collections.defaultdict(lambda: {"resources": [], "policies": []})
+        self.client_roles: dict = collections.defaultdict(dict)
+        self.service_accounts: dict = {}
+        self.role_mappings: dict = collections.defaultdict(list)
+        self.realm: dict = {"realm": "master", "enabled": True}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body=None, headers=None):
+        payload = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _created(self, object_id: str):
+        self._reply(201, headers={"Location": f"{self.server.url}{self.path.split('?')[0]}/{object_id}"})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        path = unquote(url.path).rstrip("/")
+        self.server.count(method, path)
+        with self.server.state.lock:
+            if method == "POST" and re.fullmatch(r"/realms/[^/]+/protocol/openid-connect/token", path):
+                return self._token(parse_qs(body.decode()))
+            match = re.fullmatch(r"/admin/realms/[^/]+(/.*)?", path)
+            if not match:
+                return self._reply(404, {"error": "not found"})
+            token = (self.headers.get("Authorization") or "").removeprefix("Bearer ")
+            if token not in self.server.state.tokens:
+                return self._reply(401, {"error": "HTTP 401 Unauthorized"})
+            data = json.loads(body) if body else None
+            return self._admin(method, match.group(1) or "", query, data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def _token(self, form):
+        state = self.server.state
+        grant = form.get("grant_type", [""])[0]
+        if grant == "password":
+            if form.get("username", [""])[0] != state.username or form.get("password", [""])[0] != state.password:
+                return self._reply(401, {"error": "invalid_grant"})
+        elif grant == "refresh_token":
+            if form.get("refresh_token", [""])[0] not in state.refresh_tokens:
+                return self._reply(400, {"error": "invalid_grant", "error_description": "Token is not active"})
+        else:
+            return self._reply(400, {"error": "unsupported_grant_type"})
+        self.server.token_requests += 1
+        access, refresh = uuid.uuid4().hex, uuid.uuid4().hex
+        state.tokens.add(access)
+        state.refresh_tokens.add(refresh)
+        self._reply(200, {
+            "access_token": access,
+            "expires_in": state.token_lifetime,
+            "refresh_token": refresh,
+            "refresh_expires_in": state.token_lifetime * 30,
+            "token_type": "Bearer",
+        })
+
+    def _page(self, items, query):
+        first = int(query.get("first", 0))
+        size = int(query.get("max", len(items) or 1))
+        return self._reply(200, items[first:first + size])
+
+    def _admin(self, method, route, query, data):
+        state = self.server.state
+
+        def group_repr(gid):
+            g = state.groups[gid]
+            return {"id": gid, "name": g["name"], "path": g["path"], "subGroupCount": sum(
+                1 for x in state.groups.values() if x["parent"] == gid
+            )}
+
+        def create_group(parent):
+            parent_path = state.groups[parent]["path"] if parent else ""
+            path = f"{parent_path}/{data['name']}"
+            if any(g["path"] == path for g in state.groups.values()):
+                return self._reply(409, {"errorMessage": "Top level group named already exists."})
+            gid = uuid.uuid4().hex
+            state.groups[gid] = {"name": data["name"], "path": path, "parent": parent}
+            return self._created(gid)
+
+        if route == "":
+            if method == "GET":
+                return self._reply(200, state.realm)
+            state.realm.update(data)
+            return self._reply(204)
+
+        if route == "/groups":
+            if method == "GET":
+                return self._page([group_repr(gid) for gid, g in state.groups.items() if g["parent"] is None], query)
+            return create_group(None)
+        if m := re.fullmatch(r"/groups/([^/]+)/children", route):
+            if m.group(1) not in state.groups:
+                return self._reply(404, {"error": "Could not find group by id"})
+            if method == "GET":
+                return self._page([group_repr(gid) for gid, g in state.groups.items() if g["parent"] == m.group(1)], query)
+            return create_group(m.group(1))
+        if route.startswith("/group-by-path/"):
+            path = route[len("/group-by-path"):]
+            gid = next((gid for gid, g in state.groups.items() if g["path"] == path), None)
+            return self._reply(200, group_repr(gid)) if gid else self._reply(404, {"error": "Group path does not exist"})
+
+        if route == "/client-scopes":
+            if method == "GET":
+                return self._reply(200, list(state.client_scopes.values()))
+            if any(cs["name"] == data["name"] for cs in state.client_scopes.values()):
+                return self._reply(409, {"errorMessage": "Client Scope already exists"})
+            sid = uuid.uuid4().hex
+            state.client_scopes[sid] = {**data, "id": sid}
+            return self._created(sid)
+        if route == "/default-optional-client-scopes":
+            return self._reply(200, [{"id": sid, "name": state.client_scopes[sid]["name"]} for sid in state.optional_client_scopes])
+        if m := re.fullmatch(r"/default-optional-client-scopes/([^/]+)", route):
+            if m.group(1) not in state.optional_client_scopes:
+                state.optional_client_scopes.append(m.group(1))
+            return self._reply(204)
+
+        if route == "/clients":
+            if method == "GET":
+                clients = list(state.clients.values())
+                if "clientId" in query:
+                    clients = [c for c in clients if c["clientId"] == query["clientId"]]
+                return self._reply(200, clients)
+            if any(c["clientId"] == data["clientId"] for c in state.clients.values()):
+                return self._reply(409, {"errorMessage": f"Client {data['clientId']} already exists"})
+            cid = uuid.uuid4().hex
+            state.clients[cid] = {**data, "id": cid}
+            if data.get("serviceAccountsEnabled"):
+                state.service_accounts[cid] = {"id": uuid.uuid4().hex, "username": f"service-account-{data['clientId']}"}
+            return self._created(cid)
+        if m := re.fullmatch(r"/clients/([^/]+)(/.*)?", route):
+            cid, sub = m.group(1), m.group(2) or ""
+            if cid not in state.clients:
+                return self._reply(404, {"error": "Could not find client"})
+            if sub == "":
+                if method == "GET":
+                    return self._reply(200, state.clients[cid])
+                state.clients[cid].update(data)
+                return self._reply(204)
+            if sub == "/authz/resource-server/settings":
+                return self._reply(200, state.authz[cid])
+            if sub == "/authz/resource-server/resource":
+                state.authz[cid]["resources"].append({**data, "_id": uuid.uuid4().hex})
+                return self._reply(201, state.authz[cid]["resources"][-1])
+            if sub.startswith("/authz/resource-server/policy") or sub.startswith("/authz/resource-server/permission"):
+                state.authz[cid]["policies"].append({**data, "id": uuid.uuid4().hex})
+                return self._reply(201, state.authz[cid]["policies"][-1])
+            if sub == "/service-account-user":
+                user = state.service_accounts.get(cid)
+                return self._reply(200, user) if user else self._reply(400, {"error": "Service account not enabled"})
+            if sub == "/roles":
+                if method == "GET":
+                    return self._reply(200, list(state.client_roles[cid].values()))
+                if data["name"] in state.client_roles[cid]:
+                    return self._reply(409, {"errorMessage": f"Role with name {data['name']} already exists"})
+                state.client_roles[cid][data["name"]] = {**data, "id": uuid.uuid4().hex, "clientRole": True}
+                return self._reply(201, headers={"Location": f"{self.server.url}{self.path}/{data['name']}"})
+            if sub.startswith("/roles/"):
+                role = state.client_roles[cid].get(sub[len("/roles/"):])
+                return self._reply(200, role) if role else self._reply(404, {"error": "Could not find role"})
+        if m := re.fullmatch(r"/users/([^/]+)/role-mappings/clients/([^/]+)", route):
+            mappings = state.role_mappings[(m.group(1), m.group(2))]
+            if method == "GET":
+                return self._reply(200, mappings)
+            mappings.extend(r for r in data if r not in mappings)
+            return self._reply(204)
+        return self._reply(404, {"error": f"fake keycloak does not implement {method} {route}"})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state: _State):
+        super().__init__(address, _Handler)
+        self.state = state
+        self.url = f"http://{self.server_address[0]}:{self.server_address[1]}"
+        self.counter_lock = threading.Lock()
+        self.connections = 0
+        self.token_requests = 0
+        self.requests = collections.Counter()
+
+    def process_request(self, request, client_address):
+        with self.counter_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def count(self, method: str, path: str):
+        with self.counter_lock:
+            self.requests[f"{method} {re.sub(r'[0-9a-f]{32}', '{id}', path)}"] += 1
+
+
+class FakeKeycloak:
+    """Threaded fake Keycloak server on localhost, usable as a context manager."""
+
+    def __init__(self, username: str = "admin", password: str = "admin", token_lifetime: int = 60, port: int = 0):
+        self._server = _Server(("127.0.0.1", port), _State(username, password, token_lifetime))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return self._server.url + "/"
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    @property
+    def token_requests(self) -> int:
+        return self._server.token_requests
+
+    @property
+    def requests(self) -> collections.Counter:
+        return self._server.requests
+
+    def reset_counters(self):
+        with self._server.counter_lock:
+            self._server.connections = 0
+            self._server.token_requests = 0
+            self._server.requests.clear()
+
+    def start(self) -> "FakeKeycloak":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token-lifetime", type=int, default=60)
+    args = parser.parse_args()
+    server = FakeKeycloak(token_lifetime=args.token_lifetime, port=args.port)
+    print(f"Fake Keycloak listening on {server.url}")
+    server._server.serve_forever()
@@ -0,0 +1,335 @@
+"""Offline load and scaling benchmark of the data product manager.
+
+    python -m bench.suite --sizes 100,10000,100000 --output results.json
+    python -m bench.suite --save-baseline      # record bench/baseline.json
+    python -m bench.suite                      # compare against it
+
+For each registry size, a fresh process seeds a LocalDB in a temporary
+directory, then drives `GET /data-product` and `POST /data-product`
+concurrently through the ASGI app (no server, no network), after measuring
+the cold load and memory per product of the registry snapshot and the time
+of a full export. Separate processes fork repositories from a synthetic
+template with CodeRepository and run `/keycloak/bootstrap-master` against
+bench.fake_keycloak. Every scenario reports throughput, p50/p99 latency and
+the peak RSS of its process.
+
+With a baseline, a scenario regresses when its p99 latency, peak memory or
+memory per product grows, or its throughput drops, by more than
+`--tolerance`; the suite then exits with status 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DOMAINS = [f"domain_{i}" for i in range(20)]
+FLAGS = ["code_repository", "keycloak_group", "keycloak_domain_group", "keycloak_product_group", "trino_dev_catalog", "trino_prd_catalog"]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(scenario: str, size: Optional[int], latencies: List[float], elapsed: float, concurrency: int, **extra) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "scenario": scenario,
+        "size": size,
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+
+
+def make_template(root: str, files: int = 200, size: int = 4096):
+    template = os.path.join(root, "_template")
+    payload = os.urandom(size)
+    for i in range(files):
+        path = os.path.join(template, "dbt", "models", f"group_{i % 10}", f"model_{i}.sql")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(payload)
+        path = os.path.join(template, "dbt", "target", f"file_{i}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(payload)
+    with open(os.path.join(template, "dbt", ".gitignore"), "w") as f:
+        f.write("target/\ndbt_packages/\nlogs/\n")
+
+
+def prepare_workdir(workdir: str):
+    """Point the app at `workdir` before it is imported: store, repositories and catalogs."""
+    repos = os.path.join(workdir, "repos")
+    make_template(repos)
+    os.environ["CODE_REPOSITORY_URL"] = repos
+    os.environ["TRINO_CATALOG_DIR"] = os.path.join(workdir, "catalogs")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(workdir)
+    import logging
+    logging.basicConfig(level=os.environ["LOG_LEVEL"])
+
+
+async def drive(request: Callable[[int], Awaitable[Any]], requests: int, concurrency: int):
+    latencies: List[float] = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with slots:
+            start = time.perf_counter()
+            await request(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, time.perf_counter() - start
+
+
+def run_snapshot(size: int) -> Dict[str, Any]:
+    """Cold load time and memory per product of the registry snapshot, and export time without and with cached encodings."""
+    import tracemalloc
+    from data_product_manager import service
+    from data_product_manager.db import LocalDB, SNAPSHOTS
+
+    db = LocalDB()
+    start = time.perf_counter()
+    db.snapshot()
+    load_s = time.perf_counter() - start
+    SNAPSHOTS.invalidate(db.path)
+    tracemalloc.start()
+    db.snapshot()
+    snapshot_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    export_s = []
+    for _ in range(2):
+        start = time.perf_counter()
+        _, _, chunks = service.export_data_products()
+        for _ in chunks:
+            pass
+        export_s.append(round(time.perf_counter() - start, 3))
+    # leave the first listing of the registry scenario a cold one
+    SNAPSHOTS.invalidate(db.path)
+    return {
+        "scenario": "snapshot",
+        "size": size,
+        "duration_s": round(load_s, 3),
+        "throughput_rps": round(size / load_s, 1),
+        "bytes_per_product": round(snapshot_bytes / max(size, 1)),
+        "export_cold_s": export_s[0],
+        "export_warm_s": export_s[1],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_registry(size: int, requests: int, concurrency: int) -> List[Dict[str, Any]]:
+    import httpx
+    from data_product_manager.db import LocalDB, DataProductState
+    from data_product_manager.api import app, PROVISIONING
+
+    rng = random.Random(size)
+    results = []
+
+    start = time.perf_counter()
+    with LocalDB() as db:
+        for i in range(size):
+            db.insert(DataProductState(
+                name=f"product_{i:06d}",
+                domain=DOMAINS[i % len(DOMAINS)],
+                description=f"Seeded data product {i}",
+                admin_emails=[f"owner_{i % 50}@example.com"],
+                **{flag: rng.random() < 0.5 for flag in FLAGS},
+            ))
+    seed_s = time.perf_counter() - start
+    results.append({"scenario": "seed", "size": size, "duration_s": round(seed_s, 3), "throughput_rps": round(size / seed_s, 1), "peak_rss_mb": peak_rss_mb()})
+    results.append(run_snapshot(size))
+
+    async def scenarios():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            async def list_page(i: int):
+                params = {"limit": 100, "domain": DOMAINS[i % len(DOMAINS)]}
+                if i % 3 == 0:
+                    params[FLAGS[i % len(FLAGS)]] = "true"
+                if i % 5 == 0:
+                    params["cursor"] = f"product_{rng.randrange(size):06d}"
+                response = await client.get("/data-product", params=params)
+                assert response.status_code == 200, response.text
+
+            async def create(i: int):
+                response = await client.post("/data-product", json={
+                    "domain": DOMAINS[i % len(DOMAINS)],
+                    "name": f"bench_{i:06d}",
+                    "description": f"Benchmark data product {i}",
+                    "admin_emails": ["bench@example.com"],
+                })
+                assert response.status_code == 202, response.text
+
+            start = time.perf_counter()
+            await list_page(0)
+            results[0]["first_list_s"] = round(time.perf_counter() - start, 3)
+            results.append(summarize("list", size, *await drive(list_page, requests, concurrency), concurrency))
+            latencies, elapsed = await drive(create, requests, concurrency)
+            start = time.perf_counter()
+            PROVISIONING.join()
+            PROVISIONING.shutdown(wait=True)
+            results.append(summarize("create", size, latencies, elapsed, concurrency, provisioning_drain_s=round(time.perf_counter() - start, 3)))
+
+    asyncio.run(scenarios())
+    return results
+
+
+def run_fork(requests: int, concurrency: int) -> List[Dict[str, Any]]:
+    from data_product_manager.componants.code_repository import CodeRepository
+
+    latencies = []
+    with CodeRepository(url=os.environ["CODE_REPOSITORY_URL"]) as code_repo:
+        def fork(i: int):
+            start = time.perf_counter()
+            code_repo.create_repository(name=f"dp-bench_{i}", description="benchmark", fork="_template")
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(fork, range(requests)))
+        elapsed = time.perf_counter() - start
+    return [summarize("fork", None, latencies, elapsed, concurrency)]
+
+
+def run_bootstrap(requests: int) -> List[Dict[str, Any]]:
+    import httpx
+    from bench.fake_keycloak import FakeKeycloak
+    from data_product_manager.api import app
+
+    async def bootstrap():
+        with FakeKeycloak() as kc:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+                async def one(i: int):
+                    response = await client.post("/keycloak/bootstrap-master", json={"keycloak_base_url": kc.url, "verify_tls": False})
+                    assert response.status_code in (200, 204), response.text
+
+                start = time.perf_counter()
+                await one(0)
+                cold_ms = round((time.perf_counter() - start) * 1000, 3)
+                latencies, elapsed = await drive(one, requests, 1)
+                return summarize("bootstrap", None, latencies, elapsed, 1, cold_ms=cold_ms, keycloak_requests=sum(kc.requests.values()))
+
+    return [asyncio.run(bootstrap())]
+
+
+def run_worker(args) -> List[Dict[str, Any]]:
+    with tempfile.TemporaryDirectory(prefix="dpm-bench-") as workdir:
+        prepare_workdir(workdir)
+        if args.worker == "registry":
+            return run_registry(args.size, args.requests, args.concurrency)
+        if args.worker == "fork":
+            return run_fork(args.fork_requests, args.concurrency)
+        return run_bootstrap(args.bootstrap_requests)
+
+
+def spawn(worker: str, args, size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Run one worker in a fresh process, so each gets its own store, caches and peak RSS."""
+    command = [
+        sys.executable, "-m", "bench.suite", "--worker", worker,
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--fork-requests", str(args.fork_requests), "--bootstrap-requests", str(args.bootstrap_requests),
+    ]
+    if size is not None:
+        command += ["--size", str(size)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))}
+    done = subprocess.run(command, cwd=root, env=env, check=True, stdout=subprocess.PIPE, text=True)
+    results = json.loads(done.stdout)
+    for result in results:
+        print(json.dumps(result), file=sys.stderr)
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    previous = {(r["scenario"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = previous.get((result["scenario"], result["size"]))
+        if base is None:
+            continue
+        label = f"{result['scenario']}[{result['size']}]" if result["size"] is not None else result["scenario"]
+        for key in ("p99_ms", "peak_rss_mb", "bytes_per_product"):
+            if key in base and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{label}: {key} {base[key]} -> {result[key]}")
+        if "throughput_rps" in base and result["throughput_rps"] < base["throughput_rps"] / (1 + tolerance):
+            regressions.append(f"{label}: throughput_rps {base['throughput_rps']} -> {result['throughput_rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000", help="comma separated registry sizes")
+    parser.add_argument("--requests", type=int, default=500, help="requests per list/create scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fork-requests", type=int, default=50)
+    parser.add_argument("--bootstrap-requests", type=int, default=20)
+    parser.add_argument("--output", help="write the results JSON to this file instead of stdout")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--worker", choices=["registry", "fork", "bootstrap"], help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results += spawn("registry", args, size)
+    results += spawn("fork", args)
+    results += spawn("bootstrap", args)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("worker", "size", "output", "baseline", "save_baseline")},
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
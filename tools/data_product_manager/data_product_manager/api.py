@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import time
+import logging
+import inspect
+import builtins
+import contextlib
+from enum import Enum
+from typing import List, Annotated, Dict, Any, Iterable, Literal, Optional
+
+import fastapi
+import pydantic
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from data_product_manager import metrics, profiling, service
+from data_product_manager.db import SNAPSHOTS, ChangesExpiredError
+from data_product_manager.provisioning import ProvisioningRunner, Reconciler
+from data_product_manager.service import (
+    DataProductCreateData,
+    DataProductBatchCreateData,
+    DataProductListQuery,
+    KeycloakMasterBootstrapData,
+)
+
+logger = logging.getLogger("app.api")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    # resolve the config directory now, a missing one fails the startup instead of requests
+    service.trino_catalogs()
+    service.opa_bundle()
+    PROVISIONING.resume()
+    if RECONCILE_INTERVAL > 0:
+        RECONCILER.start(RECONCILE_INTERVAL)
+    yield
+    RECONCILER.stop()
+    PROVISIONING.shutdown()
+
+
+class ProfiledRoute(fastapi.routing.APIRoute):
+    """Route whose endpoint is sampled by the profiler of its request, if any.
+
+    A sync endpoint is sampled on its threadpool thread, an async one on the
+    event loop thread, which the samples of other requests may contaminate.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = profiling.profiled_async(endpoint)
+        else:
+            endpoint = profiling.profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+app = fastapi.FastAPI(lifespan=lifespan)
+app.router.route_class = ProfiledRoute
+
+
+@app.middleware("http")
+async def wrap_exceptions(request: fastapi.Request, call_next):
+    try:
+        response = await call_next(request)
+        return response
+    except fastapi.HTTPException as exc:
+        logger.error("HTTPException: %s", exc.detail)
+        raise exc
+    except ValueError as exc:
+        logger.error("ValueError: %s", exc)
+        raise fastapi.HTTPException(status_code=400, detail=str(exc))
+    except Exception as exc:
+        logger.error("Unhandled Exception: %s", exc)
+        raise fastapi.HTTPException(status_code=500, detail="Internal Server Error") from exc
+
+
+@app.middleware("http")
+async def record_metrics(request: fastapi.Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    except fastapi.HTTPException as exc:
+        status = exc.status_code
+        raise exc
+    finally:
+        # label by route template, not by raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        labels = {
+            "method": request.method,
+            "route": route.path if route is not None else "unmatched",
+            "status": str(status),
+        }
+        metrics.HTTP_REQUESTS.inc(**labels)
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, **labels)
+
+
+@app.middleware("http")
+async def profile_requests(request: fastapi.Request, call_next):
+    token = request.headers.get("x-profile", request.query_params.get("profile"))
+    if not profiling.requested(token) or not profiling.acquire():
+        return await call_next(request)
+    try:
+        with profiling.SamplingProfiler() as profiler:
+            response = await call_next(request)
+        # a streamed body is sent after this point and is not part of the profile
+        route = request.scope.get("route")
+        path = route.path if route is not None else request.url.path
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request.method}-{path.strip('/').replace('/', '_') or 'root'}-{os.urandom(3).hex()}"
+        written = await run_in_threadpool(profiler.write, name)
+    finally:
+        profiling.release()
+    response.headers["X-Profile-File"] = os.path.basename(written)
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def _metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return fastapi.Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+PROVISIONING = ProvisioningRunner(
+    steps=service.provisioning_steps(),
+    max_workers=int(os.environ.get("PROVISIONING_WORKERS", "8")),
+    per_domain=int(os.environ.get("PROVISIONING_PER_DOMAIN", "2")),
+)
+RECONCILER = Reconciler(PROVISIONING, max_workers=int(os.environ.get("RECONCILE_WORKERS", "8")))
+RECONCILE_INTERVAL = float(os.environ.get("RECONCILE_INTERVAL", "0"))
+
+
+@app.post("/data-product", status_code=202)
+def _create(data: DataProductCreateData):
+    """Register a new data product and provision it in the background."""
+    try:
+        job, coalesced = service.create_data_product(PROVISIONING, data)
+    except KeyError:
+        detail={
+            "error": f"data product already exists",
+            "data_product": data.name,
+        }
+        logger.error(detail)
+        raise fastapi.HTTPException(status_code=400, detail=detail)
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "coalesced": coalesced,
+        "status_url": f"/data-product/jobs/{job.id}",
+    }
+
+
+@app.post("/reconcile")
+def _reconcile():
+    """Run a reconciliation pass now and return its report."""
+    return RECONCILER.reconcile()
+
+
+@app.get("/reconcile")
+def _reconcile_report():
+    """Report of the last reconciliation pass."""
+    if RECONCILER.last_report is None:
+        raise fastapi.HTTPException(status_code=404, detail={"error": "no reconciliation pass yet"})
+    return RECONCILER.last_report
+
+
+@app.get("/data-product/jobs/{job_id}")
+def _job_status(job_id: str):
+    """Status and step progress of a provisioning job."""
+    found = PROVISIONING.get(job_id)
+    if found is None:
+        raise fastapi.HTTPException(status_code=404, detail={"error": "job not found", "job_id": job_id})
+    job, dp = found
+    return {
+        **job.model_dump(),
+        "steps": PROVISIONING.progress(dp),
+    }
+
+
+@app.get("/data-product/{name}/models")
+def _models(name: str):
+    """Models, seeds and sources of the dbt project of a data product, read from the dbt index."""
+    found = service.dbt_models(name)
+    if found is None:
+        raise fastapi.HTTPException(status_code=404, detail={"error": "dbt project not found", "name": name})
+    return found
+
+
+@app.get("/data-product/{name}/models/{model}/lineage")
+def _lineage(
+    name: str,
+    model: str,
+    direction: Annotated[Literal["upstream", "downstream", "both"], fastapi.Query()] = "both",
+    depth: Annotated[Optional[int], fastapi.Query(ge=1)] = None,
+):
+    """
+    Models, seeds and sources `model` depends on (upstream) and/or that
+    depend on it (downstream), up to `depth` hops. A versioned model is
+    resolved to its latest version unless named as `<model>.v<version>`.
+    """
+    found = service.dbt_lineage(name, model, direction=direction, depth=depth)
+    if found is None:
+        raise fastapi.HTTPException(status_code=404, detail={"error": "model not found", "name": name, "model": model})
+    return found
+
+
+@app.post("/data-product/batch")
+def _create_batch(data: DataProductBatchCreateData):
+    """
+    Validate and queue the provisioning of many data products at once.
+    Items fail independently: the response reports the outcome, and the
+    job, of each one.
+    """
+    return service.create_data_products(PROVISIONING, data)
+
+
+@app.get("/data-product/export")
+def _export(batch_size: Annotated[int, fastapi.Query(ge=1, le=10000)] = service.TRANSFER_BATCH_SIZE):
+    """
+    Stream every data product as NDJSON, one DataProductState per line,
+    from a consistent state of the registry. The exported registry version
+    is returned in the X-Registry-Version header, the last change included
+    in X-Changes-Seq: follow `/changes?since=<X-Changes-Seq>` from there.
+    """
+    version, seq, chunks = service.export_data_products(batch_size=batch_size)
+    return StreamingResponse(
+        iterate_in_threadpool(chunks),
+        media_type="application/x-ndjson",
+        headers={"X-Registry-Version": str(version), "X-Changes-Seq": str(seq)},
+    )
+
+
+@app.post("/data-product/import")
+async def _import(request: fastapi.Request, batch_size: Annotated[int, fastapi.Query(ge=1, le=10000)] = service.TRANSFER_BATCH_SIZE):
+    """
+    Insert or overwrite data products from an NDJSON body, as produced by
+    the export. Lines are validated and written in batches as the body
+    streams in; invalid lines are skipped and reported.
+    """
+    importer = service.DataProductImporter(batch_size=batch_size)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(importer.feed, chunk)
+    finally:
+        report = await run_in_threadpool(importer.close)
+    return report
+
+
+@app.get("/changes")
+def _changes(
+    since: Annotated[int, fastapi.Query(ge=0)] = 0,
+    limit: Annotated[int, fastapi.Query(ge=1, le=1000)] = 1000,
+    wait: Annotated[float, fastapi.Query(ge=0, le=service.MAX_CHANGES_WAIT)] = 0,
+):
+    """
+    Inserts and updates of data products after sequence number `since`,
+    oldest first. With `wait`, hold the request up to that many seconds
+    until a change arrives. Answers 410 when changes after `since` are no
+    longer retained: bootstrap again from `/data-product/export`.
+    """
+    try:
+        changes, last = service.read_changes(since=since, limit=limit, wait=wait)
+    except ChangesExpiredError as exc:
+        raise fastapi.HTTPException(status_code=410, detail={"error": str(exc), "oldest_seq": exc.oldest})
+    return {
+        "changes": changes,
+        "next_since": changes[-1].seq if changes else since,
+        "last_seq": last,
+    }
+
+
+@app.post("/trino/catalogs")
+def _generate_trino_catalogs(prune: bool = False):
+    """
+    Generate the dev and prd Trino catalogs of every data product, only
+    rewriting the ones that changed. With `prune`, remove the catalogs of
+    data products that no longer exist.
+    """
+    return service.generate_trino_catalogs(prune=prune)
+
+
+@app.get("/data-product")
+def _list(
+    query: Annotated[DataProductListQuery, fastapi.Query()],
+    request: fastapi.Request,
+    response: fastapi.Response,
+):
+    """List data products, filtered by domain and state flags, one page at a time."""
+    logger.info("Listing data products.")
+    version, names, next_cursor = service.list_data_products(query)
+    etag = f'W/"{version}"'
+    if request.headers.get("if-none-match") == etag:
+        return fastapi.Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return {
+        "data_products": names,
+        "next_cursor": next_cursor,
+    }
+
+
+@app.get("/opa/bundle.tar.gz")
+def _opa_bundle(request: fastapi.Request):
+    """
+    OPA bundle of the Trino policies and the row filters and column masks
+    of every data product. The ETag is the bundle revision: OPA's polling
+    gets a 304 until a policy input changes.
+    """
+    service.build_opa_bundle()
+    revision, content = service.opa_bundle().current()
+    etag = f'"{revision}"'
+    if request.headers.get("if-none-match") == etag:
+        return fastapi.Response(status_code=304, headers={"ETag": etag})
+    return fastapi.Response(content=content, media_type="application/gzip", headers={"ETag": etag})
+
+
+@app.get("/cache/stats")
+def _cache_stats():
+    """Hit/miss counters of the shared registry snapshot."""
+    return SNAPSHOTS.stats()
+
+
+@app.post("/keycloak/bootstrap-master")
+def _bootstrap_keycloak_master(data: KeycloakMasterBootstrapData) -> Dict[str, Any]:
+    """
+    Read the realm state once, plan the missing changes and apply them.
+    With `dry_run`, return the plan instead of applying it.
+    """
+    summary = service.bootstrap_keycloak_master(data)
+    if data.dry_run:
+        return summary
+    return fastapi.Response(status_code=204)
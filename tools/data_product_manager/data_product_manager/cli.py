@@ -0,0 +1,364 @@
+"""`dpm`: run data product manager operations without the HTTP API.
+
+    dpm list --domain sales --code-repository false
+    dpm create --domain sales --name orders --description "Orders of the web shop" --admin-email me@example.com
+    dpm batch products.json
+    dpm export -o registry.ndjson
+    dpm import registry.ndjson
+    dpm changes --since 42 --follow
+    dpm seeds orders --env dev --catalog-db sqlite:///catalog.sqlite
+    dpm models orders
+    dpm lineage orders fct_orders --direction upstream --depth 2
+    dpm ingest airbyte/messages.jsonl --catalog airbyte/catalog.json --output ./airbyte_output
+    dpm catalogs --prune
+    dpm opa-bundle -o bundle.tar.gz
+    dpm reconcile
+    dpm bootstrap-keycloak --keycloak-base-url http://localhost:8081/ --dry-run
+
+Modules are imported by the command that needs them: `list` only loads the
+store, python-keycloak is only imported by `bootstrap-keycloak` and pyarrow
+by `seeds` and `ingest`.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+
+FLAGS = ["code_repository", "keycloak_group", "keycloak_domain_group", "keycloak_product_group", "trino_dev_catalog", "trino_prd_catalog"]
+
+
+def _print(value):
+    print(json.dumps(value, indent=2, default=str))
+
+
+def _validate(model, **values):
+    import pydantic
+    try:
+        return model(**values)
+    except pydantic.ValidationError as exc:
+        sys.exit(f"dpm: invalid arguments:\n{exc}")
+
+
+def _list(args) -> int:
+    from data_product_manager.service import DataProductListQuery, list_data_products
+
+    query = _validate(
+        DataProductListQuery,
+        domain=args.domain,
+        cursor=args.cursor,
+        limit=args.limit,
+        **{flag: getattr(args, flag) for flag in FLAGS},
+    )
+    while True:
+        _, names, next_cursor = list_data_products(query, use_snapshot=False)
+        for name in names:
+            print(name)
+        if not args.all or next_cursor is None:
+            break
+        query.cursor = next_cursor
+    if next_cursor is not None:
+        print(f"next cursor: {next_cursor}", file=sys.stderr)
+    return 0
+
+
+def _create(args) -> int:
+    from data_product_manager import service
+    from data_product_manager.provisioning import ProvisioningRunner
+
+    data = _validate(
+        service.DataProductCreateData,
+        domain=args.domain,
+        name=args.name,
+        description=args.description,
+        admin_emails=args.admin_email,
+    )
+    runner = ProvisioningRunner(steps=service.provisioning_steps(), max_workers=1)
+    try:
+        job, _ = service.create_data_product(runner, data)
+    except KeyError:
+        sys.exit(f"dpm: data product {data.name} already exists")
+    runner.join()
+    runner.shutdown()
+    job, dp = runner.get(job.id)
+    _print({**job.model_dump(), "steps": runner.progress(dp)})
+    return 0 if job.status == "succeeded" else 1
+
+
+def _batch(args) -> int:
+    from data_product_manager import service
+    from data_product_manager.provisioning import ProvisioningRunner
+
+    with (sys.stdin if args.file == "-" else open(args.file, "r")) as f:
+        payload = json.load(f)
+    if isinstance(payload, list):
+        payload = {"data_products": payload}
+    runner = ProvisioningRunner(steps=service.provisioning_steps())
+    report = service.create_data_products(runner, _validate(service.DataProductBatchCreateData, **payload))
+    runner.join()
+    runner.shutdown()
+    for result in report["results"]:
+        if "job_id" in result:
+            job, _ = runner.get(result["job_id"])
+            result.update(status=job.status, step=job.step, error=job.error)
+    _print(report)
+    return 0 if all(result["status"] == "succeeded" for result in report["results"]) else 1
+
+
+def _export(args) -> int:
+    from data_product_manager import service
+
+    version, seq, chunks = service.export_data_products()
+    with (sys.stdout.buffer if args.output in (None, "-") else open(args.output, "wb")) as f:
+        for chunk in chunks:
+            f.write(chunk)
+    print(f"exported registry version {version}, changes up to {seq}", file=sys.stderr)
+    return 0
+
+
+def _changes(args) -> int:
+    from data_product_manager import service
+    from data_product_manager.db import ChangesExpiredError
+
+    since = args.since
+    while True:
+        try:
+            changes, _ = service.read_changes(since=since, wait=service.MAX_CHANGES_WAIT if args.follow else 0)
+        except ChangesExpiredError as exc:
+            sys.exit(f"dpm: {exc}")
+        for change in changes:
+            print(change.model_dump_json(), flush=True)
+        if changes:
+            since = changes[-1].seq
+        elif not args.follow:
+            return 0
+
+
+def _import(args) -> int:
+    from data_product_manager import service
+
+    importer = service.DataProductImporter()
+    with (sys.stdin.buffer if args.file == "-" else open(args.file, "rb")) as f:
+        try:
+            while chunk := f.read(64 * 1024):
+                importer.feed(chunk)
+        finally:
+            report = importer.close()
+    _print(report)
+    return 0 if report["invalid"] == 0 else 1
+
+
+def _seeds(args) -> int:
+    from data_product_manager import service
+
+    try:
+        _print(service.load_seeds(args.name, env=args.env, namespace=args.namespace, seeds=args.seed, catalog_db=args.catalog_db))
+    except KeyError:
+        sys.exit(f"dpm: data product {args.name} not found")
+    except ImportError as exc:
+        sys.exit(f"dpm: {exc}")
+    return 0
+
+
+def _models(args) -> int:
+    from data_product_manager import service
+
+    found = service.dbt_models(args.name)
+    if found is None:
+        sys.exit(f"dpm: no dbt project for data product {args.name}")
+    _print(found)
+    return 0
+
+
+def _lineage(args) -> int:
+    from data_product_manager import service
+
+    found = service.dbt_lineage(args.name, args.model, direction=args.direction, depth=args.depth)
+    if found is None:
+        sys.exit(f"dpm: model {args.model} not found in data product {args.name}")
+    _print(found)
+    return 0
+
+
+def _ingest(args) -> int:
+    from data_product_manager import service
+
+    try:
+        with (open(args.file, "rb") if args.file != "-" else sys.stdin.buffer) as f:
+            report = service.ingest_airbyte(
+                f, args.catalog, args.output,
+                batch_rows=args.batch_rows,
+                batch_seconds=args.batch_seconds,
+                state_output=sys.stdout if args.emit_state else None,
+            )
+    except ImportError as exc:
+        sys.exit(f"dpm: {exc}")
+    print(json.dumps(report, indent=2), file=sys.stderr if args.emit_state else sys.stdout)
+    return 0
+
+
+def _catalogs(args) -> int:
+    from data_product_manager import service
+
+    _print(service.generate_trino_catalogs(prune=args.prune))
+    return 0
+
+
+def _opa_bundle(args) -> int:
+    from data_product_manager import service
+
+    report = service.build_opa_bundle()
+    with open(args.output, "wb") as f:
+        f.write(service.opa_bundle().current()[1])
+    _print(report)
+    return 0
+
+
+def _reconcile(args) -> int:
+    from data_product_manager import service
+    from data_product_manager.provisioning import ProvisioningRunner, Reconciler
+
+    report = Reconciler(ProvisioningRunner(steps=service.provisioning_steps())).reconcile()
+    _print(report)
+    return 0 if not report["failed"] else 1
+
+
+def _bootstrap_keycloak(args) -> int:
+    from data_product_manager import service
+
+    values = {
+        "keycloak_base_url": args.keycloak_base_url,
+        "admin_username": args.admin_username,
+        "admin_password": args.admin_password,
+        "master_realm": args.master_realm,
+        "trino_client_secret": args.trino_client_secret,
+        "trino_redirect_uris": args.trino_redirect_uri,
+        "trino_post_logout_uris": args.trino_post_logout_uris,
+    }
+    data = _validate(
+        service.KeycloakMasterBootstrapData,
+        verify_tls=not args.no_verify_tls,
+        dry_run=args.dry_run,
+        **{k: v for k, v in values.items() if v is not None},
+    )
+    _print(service.bootstrap_keycloak_master(data))
+    return 0
+
+
+def _bool(value: str) -> bool:
+    if value.lower() in ("true", "1", "yes"):
+        return True
+    if value.lower() in ("false", "0", "no"):
+        return False
+    raise argparse.ArgumentTypeError(f"expected true or false, got {value!r}")
+
+
+def parser() -> argparse.ArgumentParser:
+    root = argparse.ArgumentParser(prog="dpm", description=__doc__.splitlines()[0])
+    root.add_argument("-v", "--verbose", action="store_true", help="log INFO messages (LOG_LEVEL overrides)")
+    root.add_argument("--config-dir", help="config/ directory of the repository (CONFIG_DIR, ./config by default)")
+    root.add_argument("--repo-url", help="code repository of the data products (CODE_REPOSITORY_URL, ./data_products by default)")
+    commands = root.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("list", help="list data product names")
+    cmd.add_argument("--domain")
+    for flag in FLAGS:
+        cmd.add_argument(f"--{flag.replace('_', '-')}", dest=flag, type=_bool, metavar="{true,false}")
+    cmd.add_argument("--cursor")
+    cmd.add_argument("--limit", type=int, default=100)
+    cmd.add_argument("--all", action="store_true", help="follow cursors until the last page")
+    cmd.set_defaults(run=_list)
+
+    cmd = commands.add_parser("create", help="create a data product and provision it")
+    cmd.add_argument("--domain", required=True)
+    cmd.add_argument("--name", required=True)
+    cmd.add_argument("--description", required=True)
+    cmd.add_argument("--admin-email", action="append", required=True)
+    cmd.set_defaults(run=_create)
+
+    cmd = commands.add_parser("batch", help="create the data products of a JSON file (- for stdin)")
+    cmd.add_argument("file")
+    cmd.set_defaults(run=_batch)
+
+    cmd = commands.add_parser("export", help="write every data product as NDJSON")
+    cmd.add_argument("-o", "--output", help="file to write, stdout by default")
+    cmd.set_defaults(run=_export)
+
+    cmd = commands.add_parser("import", help="insert or overwrite the data products of an NDJSON file (- for stdin)")
+    cmd.add_argument("file")
+    cmd.set_defaults(run=_import)
+
+    cmd = commands.add_parser("changes", help="print the change journal as NDJSON")
+    cmd.add_argument("--since", type=int, default=0, help="last sequence number already seen")
+    cmd.add_argument("--follow", action="store_true", help="keep waiting for new changes")
+    cmd.set_defaults(run=_changes)
+
+    cmd = commands.add_parser("seeds", help="load the seed CSVs of a data product as Iceberg tables")
+    cmd.add_argument("name")
+    cmd.add_argument("--env", choices=["dev", "prd"], default="dev")
+    cmd.add_argument("--namespace", default="dbt", help="Iceberg namespace (schema) of the tables")
+    cmd.add_argument("--seed", action="append", help="CSV file to load, all seeds of the product by default")
+    cmd.add_argument("--catalog-db", help="sqlite:///<path> or postgresql:// URL of the catalog database")
+    cmd.set_defaults(run=_seeds)
+
+    cmd = commands.add_parser("models", help="list the dbt models, seeds and sources of a data product")
+    cmd.add_argument("name")
+    cmd.set_defaults(run=_models)
+
+    cmd = commands.add_parser("lineage", help="print the lineage of a dbt model of a data product")
+    cmd.add_argument("name")
+    cmd.add_argument("model", help="model name, or <model>.v<version> for a given version")
+    cmd.add_argument("--direction", choices=["upstream", "downstream", "both"], default="both")
+    cmd.add_argument("--depth", type=int, help="maximum number of hops, unlimited by default")
+    cmd.set_defaults(run=_lineage)
+
+    cmd = commands.add_parser("ingest", help="write Airbyte protocol records of a file (- for stdin) as Parquet files")
+    cmd.add_argument("file")
+    cmd.add_argument("--catalog", required=True, help="configured catalog of the streams to write")
+    cmd.add_argument("--output", required=True, help="local directory or s3:// prefix")
+    cmd.add_argument("--batch-rows", type=int)
+    cmd.add_argument("--batch-seconds", type=float)
+    cmd.add_argument("--emit-state", action="store_true", help="print committed STATE messages to stdout, the report to stderr")
+    cmd.set_defaults(run=_ingest)
+
+    cmd = commands.add_parser("catalogs", help="generate the Trino catalogs of every data product")
+    cmd.add_argument("--prune", action="store_true")
+    cmd.set_defaults(run=_catalogs)
+
+    cmd = commands.add_parser("opa-bundle", help="write the OPA bundle of the Trino policies of every data product")
+    cmd.add_argument("-o", "--output", default="bundle.tar.gz")
+    cmd.set_defaults(run=_opa_bundle)
+
+    cmd = commands.add_parser("reconcile", help="run one reconciliation pass")
+    cmd.set_defaults(run=_reconcile)
+
+    cmd = commands.add_parser("bootstrap-keycloak", help="bootstrap the Keycloak master realm")
+    cmd.add_argument("--keycloak-base-url")
+    cmd.add_argument("--admin-username")
+    cmd.add_argument("--admin-password", default=os.environ.get("KEYCLOAK_ADMIN_PASSWORD"))
+    cmd.add_argument("--master-realm")
+    cmd.add_argument("--no-verify-tls", action="store_true")
+    cmd.add_argument("--trino-client-secret", default=os.environ.get("TRINO_CLIENT_SECRET"))
+    cmd.add_argument("--trino-redirect-uri", action="append")
+    cmd.add_argument("--trino-post-logout-uris")
+    cmd.add_argument("--dry-run", action="store_true")
+    cmd.set_defaults(run=_bootstrap_keycloak)
+    return root
+
+
+def main(argv=None) -> int:
+    args = parser().parse_args(argv)
+    if args.config_dir:
+        os.environ["CONFIG_DIR"] = args.config_dir
+    if args.repo_url:
+        os.environ["CODE_REPOSITORY_URL"] = args.repo_url
+    from data_product_manager.logging_config import configure_logging
+    configure_logging(level=os.environ.get("LOG_LEVEL", "INFO" if args.verbose else "WARNING"))
+    try:
+        return args.run(args)
+    except FileNotFoundError as exc:
+        sys.exit(f"dpm: {exc}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""Ingestion of Airbyte protocol messages into Parquet files, in place of a destination connector.
+
+Reads the JSON lines of an Airbyte source (`read` output, live or captured
+in a file), buffers the RECORD messages of the streams of the configured
+catalog into column batches and writes each batch as a Parquet file under
+`<location>/<stream>/`. A batch is flushed when it reaches `batch_rows`
+rows, `batch_bytes` bytes of column data or `batch_seconds` of age.
+
+On every STATE message, buffered records are flushed and the written files
+are committed with the state in `<location>/_checkpoint.json`: after a
+crash, files written since the last checkpoint are removed on the next run,
+and the checkpoint's state is the one to resume the source from. Streams
+synced in `overwrite` mode drop the files of the previous run once the new
+run has fully completed.
+
+A reader thread hands chunks of whole lines to the writer through a bounded
+queue, so a slow writer holds back the source instead of buffering the
+input in memory. Chunks are parsed by pyarrow's JSON reader against the
+catalog schemas; a chunk it cannot parse (a value not matching the schema,
+a line that is not JSON) goes through `json.loads` line by line instead.
+
+Needs pyarrow: pip install 'data-product-manager[ingest]'.
+"""
+import io
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, TextIO
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.fs as pa_fs
+    import pyarrow.json as pa_json
+    import pyarrow.parquet as pq
+except ImportError as exc:
+    raise ImportError("Airbyte ingestion needs pyarrow: pip install 'data-product-manager[ingest]'") from exc
+
+logger = logging.getLogger("app.components.airbyte_ingest")
+
+CHECKPOINT_NAME = "_checkpoint.json"
+READ_SIZE = 1024 * 1024
+QUEUE_SIZE = 16
+BATCH_ROWS = 100000
+BATCH_BYTES = 64 * 1024 * 1024
+BATCH_SECONDS = 5.0
+REPORT_INTERVAL = 10.0
+EMITTED_AT = "_airbyte_emitted_at"
+
+_END = object()
+
+
+def arrow_type(property_schema: Dict[str, Any]) -> pa.DataType:
+    """Arrow type of a JSON schema property; objects and arrays are kept as JSON strings."""
+    types = property_schema.get("type", "string")
+    types = [types] if isinstance(types, str) else [t for t in types if t != "null"]
+    kind = types[0] if len(types) == 1 else "string"
+    if kind == "integer" or property_schema.get("airbyte_type") == "integer":
+        return pa.int64()
+    if kind == "number":
+        return pa.float64()
+    if kind == "boolean":
+        return pa.bool_()
+    return pa.string()
+
+
+def stream_schemas(catalog: Dict[str, Any]) -> Dict[str, pa.Schema]:
+    """Arrow schema of every stream of a configured catalog, with the time each record was emitted."""
+    schemas = {}
+    for configured in catalog["streams"]:
+        stream = configured["stream"]
+        properties = stream.get("json_schema", {}).get("properties", {})
+        schemas[stream["name"]] = pa.schema(
+            [pa.field(name, arrow_type(prop)) for name, prop in properties.items()]
+            + [pa.field(EMITTED_AT, pa.timestamp("ms", tz="UTC"))]
+        )
+    return schemas
+
+
+def message_schema(schemas: Dict[str, pa.Schema]) -> Optional[pa.Schema]:
+    """Schema of RECORD messages of any of the streams, None if streams type the same property differently."""
+    properties: Dict[str, pa.DataType] = {}
+    for schema in schemas.values():
+        for field in schema:
+            if field.name != EMITTED_AT and properties.setdefault(field.name, field.type) != field.type:
+                return None
+    return pa.schema([
+        pa.field("type", pa.string()),
+        pa.field("record", pa.struct([
+            pa.field("stream", pa.string()),
+            pa.field("data", pa.struct([pa.field(name, kind) for name, kind in properties.items()])),
+            pa.field("emitted_at", pa.int64()),
+        ])),
+    ])
+
+
+def read_messages(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """RECORD and STATE messages of Airbyte protocol lines.
+
+    Other messages (LOG, TRACE, ...) and lines that are not JSON, which
+    connectors may print, are skipped.
+    """
+    for line in lines:
+        if not line.startswith(b"{"):
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError:
+            logger.debug("Skipping a line that is not an Airbyte message.")
+            continue
+        if message.get("type") in ("RECORD", "STATE"):
+            yield message
+
+
+class _Batch:
+    def __init__(self):
+        self.tables: List[pa.Table] = []
+        self.rows = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+
+
+class AirbyteIngest:
+    """Writes the records of Airbyte messages as Parquet files under `location`, on the `fs` file system."""
+
+    def __init__(
+        self,
+        catalog: Dict[str, Any],
+        fs: pa_fs.FileSystem,
+        location: str,
+        batch_rows: int = BATCH_ROWS,
+        batch_bytes: int = BATCH_BYTES,
+        batch_seconds: float = BATCH_SECONDS,
+        queue_size: int = QUEUE_SIZE,
+        report_interval: float = REPORT_INTERVAL,
+        state_output: Optional[TextIO] = None,
+    ):
+        self.schemas = stream_schemas(catalog)
+        self.overwrite = {
+            c["stream"]["name"] for c in catalog["streams"] if c.get("destination_sync_mode") == "overwrite"
+        }
+        schema = message_schema(self.schemas)
+        self.parse_options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore") if schema else None
+        self.fs = fs
+        self.location = location.rstrip("/")
+        self.batch_rows = batch_rows
+        self.batch_bytes = batch_bytes
+        self.batch_seconds = batch_seconds
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.state_output = state_output
+        self.run_id = uuid.uuid4().hex
+
+        self._batches: Dict[str, _Batch] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self.stats = {"records": 0, "skipped": 0, "states": 0, "files": 0, "bytes": 0, "slow_chunks": 0}
+
+    def _checkpoint_path(self) -> str:
+        return f"{self.location}/{CHECKPOINT_NAME}"
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        try:
+            with self.fs.open_input_stream(self._checkpoint_path()) as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return {"state": None, "streams": {}}
+
+    def _save_checkpoint(self):
+        tmp = f"{self._checkpoint_path()}.tmp"
+        with self.fs.open_output_stream(tmp) as f:
+            f.write(json.dumps(self.checkpoint, indent=2).encode())
+        self.fs.move(tmp, self._checkpoint_path())
+
+    def _remove_uncommitted(self):
+        """Remove the files of a previous run written after its last checkpoint."""
+        for stream in self.schemas:
+            committed = set(self.checkpoint["streams"].get(stream, {}).get("files", []))
+            selector = pa_fs.FileSelector(f"{self.location}/{stream}", allow_not_found=True)
+            for info in self.fs.get_file_info(selector):
+                if info.path.endswith(".parquet") and info.path not in committed:
+                    logger.info("Removing uncommitted file %s.", info.path)
+                    self.fs.delete_file(info.path)
+
+    def _flush(self, stream: str):
+        batch = self._batches.pop(stream, None)
+        if batch is None or batch.rows == 0:
+            return
+        path = f"{self.location}/{stream}/{self.run_id}-{len(self._pending.setdefault(stream, [])):05d}.parquet"
+        pq.write_table(pa.concat_tables(batch.tables), path, filesystem=self.fs, compression="zstd")
+        self._pending[stream].append(path)
+        self.stats["files"] += 1
+        self.stats["bytes"] += self.fs.get_file_info(path).size
+
+    def _append(self, stream: str, table: pa.Table):
+        """Buffer records of `stream`, writing a file each time the batch is full."""
+        self.stats["records"] += table.num_rows
+        self._records[stream] = self._records.get(stream, 0) + table.num_rows
+        while table.num_rows:
+            batch = self._batches.get(stream)
+            if batch is None:
+                batch = self._batches[stream] = _Batch()
+            part = table.slice(0, self.batch_rows - batch.rows)
+            table = table.slice(part.num_rows)
+            batch.tables.append(part)
+            batch.rows += part.num_rows
+            batch.bytes += part.nbytes
+            if batch.rows >= self.batch_rows or batch.bytes >= self.batch_bytes:
+                self._flush(stream)
+
+    def _commit(self, state: Optional[Dict[str, Any]]):
+        """Flush every buffered batch and record the written files with `state`."""
+        for stream in list(self._batches):
+            self._flush(stream)
+        for stream, paths in self._pending.items():
+            entry = self.checkpoint["streams"].setdefault(stream, {"files": [], "records": 0})
+            entry["files"] += paths[self._committed.get(stream, 0):]
+            self._committed[stream] = len(paths)
+        for stream, records in self._records.items():
+            self.checkpoint["streams"][stream]["records"] += records
+        self._records = {}
+        if state is not None:
+            self.stats["states"] += 1
+            self.checkpoint["state"] = state
+        self.checkpoint["at"] = time.time()
+        self._save_checkpoint()
+        if state is not None and self.state_output is not None:
+            # like a destination, acknowledge the state once everything before it is committed
+            self.state_output.write(json.dumps({"type": "STATE", "state": state}) + "\n")
+            self.state_output.flush()
+
+    def _replace_previous(self, previous: Dict[str, List[str]]):
+        for stream, paths in previous.items():
+            entry = self.checkpoint["streams"][stream]
+            entry["files"] = [p for p in entry["files"] if p not in paths]
+            for path in paths:
+                self.fs.delete_file(path)
+        self._save_checkpoint()
+
+    def _append_records(self, messages: pa.Table):
+        """Buffer the RECORD rows of parsed messages, by stream."""
+        records = messages.filter(pc.equal(messages["type"], "RECORD"))["record"].combine_chunks()
+        if not len(records):
+            return
+        streams = pc.struct_field(records, "stream")
+        appended = 0
+        names = pc.unique(streams).to_pylist()
+        for stream in names:
+            if stream not in self.schemas:
+                continue
+            selected = records if len(names) == 1 else records.filter(pc.equal(streams, stream))
+            data = pc.struct_field(selected, "data")
+            schema = self.schemas[stream]
+            self._append(stream, pa.Table.from_arrays([
+                pc.struct_field(data, field.name) if field.name != EMITTED_AT else pc.struct_field(selected, "emitted_at").cast(field.type)
+                for field in schema
+            ], schema=schema))
+            appended += len(selected)
+        self.stats["skipped"] += len(records) - appended
+
+    def _records_table(self, stream: str, records: List[Dict[str, Any]]) -> pa.Table:
+        arrays = []
+        for field in self.schemas[stream]:
+            if field.name == EMITTED_AT:
+                values = [record.get("emitted_at") for record in records]
+            else:
+                values = [(record.get("data") or {}).get(field.name) for record in records]
+                if pa.types.is_string(field.type):
+                    values = [v if v is None or isinstance(v, str) else json.dumps(v) for v in values]
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as exc:
+                raise ValueError(f"Stream {stream}: invalid values for column {field.name}: {exc}") from exc
+        return pa.Table.from_arrays(arrays, schema=self.schemas[stream])
+
+    def _ingest_lines(self, lines: List[bytes]):
+        """Slow path: parse each line with json.loads."""
+        self.stats["slow_chunks"] += 1
+        records: Dict[str, List[Dict[str, Any]]] = {}
+        for message in read_messages(lines):
+            if message["type"] == "RECORD":
+                stream = message["record"].get("stream")
+                if stream in self.schemas:
+                    records.setdefault(stream, []).append(message["record"])
+                else:
+                    self.stats["skipped"] += 1
+                continue
+            for stream, pending in records.items():
+                self._append(stream, self._records_table(stream, pending))
+            records = {}
+            self._commit(message.get("state"))
+        for stream, pending in records.items():
+            self._append(stream, self._records_table(stream, pending))
+
+    def _ingest(self, chunk: bytes):
+        """Ingest a chunk of whole lines."""
+        try:
+            if self.parse_options is None:
+                raise pa.ArrowInvalid("streams with conflicting property types")
+            messages = pa_json.read_json(io.BytesIO(chunk), parse_options=self.parse_options)
+        except pa.ArrowInvalid:
+            self._ingest_lines(chunk.split(b"\n"))
+            return
+        kinds = messages["type"].to_pylist()
+        start, lines = 0, None
+        for row, kind in enumerate(kinds):
+            if kind != "STATE":
+                continue
+            self._append_records(messages.slice(start, row - start))
+            # rows are the chunk's lines, the state itself is free-form JSON
+            lines = lines or chunk.split(b"\n")
+            self._commit(json.loads(lines[row]).get("state"))
+            start = row + 1
+        self._append_records(messages.slice(start))
+
+    def _read(self, source: BinaryIO, chunks: "queue.Queue", failure: List[BaseException]):
+        """Put the JSON lines of `source` on `chunks`, as soon as they are read."""
+        read = getattr(source, "read1", source.read)
+        rest = b""
+        try:
+            while True:
+                data = read(READ_SIZE)
+                if not data:
+                    break
+                data = rest + data
+                end = data.rfind(b"\n") + 1
+                rest = data[end:]
+                lines = [line for line in data[:end].split(b"\n") if line.startswith(b"{")]
+                if lines:
+                    chunks.put(b"\n".join(lines))
+            if rest.startswith(b"{"):
+                chunks.put(rest)
+        except BaseException as exc:
+            failure.append(exc)
+        finally:
+            chunks.put(_END)
+
+    def _report(self, start: float) -> Dict[str, Any]:
+        duration = time.perf_counter() - start
+        return {
+            **self.stats,
+            "duration_s": round(duration, 3),
+            "records_per_second": round(self.stats["records"] / duration) if duration > 0 else 0,
+        }
+
+    def run(self, source: BinaryIO) -> Dict[str, Any]:
+        """Ingest the Airbyte messages of the binary file `source` (stdin, a captured file, ...) until its end."""
+        start = time.perf_counter()
+        self.fs.create_dir(self.location, recursive=True)
+        for stream in self.schemas:
+            self.fs.create_dir(f"{self.location}/{stream}", recursive=True)
+        self.checkpoint = self._load_checkpoint()
+        self._remove_uncommitted()
+        self._committed: Dict[str, int] = {}
+        self._records: Dict[str, int] = {}
+        previous = {
+            stream: list(self.checkpoint["streams"].get(stream, {}).get("files", []))
+            for stream in self.overwrite if self.checkpoint["streams"].get(stream, {}).get("files")
+        }
+
+        chunks: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        failure: List[BaseException] = []
+        reader = threading.Thread(target=self._read, args=(source, chunks, failure), name="airbyte-reader", daemon=True)
+        reader.start()
+        reported_at, reported_records = time.perf_counter(), 0
+        while True:
+            now = time.monotonic()
+            deadline = min((b.started_at + self.batch_seconds for b in self._batches.values()), default=now + self.report_interval)
+            try:
+                chunk = chunks.get(timeout=max(0.0, deadline - now))
+            except queue.Empty:
+                chunk = None
+            if chunk is _END:
+                break
+            if chunk is not None:
+                self._ingest(chunk)
+            now = time.monotonic()
+            for stream, batch in list(self._batches.items()):
+                if now - batch.started_at >= self.batch_seconds:
+                    self._flush(stream)
+            if time.perf_counter() - reported_at >= self.report_interval:
+                elapsed = time.perf_counter() - reported_at
+                logger.info(
+                    "Ingested %s records (%s records/s, %s chunks queued).",
+                    self.stats["records"], round((self.stats["records"] - reported_records) / elapsed), chunks.qsize(),
+                )
+                reported_at, reported_records = time.perf_counter(), self.stats["records"]
+        reader.join()
+        if failure:
+            # files written since the last checkpoint are removed by the next run
+            raise failure[0]
+        self._commit(None)
+        if previous:
+            self._replace_previous(previous)
+        report = self._report(start)
+        logger.info("Ingested %s records in %s files, %s records/s.", report["records"], report["files"], report["records_per_second"])
+        return report
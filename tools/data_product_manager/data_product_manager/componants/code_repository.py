@@ -0,0 +1,289 @@
+import os
+import re
+import sys
+import enum
+import errno
+import shutil
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from data_product_manager.metrics import OUTBOUND_CALL_DURATION
+
+
+logger = logging.getLogger("app.components.code_repository")
+
+
+class RepositoryType(enum.Enum):
+    GITHUB = "github"
+    GITLAB = "gitlab"
+    BITBUCKET = "bitbucket"
+    LOCAL = "local"
+
+    def from_url(url: str):
+        if os.path.exists(url):
+            return RepositoryType.LOCAL
+        else:
+            raise ValueError(f"Unknown repository type for url: {url}")
+
+
+class ForkMode(enum.Enum):
+    AUTO = "auto"          # reflink when the filesystem supports it, plain copy otherwise
+    REFLINK = "reflink"    # copy-on-write clones only, fail if unsupported
+    COPY = "copy"
+
+
+FICLONE = 0x40049409  # linux/fs.h, _IOW(0x94, 9, int)
+_REFLINK_UNSUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTSUP)
+
+
+def _reflink(src: str, dst: str):
+    """Clone src to dst sharing its data blocks (Linux FICLONE / macOS clonefile)."""
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), dst)
+        return
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _glob_regex(pattern: str) -> "re.Pattern[str]":
+    """Compile a .gitignore glob: `*`, `?` and `[...]` stop at slashes, `**/` spans directories."""
+    parts, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            content = pattern[i + 1:end]
+            if content.startswith("!"):
+                content = "^" + content[1:]
+            parts.append(f"[{content}]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts))
+
+
+class IgnoreRules:
+    """Subset of .gitignore semantics: globs, `dir/` only patterns, anchored paths and `!` negation."""
+
+    def __init__(self, rules: Optional[List[Tuple[str, "re.Pattern[str]", bool, bool]]] = None):
+        # (base dir relative to the template root, compiled pattern, negated, directory only)
+        self.rules = rules or []
+
+    def extend(self, base: str, gitignore_path: str) -> "IgnoreRules":
+        rules = list(self.rules)
+        with open(gitignore_path, "r") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                negated = line.startswith("!")
+                pattern = line[1:] if negated else line
+                dir_only = pattern.endswith("/")
+                pattern = pattern.rstrip("/")
+                if "/" in pattern:
+                    pattern = pattern.lstrip("/")
+                else:
+                    pattern = f"**/{pattern}"
+                rules.append((base, _glob_regex(pattern), negated, dir_only))
+        return IgnoreRules(rules)
+
+    def ignored(self, relpath: str, is_dir: bool) -> bool:
+        ignored = False
+        for base, pattern, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not relpath.startswith(base + "/"):
+                    continue
+                candidate = relpath[len(base) + 1:]
+            else:
+                candidate = relpath
+            if pattern.fullmatch(candidate):
+                ignored = not negated
+        return ignored
+
+
+class TemplateManifest:
+    """Directories and files of a template, minus what its .gitignore files exclude.
+
+    `signature` holds the mtime of every kept directory and .gitignore file:
+    adding, removing or renaming an entry changes its parent directory
+    mtime, editing a .gitignore changes its own, so comparing signatures
+    tells whether the manifest is stale without walking the files.
+    """
+
+    def __init__(self, root: str, dirs: List[str], files: List[str], gitignores: List[str], signature: Tuple[int, ...]):
+        self.root = root
+        self.dirs = dirs
+        self.files = files
+        self.gitignores = gitignores
+        self.signature = signature
+
+    def _paths(self) -> List[str]:
+        return ["", *self.dirs, *self.gitignores]
+
+    @classmethod
+    def scan(cls, root: str) -> "TemplateManifest":
+        dirs, files, gitignores, mtimes = [], [], [], {}
+        stack = [("", IgnoreRules())]
+        while stack:
+            rel, rules = stack.pop()
+            abs_dir = os.path.join(root, rel)
+            mtimes[rel] = os.stat(abs_dir).st_mtime_ns
+            gitignore = os.path.join(rel, ".gitignore")
+            if os.path.isfile(os.path.join(root, gitignore)):
+                mtimes[gitignore] = os.stat(os.path.join(root, gitignore)).st_mtime_ns
+                gitignores.append(gitignore)
+                rules = rules.extend(rel, os.path.join(root, gitignore))
+            with os.scandir(abs_dir) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    child = f"{rel}/{entry.name}" if rel else entry.name
+                    is_dir = entry.is_dir()
+                    if rules.ignored(child, is_dir):
+                        continue
+                    if is_dir:
+                        dirs.append(child)
+                        stack.append((child, rules))
+                    else:
+                        files.append(child)
+        manifest = cls(root, dirs, files, gitignores, ())
+        manifest.signature = tuple(mtimes[rel] for rel in manifest._paths())
+        return manifest
+
+    def current_signature(self) -> Tuple[int, ...]:
+        return tuple(os.stat(os.path.join(self.root, rel)).st_mtime_ns for rel in self._paths())
+
+
+_manifests: Dict[str, TemplateManifest] = {}
+_manifests_lock = threading.Lock()
+
+
+def template_manifest(root: str) -> TemplateManifest:
+    """Cached manifest of `root`, rescanned only when one of its directories changed."""
+    with _manifests_lock:
+        manifest = _manifests.get(root)
+    try:
+        if manifest is not None and manifest.current_signature() == manifest.signature:
+            return manifest
+    except FileNotFoundError:
+        pass
+    manifest = TemplateManifest.scan(root)
+    with _manifests_lock:
+        _manifests[root] = manifest
+    logger.debug("Scanned template %s: %s directories, %s files.", root, len(manifest.dirs), len(manifest.files))
+    return manifest
+
+
+class LocalRepositoryConnector:
+    def __init__(self, path: str, fork_mode: ForkMode = ForkMode.AUTO):
+        self.path = path
+        self.fork_mode = fork_mode
+        self._reflink_supported = fork_mode != ForkMode.COPY
+
+    def connect(self): ...
+    def disconnect(self): ...
+
+    def _copy_file(self, src: str, dst: str):
+        if self._reflink_supported:
+            try:
+                _reflink(src, dst)
+                return
+            except (OSError, AttributeError) as e:
+                if self.fork_mode == ForkMode.REFLINK or (isinstance(e, OSError) and e.errno not in _REFLINK_UNSUPPORTED):
+                    raise
+                logger.info("Reflinks are not supported under %s, falling back to copies.", self.path)
+                self._reflink_supported = False
+        shutil.copy2(src, dst)
+
+    def fork(self, fork_path: str, repo_path: str):
+        """Fork into `<repo_path>.partial` then rename, so repo_path only ever holds a complete fork."""
+        if os.path.exists(repo_path):
+            raise FileExistsError(errno.EEXIST, "Repository already exists", repo_path)
+        manifest = template_manifest(fork_path)
+        partial_path = f"{repo_path}.partial"
+        # leftover of a fork interrupted by a crash
+        shutil.rmtree(partial_path, ignore_errors=True)
+        os.makedirs(partial_path)
+        try:
+            for rel in manifest.dirs:
+                os.makedirs(os.path.join(partial_path, rel), exist_ok=True)
+            for rel in manifest.files:
+                self._copy_file(os.path.join(fork_path, rel), os.path.join(partial_path, rel))
+            os.rename(partial_path, repo_path)
+        except BaseException:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            raise
+
+    def exists(self, name: str) -> bool:
+        return os.path.isdir(os.path.join(self.path, name))
+
+    def create(self, name: str, description: str, fork: str = None):
+        repo_path = os.path.join(self.path, name)
+        if fork:
+            fork_path = os.path.join(self.path, fork)
+            if not os.path.exists(fork_path):
+                raise FileNotFoundError(f"Fork template {fork} does not exist at {fork_path}.")
+            self.fork(fork_path, repo_path)
+            logger.info("Forked local repository from %s to %s (%s).", fork_path, repo_path, self.fork_mode.value)
+        else:
+            os.makedirs(repo_path, exist_ok=True)
+            logger.info("Created new local repository at %s.", repo_path)
+
+
+class CodeRepository:
+    def __init__(self, url: str, fork_mode: ForkMode = ForkMode.AUTO):
+        self.url = url
+        self.repo_type = RepositoryType.from_url(url)
+        self.connector = None
+        if self.repo_type == RepositoryType.LOCAL:
+            self.connector = LocalRepositoryConnector(url, fork_mode)
+
+    def connect(self):
+        logger.info("Connecting to code repository at %s.", self.url)
+        self.connector.connect()
+
+    def disconnect(self):
+        logger.info("Disconnecting from code repository at %s.", self.url)
+        self.connector.disconnect()
+
+    def create_repository(self, name: str, description: str, fork: str = None):
+        if fork:
+            logger.info("Forking repository %s to create %s at %s/%s.", fork, name, self.url, name)
+        else:
+            logger.info("Creating repository %s at %s/%s.", name, self.url, name)
+        with OUTBOUND_CALL_DURATION.time(target="code_repository", operation="fork" if fork else "create"):
+            self.connector.create(name, description, fork)
+
+    def repository_exists(self, name: str) -> bool:
+        return self.connector.exists(name)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disconnect()
\ No newline at end of file
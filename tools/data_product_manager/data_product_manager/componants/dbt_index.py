@@ -0,0 +1,438 @@
+"""Index of the dbt projects of every data product, without running dbt.
+
+Reads each product's dbt_project.yml, the .sql and .yml/.yaml files of its
+model paths and the CSV headers and .yml/.yaml files of its seed paths, and
+extracts models, their `ref()` and `source()` dependencies, versions,
+materializations and seeds with their configured column types. Jinja is
+not rendered: dependencies are found by pattern, which covers the plain
+`ref('model')`, `ref('package', 'model')`, `ref('model', v=2)` and
+`source('source', 'table')` forms.
+
+A refresh stats every indexed file and only re-reads the ones whose mtime
+or size changed, and only re-parses them if their content hash changed.
+Per-file results are kept in a JSON file between restarts.
+"""
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("app.components.dbt_index")
+
+INDEX_FORMAT = 3
+DEFAULT_MATERIALIZED = "view"
+
+REF = re.compile(r"""\bref\(\s*['"]([^'"]+)['"]\s*(?:,\s*['"]([^'"]+)['"]\s*)?(?:,\s*(?:v|version)\s*=\s*['"]?([\w.]+)['"]?\s*)?\)""")
+SOURCE = re.compile(r"""\bsource\(\s*['"]([^'"]+)['"]\s*,\s*['"]([^'"]+)['"]\s*\)""")
+CONFIG_MATERIALIZED = re.compile(r"""\bconfig\([^)]*?\bmaterialized\s*=\s*['"](\w+)['"]""", re.S)
+JINJA_COMMENT = re.compile(r"\{#.*?#\}", re.S)
+
+
+def _version(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _materialized(config: Any) -> Optional[str]:
+    if not isinstance(config, dict):
+        return None
+    return config.get("+materialized", config.get("materialized"))
+
+
+def _column_types(config: Any) -> Dict[str, str]:
+    if not isinstance(config, dict):
+        return {}
+    column_types = config.get("+column_types", config.get("column_types"))
+    return {str(k): str(v) for k, v in column_types.items()} if isinstance(column_types, dict) else {}
+
+
+def _config(node: Dict[str, Any]) -> Dict[str, Any]:
+    config = node.get("config")
+    return config if isinstance(config, dict) else {}
+
+
+def _meta(node: Dict[str, Any]) -> Dict[str, Any]:
+    """`meta` of a model or column, set at its top level or in its config."""
+    meta = {**(node.get("meta") or {}), **(_config(node).get("meta") or {})}
+    return meta if isinstance(meta, dict) else {}
+
+
+def parse_project(content: bytes) -> Dict[str, Any]:
+    import yaml
+
+    project = yaml.safe_load(content) or {}
+    return {
+        "name": project.get("name"),
+        "model_paths": project.get("model-paths", ["models"]),
+        "seed_paths": project.get("seed-paths", ["seeds"]),
+        "models_config": (project.get("models") or {}).get(project.get("name"), {}),
+        "seeds_config": (project.get("seeds") or {}).get(project.get("name"), {}),
+    }
+
+
+def parse_sql(content: bytes) -> Dict[str, Any]:
+    sql = JINJA_COMMENT.sub("", content.decode(errors="replace"))
+    refs = []
+    for first, second, version in REF.findall(sql):
+        ref = {"name": second or first}
+        if version:
+            ref["version"] = version
+        if ref not in refs:
+            refs.append(ref)
+    materialized = CONFIG_MATERIALIZED.search(sql)
+    return {
+        "refs": refs,
+        "sources": sorted({f"{source}.{table}" for source, table in SOURCE.findall(sql)}),
+        "materialized": materialized.group(1) if materialized else None,
+    }
+
+
+def parse_yaml(content: bytes) -> Dict[str, Any]:
+    import yaml
+
+    document = yaml.safe_load(content) or {}
+    models = []
+    for model in document.get("models") or []:
+        if not isinstance(model, dict) or "name" not in model:
+            continue
+        columns = [c for c in model.get("columns") or [] if isinstance(c, dict) and "name" in c]
+        row_filters = _meta(model).get("row_filter") or []
+        models.append({
+            "name": model["name"],
+            "latest_version": _version(model.get("latest_version")),
+            "materialized": _materialized(model.get("config")),
+            "alias": _config(model).get("alias"),
+            "schema": _config(model).get("schema"),
+            "columns": [c["name"] for c in columns],
+            # access policies: `meta: {row_filter: <expression or list>}` on the model, `meta: {mask: <expression>}` on columns
+            "row_filters": [row_filters] if isinstance(row_filters, str) else list(row_filters),
+            "column_masks": {c["name"]: str(_meta(c)["mask"]) for c in columns if _meta(c).get("mask") is not None},
+            "versions": [
+                {
+                    "v": _version(version.get("v")),
+                    "defined_in": version.get("defined_in"),
+                    "materialized": _materialized(version.get("config")),
+                    "alias": _config(version).get("alias"),
+                }
+                for version in model.get("versions") or [] if isinstance(version, dict)
+            ],
+        })
+    seeds = [
+        {"name": seed["name"], "column_types": _column_types(seed.get("config"))}
+        for seed in document.get("seeds") or [] if isinstance(seed, dict) and "name" in seed
+    ]
+    sources = []
+    for source in document.get("sources") or []:
+        if isinstance(source, dict) and "name" in source:
+            sources += [f"{source['name']}.{table['name']}" for table in source.get("tables") or [] if isinstance(table, dict) and "name" in table]
+    return {"models": models, "seeds": seeds, "sources": sources}
+
+
+def parse_seed(content: bytes) -> Dict[str, Any]:
+    header = content.split(b"\n", 1)[0].decode(errors="replace")
+    return {"columns": next(csv.reader([header]), [])}
+
+
+PARSERS = {"project": parse_project, "sql": parse_sql, "yaml": parse_yaml, "seed": parse_seed}
+
+
+def _version_key(version: str) -> Tuple:
+    """Numeric versions in numeric order, like dbt, others after them in string order."""
+    try:
+        return (0, float(version), version)
+    except ValueError:
+        return (1, 0.0, version)
+
+
+def _node_id(name: str, version: Optional[str]) -> str:
+    return f"{name}.v{version}" if version else name
+
+
+class DbtIndex:
+    """Models, seeds and lineage of the dbt projects under `root`, kept up to date incrementally.
+
+    Every directory of `root` not starting with `_` or `.` is a data
+    product, named after the directory without its `dp-` prefix, with its
+    dbt project at its root or under `dbt/`.
+    """
+
+    def __init__(self, root: str, path: str, refresh_interval: float = 2.0):
+        self.root = root
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._refreshed_at = 0.0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning("Ignoring unreadable dbt index %s.", self.path)
+            return
+        if index.get("format") == INDEX_FORMAT and index.get("root") == os.path.abspath(self.root):
+            self._files = index["files"]
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        index = {"format": INDEX_FORMAT, "root": os.path.abspath(self.root), "files": self._files}
+        with open(tmp, "w") as f:
+            # dumps and a single write is several times faster than json.dump's chunked writes
+            f.write(json.dumps(index, separators=(",", ":")))
+        os.replace(tmp, self.path)
+
+    def _project_dirs(self) -> Iterator[Tuple[str, str]]:
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith(("_", ".")) or entry.name.endswith(".partial") or not entry.is_dir():
+                    continue
+                product = entry.name[len("dp-"):] if entry.name.startswith("dp-") else entry.name
+                for project in (os.path.join(entry.path, "dbt"), entry.path):
+                    if os.path.isfile(os.path.join(project, "dbt_project.yml")):
+                        yield product, project
+                        break
+
+    def _walk(self, directory: str, suffixes: Tuple[str, ...]) -> Iterator[os.DirEntry]:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        yield from self._walk(entry.path, suffixes)
+                    elif entry.name.endswith(suffixes):
+                        yield entry
+        except FileNotFoundError:
+            return
+
+    def _check(self, product: str, kind: str, path: str, stat: os.stat_result, seen: Dict[str, Any]) -> bool:
+        """Bring the entry of one file up to date, return whether its content changed."""
+        seen[path] = True
+        known = self._files.get(path)
+        if known is not None and known["mtime_ns"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+            return False
+        with open(path, "rb") as f:
+            content = f.read() if kind != "seed" else f.readline()
+        digest = hashlib.sha256(content).hexdigest()
+        if known is not None and known["sha256"] == digest:
+            known["mtime_ns"], known["size"] = stat.st_mtime_ns, stat.st_size
+            self._dirty = True
+            return False
+        try:
+            data = PARSERS[kind](content)
+        except Exception as exc:
+            logger.warning("Could not parse %s: %s", path, exc)
+            data = {"error": str(exc)}
+        self._dirty = True
+        self._files[path] = {"product": product, "kind": kind, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest, "data": data}
+        return True
+
+    def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """Rescan the projects, at most every `refresh_interval` seconds unless `force`."""
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return {"skipped": True}
+            start = time.perf_counter()
+            seen: Dict[str, Any] = {}
+            changed_products = set()
+            for product, project in self._project_dirs():
+                project_file = os.path.join(project, "dbt_project.yml")
+                if self._check(product, "project", project_file, os.stat(project_file), seen):
+                    changed_products.add(product)
+                config = self._files[project_file]["data"]
+                for kind, paths, suffixes in (
+                    ("model", config.get("model_paths", ["models"]), (".sql", ".yml", ".yaml")),
+                    ("seed", config.get("seed_paths", ["seeds"]), (".csv", ".yml", ".yaml")),
+                ):
+                    for directory in paths:
+                        for entry in self._walk(os.path.join(project, directory), suffixes):
+                            file_kind = "sql" if entry.name.endswith(".sql") else "seed" if entry.name.endswith(".csv") else "yaml"
+                            if self._check(product, file_kind, entry.path, entry.stat(), seen):
+                                changed_products.add(product)
+            removed = [path for path in self._files if path not in seen]
+            for path in removed:
+                changed_products.add(self._files.pop(path)["product"])
+            for product in changed_products:
+                self._products.pop(product, None)
+            if self._dirty or removed or not os.path.exists(self.path):
+                self._save()
+                self._dirty = False
+            self._refreshed_at = time.monotonic()
+            report = {
+                "files": len(seen),
+                "changed_products": sorted(changed_products),
+                "removed_files": len(removed),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            }
+            if changed_products:
+                logger.info("Refreshed dbt index: %s files, %s products changed in %sms.", report["files"], len(changed_products), report["duration_ms"])
+            return report
+
+    def products(self) -> List[str]:
+        with self._lock:
+            return sorted({entry["product"] for entry in self._files.values() if entry["kind"] == "project"})
+
+    def _build(self, product: str) -> Optional[Dict[str, Any]]:
+        files = {path: entry for path, entry in self._files.items() if entry["product"] == product}
+        project_path, project = next(((p, e["data"]) for p, e in files.items() if e["kind"] == "project"), (None, None))
+        if project is None:
+            return None
+        root = os.path.dirname(project_path)
+        declared = {m["name"]: m for e in files.values() if e["kind"] == "yaml" for m in e["data"].get("models", [])}
+        seed_types = {s["name"]: s["column_types"] for e in files.values() if e["kind"] == "yaml" for s in e["data"].get("seeds", [])}
+        version_files = {
+            version.get("defined_in") or f"{model['name']}_v{version['v']}": (model, version)
+            for model in declared.values() for version in model["versions"]
+        }
+        models, seeds, sources = {}, {}, set()
+        for path, entry in sorted(files.items()):
+            relative = os.path.relpath(path, root)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            if entry["kind"] == "seed":
+                folders = os.path.relpath(os.path.dirname(path), root).split(os.sep)[1:]
+                seeds[stem] = {
+                    "name": stem,
+                    "path": relative,
+                    "columns": entry["data"].get("columns", []),
+                    # dbt merges column_types down the project config, then the seed's properties
+                    "column_types": {
+                        **self._project_column_types(project.get("seeds_config") or {}, [*folders, stem]),
+                        **seed_types.get(stem, {}),
+                    },
+                }
+            elif entry["kind"] == "yaml":
+                sources.update(entry["data"].get("sources", []))
+            elif entry["kind"] == "sql":
+                model, version = version_files.get(stem, (declared.get(stem), None))
+                name = model["name"] if model else stem
+                v = version["v"] if version else None
+                folders = os.path.relpath(os.path.dirname(path), root).split(os.sep)[1:]
+                alias = (version or {}).get("alias") or (model or {}).get("alias") or name
+                models[_node_id(name, v)] = {
+                    "id": _node_id(name, v),
+                    "name": name,
+                    "version": v,
+                    "latest_version": model["latest_version"] if model else None,
+                    "materialized": (
+                        entry["data"].get("materialized")
+                        or (version or {}).get("materialized")
+                        or (model or {}).get("materialized")
+                        or self._project_materialized(project.get("models_config") or {}, folders)
+                        or DEFAULT_MATERIALIZED
+                    ),
+                    "path": relative,
+                    # table name, as the generate_alias_name macro of the template names versioned models
+                    "relation": f"{alias}_v{v.replace('.', '_')}" if v else alias,
+                    "schema": (model or {}).get("schema"),
+                    "columns": model["columns"] if model else [],
+                    "row_filters": model["row_filters"] if model else [],
+                    "column_masks": model["column_masks"] if model else {},
+                    "refs": entry["data"].get("refs", []),
+                    "sources": entry["data"].get("sources", []),
+                }
+        latest = {}
+        for model in sorted((m for m in models.values() if m["version"] is not None), key=lambda m: _version_key(m["version"])):
+            if latest.get(model["name"], {}).get("version") != model["latest_version"]:
+                latest[model["name"]] = model
+        for model in models.values():
+            upstream = []
+            for ref in model["refs"]:
+                if ref.get("version") is not None and _node_id(ref["name"], ref["version"]) in models:
+                    upstream.append(_node_id(ref["name"], ref["version"]))
+                elif ref["name"] in models:
+                    upstream.append(ref["name"])
+                elif ref["name"] in latest:
+                    upstream.append(latest[ref["name"]]["id"])
+                elif ref["name"] in seeds:
+                    upstream.append(f"seed:{ref['name']}")
+                else:
+                    upstream.append(f"unresolved:{ref['name']}")
+            upstream += [f"source:{source}" for source in model["sources"]]
+            model["upstream"] = upstream
+        return {
+            "data_product": product,
+            "project": project.get("name"),
+            "models": sorted(models.values(), key=lambda m: m["id"]),
+            "seeds": sorted(seeds.values(), key=lambda s: s["name"]),
+            "sources": sorted(sources | {s for m in models.values() for s in m["sources"]}),
+        }
+
+    @staticmethod
+    def _project_materialized(config: Dict[str, Any], folders: List[str]) -> Optional[str]:
+        materialized = _materialized(config)
+        for folder in folders:
+            config = config.get(folder) if isinstance(config, dict) else None
+            if config is None:
+                break
+            materialized = _materialized(config) or materialized
+        return materialized
+
+    @staticmethod
+    def _project_column_types(config: Dict[str, Any], path: List[str]) -> Dict[str, str]:
+        column_types = _column_types(config)
+        for part in path:
+            config = config.get(part) if isinstance(config, dict) else None
+            if config is None:
+                break
+            column_types.update(_column_types(config))
+        return column_types
+
+    def product(self, name: str) -> Optional[Dict[str, Any]]:
+        """Models, seeds and sources of one data product, None if it has no dbt project."""
+        with self._lock:
+            if name not in self._products:
+                built = self._build(name)
+                if built is None:
+                    return None
+                self._products[name] = built
+            return self._products[name]
+
+    def lineage(self, name: str, model: str, direction: str = "both", depth: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Nodes and edges reachable from `model` upstream, downstream or both, up to `depth` hops.
+
+        `model` is a model name (its latest version when versioned) or a
+        versioned id such as `anytoany.v1.0`. Returns None if the model is unknown.
+        """
+        project = self.product(name)
+        if project is None:
+            return None
+        models = {m["id"]: m for m in project["models"]}
+        start = model if model in models else next(
+            (m["id"] for m in project["models"] if m["name"] == model and (m["latest_version"] in (None, m["version"]))),
+            next((m["id"] for m in project["models"] if m["name"] == model), None),
+        )
+        if start is None:
+            return None
+        downstream: Dict[str, List[str]] = {}
+        for m in project["models"]:
+            for up in m["upstream"]:
+                downstream.setdefault(up, []).append(m["id"])
+
+        edges, nodes = set(), {start}
+        for walk_up in ([True, False] if direction == "both" else [direction == "upstream"]):
+            frontier, hops = [start], 0
+            while frontier and (depth is None or hops < depth):
+                hops += 1
+                following = []
+                for node in frontier:
+                    neighbours = (models[node]["upstream"] if node in models else []) if walk_up else downstream.get(node, [])
+                    for neighbour in neighbours:
+                        edges.add((neighbour, node) if walk_up else (node, neighbour))
+                        if neighbour not in nodes:
+                            nodes.add(neighbour)
+                            following.append(neighbour)
+                frontier = following
+        return {
+            "data_product": name,
+            "model": start,
+            "nodes": sorted(nodes),
+            "edges": [{"from": a, "to": b} for a, b in sorted(edges)],
+        }
@@ -0,0 +1,449 @@
+"""Minimal Iceberg (format v2) table commits: manifests, table metadata and the JDBC catalog.
+
+Enough of the spec to publish Parquet data files as a new snapshot of an
+unpartitioned table and register it in the `iceberg_tables` table of the
+JDBC catalog Trino uses (config/postgres/init-db.sql). Manifests are Avro
+object container files, written here with the stdlib.
+
+File access goes through a pyarrow FileSystem passed in by the caller.
+"""
+import io
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("app.components.iceberg")
+
+FORMAT_VERSION = 2
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS iceberg_tables (
+    catalog_name VARCHAR(255) NOT NULL,
+    table_namespace VARCHAR(255) NOT NULL,
+    table_name VARCHAR(255) NOT NULL,
+    metadata_location VARCHAR(1000),
+    previous_metadata_location VARCHAR(1000),
+    iceberg_type VARCHAR(5),
+    PRIMARY KEY (catalog_name, table_namespace, table_name)
+);
+CREATE TABLE IF NOT EXISTS iceberg_namespace_properties (
+    catalog_name VARCHAR(255) NOT NULL,
+    namespace VARCHAR(255) NOT NULL,
+    property_key VARCHAR(255),
+    property_value VARCHAR(1000),
+    PRIMARY KEY (catalog_name, namespace, property_key)
+);
+"""
+
+
+class CommitConflictError(RuntimeError):
+    """The table was committed by another writer since its metadata was read."""
+
+
+# --- Avro -------------------------------------------------------------------
+
+def _long(value: int, out: io.BytesIO):
+    value = (value << 1) ^ (value >> 63)
+    while value & ~0x7F:
+        out.write(bytes(((value & 0x7F) | 0x80,)))
+        value >>= 7
+    out.write(bytes((value,)))
+
+
+def _bytes(value: bytes, out: io.BytesIO):
+    _long(len(value), out)
+    out.write(value)
+
+
+def _encode(schema: Any, value: Any, out: io.BytesIO):
+    if isinstance(schema, list):
+        # unions here are always [null, type]
+        if value is None:
+            _long(0, out)
+        else:
+            _long(1, out)
+            _encode(schema[1], value, out)
+        return
+    kind = schema if isinstance(schema, str) else schema["type"]
+    if kind in ("int", "long"):
+        _long(value, out)
+    elif kind == "string":
+        _bytes(value.encode(), out)
+    elif kind == "bytes":
+        _bytes(value, out)
+    elif kind == "boolean":
+        out.write(b"\x01" if value else b"\x00")
+    elif kind == "record":
+        for field in schema["fields"]:
+            _encode(field["type"], value.get(field["name"]), out)
+    elif kind == "array":
+        if isinstance(value, dict):
+            # Iceberg maps with non-string keys are arrays of key/value records
+            value = [{"key": k, "value": v} for k, v in value.items()]
+        if value:
+            _long(len(value), out)
+            for item in value:
+                _encode(schema["items"], item, out)
+        _long(0, out)
+    else:
+        raise ValueError(f"Unsupported Avro type {kind}.")
+
+
+def write_avro(fs, path: str, schema: dict, records: List[dict], metadata: Dict[str, str]) -> int:
+    """Write `records` as an Avro object container file (null codec), return its size."""
+    header = io.BytesIO()
+    header.write(b"Obj\x01")
+    entries = {"avro.schema": json.dumps(schema), "avro.codec": "null", **metadata}
+    _long(len(entries), header)
+    for key, value in entries.items():
+        _bytes(key.encode(), header)
+        _bytes(value.encode(), header)
+    _long(0, header)
+    sync = os.urandom(16)
+    header.write(sync)
+    block = io.BytesIO()
+    for record in records:
+        _encode(schema, record, block)
+    if records:
+        _long(len(records), header)
+        _bytes(block.getvalue(), header)
+        header.write(sync)
+    data = header.getvalue()
+    with fs.open_output_stream(path) as f:
+        f.write(data)
+    return len(data)
+
+
+def _map(name: str, field_id: int, key_id: int, value_id: int, value_type: str) -> dict:
+    return {
+        "name": name,
+        "type": ["null", {
+            "type": "array",
+            "logicalType": "map",
+            "items": {
+                "type": "record",
+                "name": f"k{key_id}_v{value_id}",
+                "fields": [
+                    {"name": "key", "type": "int", "field-id": key_id},
+                    {"name": "value", "type": value_type, "field-id": value_id},
+                ],
+            },
+        }],
+        "default": None,
+        "field-id": field_id,
+    }
+
+
+DATA_FILE_SCHEMA = {
+    "type": "record",
+    "name": "r2",
+    "fields": [
+        {"name": "content", "type": "int", "field-id": 134},
+        {"name": "file_path", "type": "string", "field-id": 100},
+        {"name": "file_format", "type": "string", "field-id": 101},
+        {"name": "partition", "type": {"type": "record", "name": "r102", "fields": []}, "field-id": 102},
+        {"name": "record_count", "type": "long", "field-id": 103},
+        {"name": "file_size_in_bytes", "type": "long", "field-id": 104},
+        _map("column_sizes", 108, 117, 118, "long"),
+        _map("value_counts", 109, 119, 120, "long"),
+        _map("null_value_counts", 110, 121, 122, "long"),
+        {"name": "split_offsets", "type": ["null", {"type": "array", "items": "long", "element-id": 133}], "default": None, "field-id": 132},
+        {"name": "sort_order_id", "type": ["null", "int"], "default": None, "field-id": 140},
+    ],
+}
+MANIFEST_ENTRY_SCHEMA = {
+    "type": "record",
+    "name": "manifest_entry",
+    "fields": [
+        {"name": "status", "type": "int", "field-id": 0},
+        {"name": "snapshot_id", "type": ["null", "long"], "default": None, "field-id": 1},
+        {"name": "sequence_number", "type": ["null", "long"], "default": None, "field-id": 3},
+        {"name": "file_sequence_number", "type": ["null", "long"], "default": None, "field-id": 4},
+        {"name": "data_file", "type": DATA_FILE_SCHEMA, "field-id": 2},
+    ],
+}
+MANIFEST_FILE_SCHEMA = {
+    "type": "record",
+    "name": "manifest_file",
+    "fields": [
+        {"name": "manifest_path", "type": "string", "field-id": 500},
+        {"name": "manifest_length", "type": "long", "field-id": 501},
+        {"name": "partition_spec_id", "type": "int", "field-id": 502},
+        {"name": "content", "type": "int", "field-id": 517},
+        {"name": "sequence_number", "type": "long", "field-id": 515},
+        {"name": "min_sequence_number", "type": "long", "field-id": 516},
+        {"name": "added_snapshot_id", "type": "long", "field-id": 503},
+        {"name": "added_files_count", "type": "int", "field-id": 504},
+        {"name": "existing_files_count", "type": "int", "field-id": 505},
+        {"name": "deleted_files_count", "type": "int", "field-id": 506},
+        {"name": "added_rows_count", "type": "long", "field-id": 512},
+        {"name": "existing_rows_count", "type": "long", "field-id": 513},
+        {"name": "deleted_rows_count", "type": "long", "field-id": 514},
+    ],
+}
+
+
+# --- table metadata ---------------------------------------------------------
+
+def current_schema(metadata: Optional[dict]) -> Optional[dict]:
+    if metadata is None:
+        return None
+    return next(s for s in metadata["schemas"] if s["schema-id"] == metadata["current-schema-id"])
+
+
+def evolve_schema(metadata: Optional[dict], columns: List[Tuple[str, str]]) -> Tuple[dict, int]:
+    """Schema for `columns` (name, Iceberg type), keeping the field ids of existing columns.
+
+    Returns the schema and the last assigned column id. Raises ValueError
+    when an existing column changes type.
+    """
+    previous = current_schema(metadata)
+    known = {field["name"]: field for field in previous["fields"]} if previous else {}
+    last_column_id = metadata["last-column-id"] if metadata else 0
+    fields = []
+    for name, kind in columns:
+        field = known.get(name)
+        if field is not None and field["type"] != kind:
+            raise ValueError(f"Column {name} changes type from {field['type']} to {kind}.")
+        if field is None:
+            last_column_id += 1
+            field = {"id": last_column_id, "name": name, "required": False, "type": kind}
+        fields.append(field)
+    schema_id = previous["schema-id"] if previous and previous["fields"] == fields else (
+        max(s["schema-id"] for s in metadata["schemas"]) + 1 if metadata else 0
+    )
+    return {"type": "struct", "schema-id": schema_id, "fields": fields}, last_column_id
+
+
+def new_metadata(location: str) -> dict:
+    return {
+        "format-version": FORMAT_VERSION,
+        "table-uuid": str(uuid.uuid4()),
+        "location": location,
+        "last-sequence-number": 0,
+        "last-updated-ms": int(time.time() * 1000),
+        "last-column-id": 0,
+        "current-schema-id": 0,
+        "schemas": [],
+        "default-spec-id": 0,
+        "partition-specs": [{"spec-id": 0, "fields": []}],
+        "last-partition-id": 999,
+        "default-sort-order-id": 0,
+        "sort-orders": [{"order-id": 0, "fields": []}],
+        "properties": {"write.format.default": "parquet"},
+        "current-snapshot-id": None,
+        "refs": {},
+        "snapshots": [],
+        "snapshot-log": [],
+        "metadata-log": [],
+    }
+
+
+def write_snapshot(
+    fs,
+    fs_location: str,
+    metadata: Optional[dict],
+    metadata_location: Optional[str],
+    location: str,
+    schema: dict,
+    last_column_id: int,
+    data_files: List[dict],
+) -> Tuple[dict, str, List[str]]:
+    """Write the manifest, manifest list and metadata file of a snapshot replacing the table content.
+
+    `location` is the table location as recorded in metadata, `fs_location`
+    the same location as a path of `fs`. `data_files` are data_file records
+    (see DATA_FILE_SCHEMA). Returns the new metadata, its location and the
+    paths of `fs` written.
+    """
+    metadata = json.loads(json.dumps(metadata)) if metadata else new_metadata(location)
+    now = int(time.time() * 1000)
+    snapshot_id = random.getrandbits(63)
+    sequence_number = metadata["last-sequence-number"] + 1
+    commit = uuid.uuid4()
+    if all(s["schema-id"] != schema["schema-id"] for s in metadata["schemas"]):
+        metadata["schemas"].append(schema)
+    metadata["current-schema-id"] = schema["schema-id"]
+    metadata["last-column-id"] = last_column_id
+    spec = metadata["partition-specs"][0]
+
+    manifest_name = f"metadata/{commit}-m0.avro"
+    manifest_length = write_avro(fs, f"{fs_location}/{manifest_name}", MANIFEST_ENTRY_SCHEMA, [
+        {"status": 1, "snapshot_id": snapshot_id, "sequence_number": sequence_number, "file_sequence_number": sequence_number, "data_file": data_file}
+        for data_file in data_files
+    ], {
+        "schema": json.dumps(schema),
+        "schema-id": str(schema["schema-id"]),
+        "partition-spec": json.dumps(spec["fields"]),
+        "partition-spec-id": str(spec["spec-id"]),
+        "format-version": str(FORMAT_VERSION),
+        "content": "data",
+    })
+    records = sum(f["record_count"] for f in data_files)
+    manifest_list_name = f"metadata/snap-{snapshot_id}-1-{commit}.avro"
+    write_avro(fs, f"{fs_location}/{manifest_list_name}", MANIFEST_FILE_SCHEMA, [{
+        "manifest_path": f"{location}/{manifest_name}",
+        "manifest_length": manifest_length,
+        "partition_spec_id": spec["spec-id"],
+        "content": 0,
+        "sequence_number": sequence_number,
+        "min_sequence_number": sequence_number,
+        "added_snapshot_id": snapshot_id,
+        "added_files_count": len(data_files),
+        "existing_files_count": 0,
+        "deleted_files_count": 0,
+        "added_rows_count": records,
+        "existing_rows_count": 0,
+        "deleted_rows_count": 0,
+    }], {
+        "snapshot-id": str(snapshot_id),
+        "parent-snapshot-id": str(metadata["current-snapshot-id"]),
+        "sequence-number": str(sequence_number),
+        "format-version": str(FORMAT_VERSION),
+    })
+
+    previous = next((s for s in metadata["snapshots"] if s["snapshot-id"] == metadata["current-snapshot-id"]), None)
+    summary = {
+        "operation": "overwrite" if previous else "append",
+        "added-data-files": str(len(data_files)),
+        "added-records": str(records),
+        "added-files-size": str(sum(f["file_size_in_bytes"] for f in data_files)),
+        "total-data-files": str(len(data_files)),
+        "total-records": str(records),
+        "total-files-size": str(sum(f["file_size_in_bytes"] for f in data_files)),
+        "total-delete-files": "0",
+        "total-position-deletes": "0",
+        "total-equality-deletes": "0",
+    }
+    if previous:
+        summary["deleted-data-files"] = previous["summary"].get("total-data-files", "0")
+        summary["deleted-records"] = previous["summary"].get("total-records", "0")
+    snapshot = {
+        "snapshot-id": snapshot_id,
+        "sequence-number": sequence_number,
+        "timestamp-ms": now,
+        "manifest-list": f"{location}/{manifest_list_name}",
+        "summary": summary,
+        "schema-id": schema["schema-id"],
+    }
+    if previous:
+        snapshot["parent-snapshot-id"] = previous["snapshot-id"]
+    metadata["snapshots"].append(snapshot)
+    metadata["snapshot-log"].append({"timestamp-ms": now, "snapshot-id": snapshot_id})
+    metadata["current-snapshot-id"] = snapshot_id
+    metadata["refs"] = {"main": {"snapshot-id": snapshot_id, "type": "branch"}}
+    metadata["last-sequence-number"] = sequence_number
+    metadata["last-updated-ms"] = now
+    if metadata_location:
+        metadata["metadata-log"].append({"timestamp-ms": now, "metadata-file": metadata_location})
+
+    version = int(os.path.basename(metadata_location).split("-", 1)[0]) + 1 if metadata_location else 0
+    metadata_name = f"metadata/{version:05d}-{commit}.metadata.json"
+    with fs.open_output_stream(f"{fs_location}/{metadata_name}") as f:
+        f.write(json.dumps(metadata, indent=2).encode())
+    written = [f"{fs_location}/{name}" for name in (manifest_name, manifest_list_name, metadata_name)]
+    return metadata, f"{location}/{metadata_name}", written
+
+
+def commit_snapshot(
+    catalog: "JdbcCatalog",
+    namespace: str,
+    table: str,
+    fs,
+    fs_location: str,
+    metadata: Optional[dict],
+    metadata_location: Optional[str],
+    location: str,
+    schema: dict,
+    last_column_id: int,
+    data_files: List[dict],
+) -> Tuple[dict, str]:
+    """`write_snapshot`, then commit the new metadata to `catalog` as table `namespace`.`table`.
+
+    On a conflict the files written for the snapshot are deleted, they are
+    referenced by nothing. Returns the new metadata and its location.
+    """
+    metadata, new_location, written = write_snapshot(
+        fs, fs_location, metadata, metadata_location, location, schema, last_column_id, data_files,
+    )
+    try:
+        catalog.commit(namespace, table, new_location, metadata_location)
+    except CommitConflictError:
+        for path in written:
+            try:
+                fs.delete_file(path)
+            except OSError:
+                pass
+        raise
+    return metadata, new_location
+
+
+# --- JDBC catalog -----------------------------------------------------------
+
+class JdbcCatalog:
+    """Table pointers of an Iceberg JDBC catalog, through any DB-API connection.
+
+    Commits follow the JDBC catalog protocol: a table is created by
+    inserting its row, and updated by swapping its metadata_location only if
+    it still points at the metadata the commit was based on.
+    """
+
+    def __init__(self, conn, catalog_name: str):
+        self.conn = conn
+        self.catalog_name = catalog_name
+        self._qmark = isinstance(conn, sqlite3.Connection)
+
+    def _execute(self, sql: str, params: tuple = ()):
+        cursor = self.conn.cursor()
+        cursor.execute(sql if self._qmark else sql.replace("?", "%s"), params)
+        return cursor
+
+    def ensure_schema(self):
+        for statement in filter(str.strip, CATALOG_SCHEMA.split(";")):
+            self._execute(statement)
+        self.conn.commit()
+
+    def metadata_location(self, namespace: str, table: str) -> Optional[str]:
+        row = self._execute(
+            "SELECT metadata_location FROM iceberg_tables WHERE catalog_name = ? AND table_namespace = ? AND table_name = ?",
+            (self.catalog_name, namespace, table),
+        ).fetchone()
+        return row[0] if row else None
+
+    def commit(self, namespace: str, table: str, metadata_location: str, previous: Optional[str]):
+        try:
+            if self._execute(
+                "SELECT 1 FROM iceberg_namespace_properties WHERE catalog_name = ? AND namespace = ? AND property_key = 'exists'",
+                (self.catalog_name, namespace),
+            ).fetchone() is None:
+                self._execute(
+                    "INSERT INTO iceberg_namespace_properties (catalog_name, namespace, property_key, property_value) VALUES (?, ?, 'exists', 'true')",
+                    (self.catalog_name, namespace),
+                )
+            if previous is None:
+                try:
+                    self._execute(
+                        "INSERT INTO iceberg_tables (catalog_name, table_namespace, table_name, metadata_location, previous_metadata_location, iceberg_type) "
+                        "VALUES (?, ?, ?, ?, NULL, 'TABLE')",
+                        (self.catalog_name, namespace, table, metadata_location),
+                    )
+                except Exception as exc:
+                    # sqlite3.IntegrityError, psycopg.errors.UniqueViolation: created concurrently
+                    if not any(cls.__name__ == "IntegrityError" for cls in type(exc).__mro__):
+                        raise
+                    raise CommitConflictError(f"Table {namespace}.{table} of {self.catalog_name} was created concurrently.") from exc
+            elif self._execute(
+                "UPDATE iceberg_tables SET metadata_location = ?, previous_metadata_location = ? "
+                "WHERE catalog_name = ? AND table_namespace = ? AND table_name = ? AND metadata_location = ?",
+                (metadata_location, previous, self.catalog_name, namespace, table, previous),
+            ).rowcount != 1:
+                raise CommitConflictError(f"Table {namespace}.{table} of {self.catalog_name} was committed concurrently.")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        logger.info("Committed %s.%s of catalog %s at %s.", namespace, table, self.catalog_name, metadata_location)
@@ -0,0 +1,432 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from keycloak.exceptions import KeycloakGetError, KeycloakPostError
+
+from data_product_manager.componants.keycloak_client import KeycloakClient
+
+
+logger = logging.getLogger("app.components.keycloak_bootstrap")
+
+
+GROUP_PATHS = [
+    "/country", "/country/france",
+    "/data", "/data/public", "/data/sensitive",
+    "/region", "/region/eu", "/region/us",
+]
+
+GROUPS_CLIENT_SCOPE = {
+    "name": "groups",
+    "protocol": "openid-connect",
+    "attributes": {
+        "include.in.token.scope": "true",
+        "display.on.consent.screen": "true"
+    },
+    "protocolMappers": [{
+        "name": "groups",
+        "protocol": "openid-connect",
+        "protocolMapper": "oidc-group-membership-mapper",
+        "consentRequired": False,
+        "config": {
+            "full.path": "true",
+            "id.token.claim": "true",
+            "access.token.claim": "true",
+            "userinfo.token.claim": "true",
+            "introspection.token.claim": "true",
+            "claim.name": "groups",
+            "lightweight.claim": "false"
+        }
+    }]
+}
+
+AUTHZ_DEFAULT_RESOURCE = {
+    "name": "Default Resource",
+    "type": "urn:trino:resources:default",
+    "uris": ["/*"],
+    "ownerManagedAccess": False,
+    "attributes": {}
+}
+AUTHZ_DEFAULT_POLICY = {
+    "name": "Default Policy",
+    "type": "js",
+    "logic": "POSITIVE",
+    "decisionStrategy": "AFFIRMATIVE",
+    "config": {"code": "$evaluation.grant();\n"}
+}
+AUTHZ_DEFAULT_PERMISSION = {
+    "name": "Default Permission",
+    "type": "resource",
+    "logic": "POSITIVE",
+    "decisionStrategy": "UNANIMOUS",
+    "config": {
+        "resources": [],
+        "applyPolicies": ["Default Policy"],
+        "defaultResourceType": "urn:trino:resources:default"
+    }
+}
+
+OTP_POLICY = {
+    "otpPolicyType": "totp",
+    "otpPolicyAlgorithm": "HmacSHA1",
+    "otpPolicyDigits": 6,
+    "otpPolicyPeriod": 30,
+    "otpPolicyLookAheadWindow": 1,
+}
+
+SERVICE_ACCOUNT_ROLE = "uma_protection"
+
+
+def trino_client_settings(redirect_uris: List[str], post_logout_uris: str) -> Dict[str, Any]:
+    """Settings of the 'trino' client that are enforced on every bootstrap."""
+    return {
+        "enabled": True,
+        "redirectUris": redirect_uris,
+        "webOrigins": ["/*"],
+        "authorizationServicesEnabled": True,
+        "frontchannelLogout": True,
+        "attributes": {
+            "oidc.ciba.grant.enabled": "true",
+            "oauth2.device.authorization.grant.enabled": "true",
+            "frontchannel.logout.session.required": "true",
+            "backchannel.logout.session.required": "true",
+            "standard.token.exchange.enabled": "true",
+            "post.logout.redirect.uris": post_logout_uris,
+        },
+    }
+
+
+def trino_client_payload(secret: str, redirect_uris: List[str], post_logout_uris: str) -> Dict[str, Any]:
+    """Full representation used when the 'trino' client does not exist yet."""
+    return {
+        "clientId": "trino",
+        "name": "trino",
+        "protocol": "openid-connect",
+        "publicClient": False,
+        "clientAuthenticatorType": "client-secret",
+        "secret": secret,
+        "standardFlowEnabled": True,
+        "implicitFlowEnabled": True,
+        "serviceAccountsEnabled": True,
+        **trino_client_settings(redirect_uris, post_logout_uris),
+        "defaultClientScopes": [
+            "web-origins", "service_account", "acr", "roles",
+            "profile", "groups", "basic", "email"
+        ],
+        "optionalClientScopes": [
+            "address", "phone", "organization", "offline_access", "microprofile-jwt"
+        ],
+    }
+
+
+def _is_subset(expected: Any, actual: Any) -> bool:
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(_is_subset(v, actual.get(k)) for k, v in expected.items())
+    return expected == actual
+
+
+def _is_benign(e: Exception) -> bool:
+    if getattr(e, "response_code", None) == 409:
+        return True
+    msg = (getattr(e, "error_message", "") or str(e) or "").lower()
+    if isinstance(msg, bytes):
+        msg = msg.decode(errors="replace")
+    return any(s in msg for s in ["already exist", "already exists", "already assigned", "exists"])
+
+
+def _silent(func, *args, **kwargs):
+    """Run func, swallow 409/'already exists' and log at DEBUG. Re-raise others."""
+    try:
+        return func(*args, **kwargs)
+    except (KeycloakGetError, KeycloakPostError) as e:
+        if _is_benign(e):
+            logger.debug("Ignored benign conflict: %s", e)
+            return None
+        logger.error("Call failed: %s(%s, %s): %s", func.__name__, args, kwargs, e)
+        raise
+
+
+def _parent_path(path: str) -> Optional[str]:
+    parent = path.rsplit("/", 1)[0]
+    return parent or None
+
+
+class RealmState:
+    """Everything the master bootstrap depends on, read once with concurrent GETs."""
+
+    def __init__(self):
+        self.groups: Dict[str, str] = {}
+        self.client_scopes: Dict[str, str] = {}
+        self.optional_client_scopes: set = set()
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        self.realm: Dict[str, Any] = {}
+        self.authz: Dict[str, Any] = {}
+        self.service_account_user: Optional[Dict[str, Any]] = None
+        self.client_roles: Dict[str, Dict[str, Any]] = {}
+        self.service_account_roles: set = set()
+        self.calls = 0
+
+    @classmethod
+    def fetch(cls, kc: KeycloakClient, realm_name: str, pool: ThreadPoolExecutor) -> "RealmState":
+        state = cls()
+        lock = threading.Lock()
+
+        def get(func, *args, default=None):
+            with lock:
+                state.calls += 1
+            try:
+                return func(*args)
+            except (KeycloakGetError, KeycloakPostError) as e:
+                if default is None:
+                    raise
+                logger.debug("Ignored failed read %s%s: %s", func.__name__, args, e)
+                return default
+
+        groups = pool.submit(get, kc.get_groups, default=[])
+        scopes = pool.submit(get, kc.get_client_scopes)
+        optional = pool.submit(get, kc.get_default_optional_client_scopes)
+        clients = pool.submit(get, kc.get_clients)
+        realm = pool.submit(get, kc.get_realm, realm_name)
+
+        state.client_scopes = {cs.get("name"): cs.get("id") for cs in scopes.result() or []}
+        state.optional_client_scopes = {cs.get("name") for cs in optional.result() or []}
+        state.clients = {c.get("clientId"): c for c in clients.result() or []}
+        state.realm = realm.result() or {}
+
+        trino = state.clients.get("trino")
+        if trino:
+            authz = pool.submit(get, kc.get_client_authz_settings, trino["id"], default={})
+            roles = pool.submit(get, kc.get_client_roles, trino["id"])
+            user = pool.submit(get, kc.get_client_service_account_user, trino["id"])
+
+        # walk the group tree one level at a time, only below the groups we care about.
+        # Keycloak >= 23 lists subgroups separately: get_groups already fetched the first level
+        # of children for groups that have some, reuse them instead of asking again.
+        wanted = set(GROUP_PATHS)
+        level = {f"/{g.get('name')}": g for g in groups.result() or []}
+        with lock:
+            state.calls += sum(1 for g in level.values() if g.get("subGroupCount"))
+        while level:
+            state.groups.update({path: g.get("id") for path, g in level.items() if path in wanted})
+            parents = [
+                (path, g) for path, g in level.items()
+                if path in wanted and any(_parent_path(w) == path for w in wanted)
+            ]
+            children = [
+                (path, pool.submit(lambda g=g: g["subGroups"]) if "subGroups" in g
+                 else pool.submit(get, kc.get_group_children, g["id"], default=[]))
+                for path, g in parents
+            ]
+            level = {
+                f"{path}/{child.get('name')}": child
+                for path, future in children
+                for child in future.result() or []
+            }
+
+        if trino:
+            state.authz = authz.result() or {}
+            state.client_roles = {r.get("name"): r for r in roles.result() or []}
+            state.service_account_user = user.result()
+            if state.service_account_user:
+                assigned = get(kc.get_client_roles_of_user, state.service_account_user["id"], trino["id"])
+                state.service_account_roles = {r.get("name") for r in assigned or []}
+        return state
+
+
+class ResolvedIds(dict):
+    """Ids known to the plan, looked up in Keycloak when a create returned none (409)."""
+
+    def __init__(self, kc: KeycloakClient, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.kc = kc
+
+    def __missing__(self, key: str):
+        if key == "client:trino":
+            value = self.kc.get_client_id("trino")
+        elif key == "scope:groups":
+            value = next((cs.get("id") for cs in self.kc.get_client_scopes() or [] if cs.get("name") == "groups"), None)
+        elif key.startswith("group:"):
+            value = (self.kc.get_group_by_path(key[len("group:"):]) or {}).get("id")
+        else:
+            value = None
+        if value is None:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+
+class Change:
+    """One write against Keycloak.
+
+    `run` receives the ids resolved so far ('group:/data', 'scope:groups',
+    'client:trino', ...) and returns the ids it creates. Changes of the same
+    stage are independent and run concurrently.
+    """
+
+    def __init__(self, stage: int, description: str, run: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]], calls: int = 1):
+        self.stage = stage
+        self.description = description
+        self.run = run
+        self.calls = calls
+
+
+class BootstrapPlan:
+    def __init__(self, kc: KeycloakClient, state: RealmState, changes: List[Change]):
+        self.kc = kc
+        self.state = state
+        self.changes = changes
+
+    @classmethod
+    def build(
+        cls,
+        kc: KeycloakClient,
+        realm_name: str,
+        trino_client_secret: str,
+        trino_redirect_uris: List[str],
+        trino_post_logout_uris: str,
+        max_workers: int = 4,
+    ) -> "BootstrapPlan":
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            state = RealmState.fetch(kc, realm_name, pool)
+        changes: List[Change] = []
+
+        for path in GROUP_PATHS:
+            if path in state.groups:
+                continue
+            parent = _parent_path(path)
+            changes.append(Change(
+                path.count("/") - 1,
+                f"create group {path}",
+                lambda ids, path=path, parent=parent: {f"group:{path}": _silent(
+                    kc.create_group,
+                    {"name": path.rsplit("/", 1)[1]},
+                    parent=ids[f"group:{parent}"] if parent else None,
+                )},
+            ))
+
+        if "groups" not in state.client_scopes:
+            changes.append(Change(0, "create client scope 'groups'", lambda ids: {
+                "scope:groups": _silent(kc.create_client_scope, GROUPS_CLIENT_SCOPE),
+            }))
+        if "groups" not in state.optional_client_scopes:
+            changes.append(Change(1, f"add 'groups' to realm '{realm_name}' default-optional client scopes", lambda ids: {
+                "scope:groups:optional": _silent(kc.add_default_optional_client_scope, ids["scope:groups"]),
+            }))
+
+        trino = state.clients.get("trino")
+        settings = trino_client_settings(trino_redirect_uris, trino_post_logout_uris)
+        if not trino:
+            changes.append(Change(0, "create client 'trino'", lambda ids: {
+                "client:trino": _silent(kc.create_client, trino_client_payload(
+                    trino_client_secret, trino_redirect_uris, trino_post_logout_uris,
+                )),
+            }))
+        elif not _is_subset(settings, trino):
+            changes.append(Change(0, "update client 'trino'", lambda ids: {
+                "client:trino:updated": _silent(kc.update_client, ids["client:trino"], settings),
+            }))
+
+        if not trino or not state.authz.get("resources"):
+            changes.append(Change(1, "create AuthZ default resource on 'trino'", lambda ids: {
+                "authz:resource": _silent(kc.create_client_authz_resource, ids["client:trino"], AUTHZ_DEFAULT_RESOURCE),
+            }))
+            changes.append(Change(1, "create AuthZ default policy on 'trino'", lambda ids: {
+                "authz:policy": _silent(kc.create_client_authz_policy, ids["client:trino"], AUTHZ_DEFAULT_POLICY),
+            }))
+            changes.append(Change(2, "create AuthZ default permission on 'trino'", lambda ids: {
+                "authz:permission": _silent(kc.create_client_authz_resource_based_permission, ids["client:trino"], AUTHZ_DEFAULT_PERMISSION),
+            }))
+
+        if SERVICE_ACCOUNT_ROLE not in state.client_roles:
+            changes.append(Change(1, f"create client role '{SERVICE_ACCOUNT_ROLE}' on 'trino'", lambda ids: {
+                f"role:{SERVICE_ACCOUNT_ROLE}:created": _silent(kc.create_client_role, ids["client:trino"], {"name": SERVICE_ACCOUNT_ROLE}),
+            }))
+        if SERVICE_ACCOUNT_ROLE not in state.service_account_roles:
+            lookups = int(state.service_account_user is None) + int(SERVICE_ACCOUNT_ROLE not in state.client_roles)
+
+            def assign(ids):
+                user = state.service_account_user or kc.get_client_service_account_user(ids["client:trino"])
+                role = state.client_roles.get(SERVICE_ACCOUNT_ROLE) or kc.get_client_role(ids["client:trino"], SERVICE_ACCOUNT_ROLE)
+                return {f"role:{SERVICE_ACCOUNT_ROLE}:assigned": _silent(
+                    kc.assign_client_role, user_id=user["id"], client_id=ids["client:trino"], roles=[role],
+                )}
+            changes.append(Change(2, f"assign '{SERVICE_ACCOUNT_ROLE}' to the 'trino' service account", assign, calls=1 + lookups))
+
+        if not _is_subset(OTP_POLICY, state.realm):
+            changes.append(Change(0, f"apply OTP policy on realm '{realm_name}'", lambda ids: {
+                "realm:otp": _silent(kc.update_realm, realm_name, OTP_POLICY),
+            }))
+
+        return cls(kc, state, changes)
+
+    def _initial_ids(self, kc: KeycloakClient) -> ResolvedIds:
+        ids = ResolvedIds(kc)
+        ids.update({f"group:{path}": gid for path, gid in self.state.groups.items()})
+        if "groups" in self.state.client_scopes:
+            ids["scope:groups"] = self.state.client_scopes["groups"]
+        if "trino" in self.state.clients:
+            ids["client:trino"] = self.state.clients["trino"]["id"]
+        return ids
+
+    def execute(self, max_workers: int = 4) -> Dict[str, Any]:
+        ids = self._initial_ids(self.kc)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for stage in sorted({change.stage for change in self.changes}):
+                batch = [change for change in self.changes if change.stage == stage]
+                for change, created in zip(batch, pool.map(lambda change: change.run(ids), batch)):
+                    logger.info("Applied: %s", change.description)
+                    ids.update({k: v for k, v in (created or {}).items() if v is not None})
+        return ids
+
+    def legacy_calls(self) -> int:
+        """Calls the former one-shot bootstrap made for the same realm state."""
+        state = self.state
+        existing = set(state.groups)
+        calls = 0
+
+        def find(path):
+            if path in existing:
+                return 1
+            # get_group_by_path, then list children segment by segment until the first miss
+            segments = path.strip("/").split("/")
+            walked = 0
+            for i in range(len(segments)):
+                walked += 1
+                if "/" + "/".join(segments[:i + 1]) not in existing:
+                    break
+            return 1 + walked
+
+        def ensure(path):
+            nonlocal calls
+            calls += find(path)
+            if path in existing:
+                return
+            parent = _parent_path(path)
+            if parent:
+                ensure(parent)
+            calls += 2
+            existing.add(path)
+
+        for path in GROUP_PATHS:
+            ensure(path)
+        calls += 1 + int("groups" not in state.client_scopes)
+        calls += 1 + 2 * int("groups" not in state.optional_client_scopes)
+        calls += 2
+        calls += 1 + 3 * int(not state.authz.get("resources"))
+        calls += 4 + int(SERVICE_ACCOUNT_ROLE not in state.client_roles)
+        calls += 1
+        return calls
+
+    def summary(self) -> Dict[str, Any]:
+        writes = sum(change.calls for change in self.changes)
+        return {
+            "changes": [
+                {"stage": change.stage, "description": change.description}
+                for change in sorted(self.changes, key=lambda change: change.stage)
+            ],
+            "read_calls": self.state.calls,
+            "write_calls": writes,
+            "legacy_calls": self.legacy_calls(),
+            "calls_saved": self.legacy_calls() - self.state.calls - writes,
+        }
@@ -0,0 +1,147 @@
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Tuple
+
+from keycloak import KeycloakAdmin
+
+from data_product_manager.metrics import OUTBOUND_CALL_DURATION
+
+
+logger = logging.getLogger("app.components.keycloak_client")
+
+DEFAULT_MAX_CONNECTIONS = 8
+DEFAULT_REFRESH_MARGIN = 30.0
+
+
+class KeycloakClient:
+    """Keycloak admin client meant to live as long as the application.
+
+    Wraps a single `KeycloakAdmin` so every caller shares its keep-alive HTTP
+    connection pool and its access token. The token is refreshed before it
+    expires (`refresh_margin` seconds ahead) instead of on a 401, and at most
+    `max_connections` admin calls are in flight at once.
+
+    Admin methods are called directly on the client, e.g. `client.get_groups()`.
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        username: str,
+        password: str,
+        realm_name: str = "master",
+        verify: bool = True,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+    ):
+        self.server_url = server_url
+        self.realm_name = realm_name
+        self.refresh_margin = refresh_margin
+        self.admin = KeycloakAdmin(
+            server_url=server_url,  # no '/auth' for KC >= 17
+            username=username,
+            password=password,
+            realm_name=realm_name,
+            user_realm_name=realm_name,
+            client_id="admin-cli",
+            verify=verify,
+            pool_maxsize=max_connections,
+        )
+        self._token_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._refresh_at = 0.0
+        self._refresh_expires_at = 0.0
+        self.token_requests = 0
+        self.calls = 0
+
+    def _ensure_token(self):
+        if time.monotonic() < self._refresh_at:
+            return
+        with self._token_lock:
+            now = time.monotonic()
+            if now < self._refresh_at:
+                return
+            connection = self.admin.connection
+            token = connection.token
+            if token and now < self._refresh_expires_at:
+                connection.refresh_token()
+                logger.debug("Refreshed Keycloak access token for %s.", self.server_url)
+            else:
+                connection.get_token()
+                logger.debug("Obtained Keycloak access token for %s.", self.server_url)
+            self.token_requests += 1
+            token = connection.token or {}
+            # refresh `refresh_margin` seconds early, but never sooner than half way through short-lived tokens
+            expires_in = token.get("expires_in", 0)
+            self._refresh_at = now + max(expires_in - self.refresh_margin, expires_in / 2)
+            refresh_expires_in = token.get("refresh_expires_in", 0)
+            self._refresh_expires_at = now + max(refresh_expires_in - self.refresh_margin, refresh_expires_in / 2)
+
+    def __getattr__(self, name: str) -> Any:
+        if self.admin is None:
+            raise RuntimeError(f"Keycloak client for {self.server_url} is closed.")
+        attr = getattr(self.admin, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._slots:
+                self._ensure_token()
+                self.calls += 1
+                with OUTBOUND_CALL_DURATION.time(target="keycloak", operation=name):
+                    return attr(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "server_url": self.server_url,
+            "realm": self.realm_name,
+            "token_requests": self.token_requests,
+            "calls": self.calls,
+        }
+
+    def close(self):
+        """Release the admin client, python-keycloak closes its HTTP session once it is garbage collected."""
+        self.admin = None
+
+
+_clients: Dict[Tuple[Any, ...], Tuple[KeycloakClient, str]] = {}
+_clients_lock = threading.Lock()
+
+
+def get_keycloak_client(
+    server_url: str,
+    username: str,
+    password: str,
+    realm_name: str = "master",
+    verify: bool = True,
+) -> KeycloakClient:
+    """Application-wide `KeycloakClient` for this account, created on first use.
+
+    Clients are keyed without the password: a call with another password
+    replaces the client of the account. Only a digest of the password is
+    kept to tell. The replaced client is not closed, callers may still be
+    using it: its connections go away with it once it is garbage collected.
+    """
+    key = (server_url, username, realm_name, verify)
+    digest = hashlib.sha256(password.encode()).hexdigest()
+    with _clients_lock:
+        client, known_digest = _clients.get(key, (None, None))
+        if client is not None and known_digest != digest:
+            logger.info("Credentials of %s on %s changed, replacing its Keycloak client.", username, server_url)
+            client = None
+        if client is None:
+            client = KeycloakClient(server_url, username, password, realm_name, verify)
+            _clients[key] = (client, digest)
+            logger.info("Created Keycloak client for %s (realm '%s').", server_url, realm_name)
+        return client
+
+
+def close_keycloak_clients():
+    with _clients_lock:
+        for client, _ in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,154 @@
+"""OPA bundle of the Trino row filters and column masks of every data product.
+
+The policies of config/opa/policies look up a nested data document,
+`data.trino.policies[catalog][schema][table]`, holding the row filters of
+the table and the masks of its columns, instead of matching one rule per
+table and column. This module generates that document from the dbt models
+of the data products: a model's `meta.row_filter` (one expression or a
+list) and its columns' `meta.mask`, for the dev and prd catalog of the
+product.
+
+The bundle is a gzipped tarball with the policies and the data document,
+its revision is the digest of its content. Point OPA at the manager with:
+
+    services:
+      manager:
+        url: http://<manager>/opa
+    bundles:
+      trino:
+        service: manager
+        resource: bundle.tar.gz
+        polling: {min_delay_seconds: 10, max_delay_seconds: 30}
+"""
+import io
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import tarfile
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from data_product_manager.componants.trino_catalog import catalog_name
+
+logger = logging.getLogger("app.components.opa_bundle")
+
+DATA_PATH = "trino/policies/data.json"
+ROOTS = ["trino"]
+ENVS = ("dev", "prd")
+TARGET_SCHEMA = "dbt"
+
+
+def product_policies(name: str, project: Dict[str, Any], envs: Iterable[str] = ENVS, target_schema: str = TARGET_SCHEMA) -> Dict[str, Any]:
+    """Policies of the tables of one data product, {catalog: {schema: {table: {"row_filters": [...], "columns": {...}}}}}.
+
+    `project` is the product's view in the dbt index. Tables without row
+    filter or column mask are left out, custom schemas are named like dbt's
+    default generate_schema_name does.
+    """
+    tables: Dict[str, Dict[str, Any]] = {}
+    for model in project["models"]:
+        if not model["row_filters"] and not model["column_masks"]:
+            continue
+        schema = f"{target_schema}_{model['schema']}" if model["schema"] else target_schema
+        tables.setdefault(schema, {})[model["relation"]] = {
+            "row_filters": [{"expression": expression} for expression in model["row_filters"]],
+            "columns": {column: {"expression": mask} for column, mask in sorted(model["column_masks"].items())},
+        }
+    return {catalog_name(name, env): tables for env in envs} if tables else {}
+
+
+class OpaBundle:
+    """The bundle of the policies of `policy_dir` and the data document of every data product, rebuilt incrementally.
+
+    The data document is assembled from one serialized fragment per
+    product, only recomputed when the product's dbt project changed: the
+    top-level keys of the document are catalogs, which belong to a single
+    product. The tarball is only rebuilt when the document or a policy file
+    changed.
+    """
+
+    def __init__(self, policy_dir: str):
+        self.policy_dir = policy_dir
+        self._lock = threading.Lock()
+        self._fragments: Dict[str, Tuple[Optional[Dict[str, Any]], bytes]] = {}
+        self._policy_files: Dict[str, Tuple[int, int, bytes]] = {}
+        self.revision: Optional[str] = None
+        self.content = b""
+        self.built_at: Optional[float] = None
+
+    def _read_policies(self) -> bool:
+        """Bring the policy files up to date, return whether any changed."""
+        seen = {}
+        for directory, _, filenames in os.walk(self.policy_dir):
+            for filename in filenames:
+                if not filename.endswith(".rego"):
+                    continue
+                path = os.path.join(directory, filename)
+                relative = os.path.relpath(path, self.policy_dir).replace(os.sep, "/")
+                st = os.stat(path)
+                known = self._policy_files.get(relative)
+                if known is None or known[:2] != (st.st_mtime_ns, st.st_size):
+                    with open(path, "rb") as f:
+                        known = (st.st_mtime_ns, st.st_size, f.read())
+                seen[relative] = known
+        changed = {k: v[2] for k, v in seen.items()} != {k: v[2] for k, v in self._policy_files.items()}
+        self._policy_files = seen
+        return changed
+
+    def _tarball(self, data: bytes) -> bytes:
+        files = {f"/{path}": content for path, (_, _, content) in sorted(self._policy_files.items())}
+        files[f"/{DATA_PATH}"] = data
+        digest = hashlib.sha256()
+        for path, content in files.items():
+            digest.update(path.encode() + b"\0" + hashlib.sha256(content).digest())
+        revision = digest.hexdigest()[:32]
+        files = {"/.manifest": json.dumps({"revision": revision, "roots": ROOTS}).encode(), **files}
+
+        buffer = io.BytesIO()
+        # fixed mtimes: the same content always gives the same bytes
+        with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as gz, tarfile.open(fileobj=gz, mode="w") as tar:
+            for path, content in files.items():
+                info = tarfile.TarInfo(path)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        self.revision = revision
+        return buffer.getvalue()
+
+    def update(self, projects: Dict[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Rebuild the bundle for `projects` ({data product: dbt index view or None}) where they changed."""
+        with self._lock:
+            start = time.perf_counter()
+            changed = [name for name in self._fragments if name not in projects]
+            for name in changed:
+                del self._fragments[name]
+            for name, project in projects.items():
+                known = self._fragments.get(name)
+                # index views are rebuilt as new objects when their files change
+                if known is not None and known[0] is project:
+                    continue
+                policies = product_policies(name, project) if project is not None else {}
+                fragment = json.dumps(policies, sort_keys=True, separators=(",", ":"))[1:-1].encode()
+                if known is None or known[1] != fragment:
+                    changed.append(name)
+                self._fragments[name] = (project, fragment)
+            policies_changed = self._read_policies()
+            if changed or policies_changed or self.built_at is None:
+                data = b"{" + b",".join(f for _, (_, f) in sorted(self._fragments.items()) if f) + b"}"
+                self.content = self._tarball(data)
+                self.built_at = time.time()
+                logger.info("Built OPA bundle %s: %s data products changed.", self.revision, len(changed))
+            return {
+                "revision": self.revision,
+                "changed": sorted(changed),
+                "policies_changed": policies_changed,
+                "bytes": len(self.content),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            }
+
+    def current(self) -> Tuple[Optional[str], bytes]:
+        """Revision and tarball of the last build."""
+        with self._lock:
+            return self.revision, self.content
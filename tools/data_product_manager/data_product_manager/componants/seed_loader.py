@@ -0,0 +1,247 @@
+"""Bulk load of dbt seeds into Iceberg tables, without going through Trino.
+
+`dbt seed` loads seeds with batched `INSERT ... VALUES` statements. Here each
+seed CSV is streamed in column batches into typed Parquet files under the
+data product's warehouse prefix, then committed as a new snapshot of its
+Iceberg table and registered in the JDBC catalog, the way Trino would.
+
+Needs pyarrow: pip install 'data-product-manager[seeds]'.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.fs as pa_fs
+    import pyarrow.parquet as pq
+except ImportError as exc:
+    raise ImportError("Loading seeds needs pyarrow: pip install 'data-product-manager[seeds]'") from exc
+
+from data_product_manager.componants import iceberg
+from data_product_manager.componants.trino_catalog import CatalogSettings
+
+logger = logging.getLogger("app.components.seed_loader")
+
+BLOCK_SIZE = 16 * 1024 * 1024
+TARGET_FILE_BYTES = 256 * 1024 * 1024
+DECIMAL = re.compile(r"(?:decimal|numeric)\s*\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\)")
+# Trino types of dbt `column_types`, as read from the CSV
+ARROW_TYPES = {
+    "varchar": pa.string(),
+    "char": pa.string(),
+    "string": pa.string(),
+    "tinyint": pa.int64(),
+    "smallint": pa.int64(),
+    "integer": pa.int64(),
+    "int": pa.int64(),
+    "bigint": pa.int64(),
+    "real": pa.float64(),
+    "double": pa.float64(),
+    "float": pa.float64(),
+    "boolean": pa.bool_(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+    "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+}
+
+
+def arrow_type(column_type: str) -> pa.DataType:
+    """Arrow type to read a CSV column as, from its dbt `column_types` entry."""
+    normalized = " ".join(column_type.lower().split())
+    decimal = DECIMAL.fullmatch(normalized)
+    if decimal:
+        return pa.decimal128(int(decimal.group(1)), int(decimal.group(2) or 0))
+    # precision and length are not kept: varchar(20), timestamp(6) with time zone
+    normalized = re.sub(r"\s*\(\s*\d+\s*\)", "", normalized)
+    if normalized not in ARROW_TYPES:
+        raise ValueError(f"Unsupported seed column type {column_type}.")
+    return ARROW_TYPES[normalized]
+
+
+def iceberg_type(arrow_type: pa.DataType) -> Tuple[str, pa.DataType]:
+    """Iceberg type of a column inferred by the CSV reader, and the Arrow type it is written as."""
+    if pa.types.is_integer(arrow_type):
+        return "long", pa.int64()
+    if pa.types.is_floating(arrow_type):
+        return "double", pa.float64()
+    if pa.types.is_boolean(arrow_type):
+        return "boolean", pa.bool_()
+    if pa.types.is_timestamp(arrow_type):
+        if arrow_type.tz is not None:
+            return "timestamptz", pa.timestamp("us", tz="UTC")
+        return "timestamp", pa.timestamp("us")
+    if pa.types.is_date(arrow_type):
+        return "date", pa.date32()
+    if pa.types.is_decimal(arrow_type) and arrow_type.precision <= 38:
+        return f"decimal({arrow_type.precision},{arrow_type.scale})", pa.decimal128(arrow_type.precision, arrow_type.scale)
+    return "string", pa.string()
+
+
+def _fs_path(location: str) -> str:
+    return location.split("://", 1)[1] if "://" in location else location
+
+
+def open_warehouse(settings: CatalogSettings, location: str) -> pa_fs.FileSystem:
+    """File system holding the warehouse `location`: S3 (MinIO) settings for s3:// locations, local files otherwise."""
+    if location.startswith("s3://"):
+        return pa_fs.S3FileSystem(
+            access_key=settings.s3_access_key,
+            secret_key=settings.s3_secret_key,
+            region=settings.s3_region,
+            endpoint_override=settings.s3_endpoint,
+        )
+    return pa_fs.LocalFileSystem()
+
+
+def connect_catalog(url: str):
+    """DB-API connection to the catalog database: `sqlite:///<path>` or a `postgresql://` URL (needs psycopg)."""
+    if url.startswith("sqlite:///"):
+        return sqlite3.connect(url[len("sqlite:///"):])
+    if url.startswith(("postgresql://", "postgres://")):
+        try:
+            import psycopg
+        except ImportError as exc:
+            raise ImportError("Registering tables in PostgreSQL needs psycopg: pip install 'data-product-manager[seeds]'") from exc
+        return psycopg.connect(url)
+    raise ValueError(f"Unsupported catalog database URL {url}.")
+
+
+def catalog_url(settings: CatalogSettings) -> str:
+    """The catalog database of the generated Trino catalogs, from their JDBC URL."""
+    scheme, _, rest = settings.jdbc_url.removeprefix("jdbc:").partition("://")
+    return f"{scheme}://{settings.jdbc_user}:{settings.jdbc_password}@{rest}"
+
+
+class SeedLoader:
+    """Loads seed CSVs as Iceberg tables of one catalog, under the `location` warehouse prefix.
+
+    Each load replaces the content of the table with a new snapshot, the
+    schema keeps the field ids of existing columns and adds new ones.
+    """
+
+    def __init__(
+        self,
+        fs: pa_fs.FileSystem,
+        location: str,
+        catalog: iceberg.JdbcCatalog,
+        namespace: str = "dbt",
+        block_size: int = BLOCK_SIZE,
+        target_file_bytes: int = TARGET_FILE_BYTES,
+    ):
+        self.fs = fs
+        self.location = location.rstrip("/")
+        self.catalog = catalog
+        self.namespace = namespace
+        self.block_size = block_size
+        self.target_file_bytes = target_file_bytes
+
+    def _data_file(self, table_location: str, path: str, field_ids: List[int]) -> Dict[str, Any]:
+        """data_file record of the Parquet file at `path`, from its footer."""
+        with self.fs.open_input_file(path) as f:
+            size = f.size()
+            meta = pq.read_metadata(f)
+        column_sizes, null_counts = dict.fromkeys(field_ids, 0), dict.fromkeys(field_ids, 0)
+        for i in range(meta.num_row_groups):
+            row_group = meta.row_group(i)
+            for j, field_id in enumerate(field_ids):
+                column = row_group.column(j)
+                column_sizes[field_id] += column.total_compressed_size
+                if column.statistics is not None and column.statistics.has_null_count:
+                    null_counts[field_id] += column.statistics.null_count
+        return {
+            "content": 0,
+            "file_path": f"{table_location}/data/{os.path.basename(path)}",
+            "file_format": "PARQUET",
+            "partition": {},
+            "record_count": meta.num_rows,
+            "file_size_in_bytes": size,
+            "column_sizes": column_sizes,
+            "value_counts": dict.fromkeys(field_ids, meta.num_rows),
+            "null_value_counts": null_counts,
+        }
+
+    def load(self, csv_path: str, table: Optional[str] = None, column_types: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Load one seed CSV, into the table named after the file by default, like dbt does.
+
+        `column_types` are the seed's dbt `column_types`, other columns are
+        typed from the first block of the file.
+        """
+        table = table or os.path.splitext(os.path.basename(csv_path))[0]
+        start = time.perf_counter()
+        previous = self.catalog.metadata_location(self.namespace, table)
+        metadata = None
+        if previous is not None:
+            with self.fs.open_input_stream(_fs_path(previous)) as f:
+                metadata = json.loads(f.read())
+        table_location = metadata["location"] if metadata else f"{self.location}/{self.namespace}/{table}-{uuid.uuid4().hex}"
+
+        reader = pa_csv.open_csv(
+            csv_path,
+            read_options=pa_csv.ReadOptions(block_size=self.block_size),
+            # empty fields are NULL, like dbt seeds
+            convert_options=pa_csv.ConvertOptions(
+                strings_can_be_null=True,
+                column_types={name: arrow_type(kind) for name, kind in (column_types or {}).items()},
+            ),
+        )
+        columns = [(field.name, *iceberg_type(field.type)) for field in reader.schema]
+        schema, last_column_id = iceberg.evolve_schema(metadata, [(name, kind) for name, kind, _ in columns])
+        field_ids = [field["id"] for field in schema["fields"]]
+        arrow_schema = pa.schema([
+            pa.field(name, arrow_type, metadata={b"PARQUET:field_id": str(field_id).encode()})
+            for (name, _, arrow_type), field_id in zip(columns, field_ids)
+        ])
+
+        for directory in ("data", "metadata"):
+            self.fs.create_dir(f"{_fs_path(table_location)}/{directory}", recursive=True)
+        data_files: List[Dict[str, Any]] = []
+        written: List[str] = []
+        writer, file_bytes, commit = None, 0, uuid.uuid4().hex
+        try:
+            for batch in reader:
+                if writer is None:
+                    written.append(f"{_fs_path(table_location)}/data/{commit}-{len(written):05d}.parquet")
+                    writer = pq.ParquetWriter(written[-1], arrow_schema, filesystem=self.fs, compression="zstd")
+                    file_bytes = 0
+                batch = pa.Table.from_batches([batch]).cast(arrow_schema)
+                writer.write_table(batch)
+                file_bytes += batch.nbytes
+                if file_bytes >= self.target_file_bytes:
+                    writer.close()
+                    writer = None
+                    data_files.append(self._data_file(table_location, written[-1], field_ids))
+            if writer is not None:
+                writer.close()
+                writer = None
+                data_files.append(self._data_file(table_location, written[-1], field_ids))
+
+            metadata, metadata_location = iceberg.commit_snapshot(
+                self.catalog, self.namespace, table,
+                self.fs, _fs_path(table_location), metadata, previous, table_location, schema, last_column_id, data_files,
+            )
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            for path in written:
+                try:
+                    self.fs.delete_file(path)
+                except OSError:
+                    pass
+            raise
+        report = {
+            "table": f"{self.namespace}.{table}",
+            "rows": sum(f["record_count"] for f in data_files),
+            "files": len(data_files),
+            "bytes": sum(f["file_size_in_bytes"] for f in data_files),
+            "duration_s": round(time.perf_counter() - start, 3),
+            "metadata_location": metadata_location,
+        }
+        logger.info("Loaded seed %s into %s: %s rows in %s files.", csv_path, report["table"], report["rows"], report["files"])
+        return report
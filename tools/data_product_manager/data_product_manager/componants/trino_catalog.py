@@ -0,0 +1,196 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+logger = logging.getLogger("app.components.trino_catalog")
+
+ENVIRONMENTS = ("dev", "prd")
+MANIFEST_NAME = ".generated_catalogs.json"
+
+CATALOG_TEMPLATE = """\
+connector.name=iceberg
+iceberg.file-format=PARQUET
+
+iceberg.catalog.type=jdbc
+iceberg.jdbc-catalog.catalog-name={catalog_name}
+iceberg.jdbc-catalog.driver-class=org.postgresql.Driver
+iceberg.jdbc-catalog.connection-url={jdbc_url}
+iceberg.jdbc-catalog.connection-user={jdbc_user}
+iceberg.jdbc-catalog.connection-password={jdbc_password}
+iceberg.jdbc-catalog.default-warehouse-dir={warehouse}
+
+fs.native-s3.enabled=true
+s3.endpoint={s3_endpoint}
+s3.region={s3_region}
+s3.path-style-access=true
+s3.aws-access-key={s3_access_key}
+s3.aws-secret-key={s3_secret_key}
+"""
+
+
+class CatalogSettings:
+    """Connection settings shared by every generated catalog, defaults match config/trino/catalog/mydata.properties."""
+
+    def __init__(
+        self,
+        warehouse_root: str = "s3://warehouse",
+        jdbc_url: str = "jdbc:postgresql://postgres:5432/metastore_db",
+        jdbc_user: str = "admin",
+        jdbc_password: str = "admin",
+        s3_endpoint: str = "http://minio:9000",
+        s3_region: str = "eu-west-1",
+        s3_access_key: str = "minioadmin",
+        s3_secret_key: str = "minioadmin",
+    ):
+        self.warehouse_root = warehouse_root.rstrip("/")
+        self.jdbc_url = jdbc_url
+        self.jdbc_user = jdbc_user
+        self.jdbc_password = jdbc_password
+        self.s3_endpoint = s3_endpoint
+        self.s3_region = s3_region
+        self.s3_access_key = s3_access_key
+        self.s3_secret_key = s3_secret_key
+
+    @classmethod
+    def from_env(cls) -> "CatalogSettings":
+        defaults = cls()
+        return cls(**{
+            attr: os.environ.get(f"TRINO_CATALOG_{attr.upper()}", getattr(defaults, attr))
+            for attr in vars(defaults)
+        })
+
+
+def catalog_name(name: str, env: str) -> str:
+    return f"dp_{name}_{env}"
+
+
+def warehouse_location(settings: CatalogSettings, domain: str, name: str, env: str) -> str:
+    return f"{settings.warehouse_root}/{domain}/{name}/{env}"
+
+
+def render_catalog(settings: CatalogSettings, domain: str, name: str, env: str) -> str:
+    return CATALOG_TEMPLATE.format(
+        catalog_name=catalog_name(name, env),
+        warehouse=warehouse_location(settings, domain, name, env),
+        jdbc_url=settings.jdbc_url,
+        jdbc_user=settings.jdbc_user,
+        jdbc_password=settings.jdbc_password,
+        s3_endpoint=settings.s3_endpoint,
+        s3_region=settings.s3_region,
+        s3_access_key=settings.s3_access_key,
+        s3_secret_key=settings.s3_secret_key,
+    )
+
+
+def _digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class CatalogDirectory:
+    """Trino catalog directory holding generated `<catalog>.properties` files.
+
+    Tracks the hash of every file it wrote in a manifest next to them, so a
+    sync only rewrites files whose rendered content changed. Files are
+    replaced atomically, and hand-written catalogs (not in the manifest) are
+    never touched.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    def _load_manifest(self) -> Dict[str, List]:
+        try:
+            with open(self._manifest_path(), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, List]):
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, sort_keys=True)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _current_digest(self, filename: str, recorded: Optional[List]) -> Optional[str]:
+        """Digest of the file on disk, trusting the manifest while size and mtime are unchanged."""
+        try:
+            st = os.stat(os.path.join(self.path, filename))
+        except FileNotFoundError:
+            return None
+        if recorded and recorded[1:] == [st.st_size, st.st_mtime_ns]:
+            return recorded[0]
+        with open(os.path.join(self.path, filename), "rb") as f:
+            return _digest(f.read())
+
+    def _write(self, filename: str, content: bytes) -> List:
+        file_path = os.path.join(self.path, filename)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+        st = os.stat(file_path)
+        return [_digest(content), st.st_size, st.st_mtime_ns]
+
+    def sync(self, files: Dict[str, str], prune: bool = False) -> Dict[str, List[str]]:
+        """Write `files` ({filename: content}) where their content changed.
+
+        With `prune`, generated files that are not in `files` anymore are
+        removed. Returns the written, unchanged and removed file names.
+        """
+        written, unchanged, removed = [], [], []
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            manifest = self._load_manifest()
+            for filename, text in sorted(files.items()):
+                content = text.encode()
+                if self._current_digest(filename, manifest.get(filename)) == _digest(content):
+                    unchanged.append(filename)
+                    continue
+                manifest[filename] = self._write(filename, content)
+                written.append(filename)
+            if prune:
+                for filename in sorted(set(manifest) - set(files)):
+                    try:
+                        os.remove(os.path.join(self.path, filename))
+                    except FileNotFoundError:
+                        pass
+                    del manifest[filename]
+                    removed.append(filename)
+            if written or removed:
+                self._save_manifest(manifest)
+        if written or removed:
+            logger.info("Synced Trino catalogs in %s: %s written, %s removed, %s unchanged.", self.path, len(written), len(removed), len(unchanged))
+        return {"written": written, "unchanged": unchanged, "removed": removed}
+
+    def existing(self, env: str) -> Set[str]:
+        """Names of the data products with a catalog file for `env`, none if the directory does not exist yet."""
+        prefix, suffix = "dp_", f"_{env}.properties"
+        try:
+            with os.scandir(self.path) as entries:
+                return {
+                    entry.name[len(prefix):-len(suffix)] for entry in entries
+                    if entry.name.startswith(prefix) and entry.name.endswith(suffix)
+                }
+        except FileNotFoundError:
+            return set()
+
+
+def render_catalogs(
+    settings: CatalogSettings,
+    products: Iterable[Tuple[str, str]],
+    environments: Iterable[str] = ENVIRONMENTS,
+) -> Dict[str, str]:
+    """{filename: content} of the catalogs of every (domain, name) product."""
+    return {
+        f"{catalog_name(name, env)}.properties": render_catalog(settings, domain, name, env)
+        for domain, name in products
+        for env in environments
+    }
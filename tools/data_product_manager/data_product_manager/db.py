@@ -0,0 +1,847 @@
+import os
+import json
+import bisect
+import itertools
+import sqlite3
+import sys
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import pydantic
+
+from data_product_manager.metrics import DB_OPERATION_DURATION, DB_ROWS, Gauge
+
+logger = logging.getLogger("app.db")
+
+DEFAULT_DB_PATH = "./products_db.sqlite"
+DEFAULT_LEGACY_DB_PATH = "./products_db.json"
+
+
+class DataProductState(pydantic.BaseModel):
+    name: str
+    domain: str
+    description: str
+    admin_emails: List[str]
+
+    code_repository: bool = False
+    keycloak_group: bool = False
+    keycloak_domain_group: bool = False
+    keycloak_product_group: bool = False
+    trino_dev_catalog: bool = False
+    trino_prd_catalog: bool = False
+
+
+class DataProductChange(pydantic.BaseModel):
+    seq: int
+    op: str  # insert | update
+    name: str
+    at: float
+    data_product: DataProductState
+
+
+class ProvisioningJob(pydantic.BaseModel):
+    id: str
+    data_product: str
+    domain: str
+    status: str = "queued"  # queued | running | succeeded | failed
+    step: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+FLAG_FIELDS = [
+    field_name
+    for field_name, field in DataProductState.model_fields.items()
+    if field.annotation is bool
+]
+COLUMNS = ["name", "domain", "description", "admin_emails", *FLAG_FIELDS]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS data_products (
+    name TEXT PRIMARY KEY,
+    domain TEXT NOT NULL,
+    description TEXT NOT NULL,
+    admin_emails TEXT NOT NULL,
+    {", ".join(f"{flag} INTEGER NOT NULL DEFAULT 0" for flag in FLAG_FIELDS)},
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    data_product TEXT NOT NULL,
+    state TEXT NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    owner INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_unfinished ON jobs (finished, data_product);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    name TEXT NOT NULL,
+    at REAL NOT NULL,
+    state TEXT NOT NULL
+);
+"""
+# columns added after the first release of the SQLite store
+MIGRATIONS = [
+    ("data_products", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("jobs", "owner", "INTEGER"),
+]
+BUMP_VERSION = "UPDATE meta SET value = value + 1 WHERE key = 'version' RETURNING value"
+READ_VERSION = "SELECT value FROM meta WHERE key = 'version'"
+READ_LAST_SEQ = "SELECT COALESCE(MAX(seq), 0) FROM changes"
+PUT_JOB = "INSERT OR REPLACE INTO jobs (id, data_product, state, finished, owner) VALUES (?, ?, ?, ?, ?)"
+CHANGES_RETENTION = int(os.environ.get("CHANGES_RETENTION", "100000"))
+BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", "30"))
+
+
+_initialized: set = set()
+
+
+def _store_key(path: str) -> Optional[Tuple[str, int]]:
+    try:
+        return os.path.realpath(path), os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _connect(path: str, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, timeout=BUSY_TIMEOUT, **kwargs)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if _store_key(path) in _initialized:
+        return conn
+    # schema setup takes the write lock, only do it on the first connection of the process
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    for table, column, definition in MIGRATIONS:
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError as exc:
+                # another process added it first
+                if "duplicate column" not in str(exc):
+                    raise
+    _initialized.add(_store_key(path))
+    return conn
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class DataProductExistsError(KeyError):
+    def __init__(self, name: str):
+        super().__init__(f"Data product {name} already exists in database.")
+        self.name = name
+
+
+class ChangesExpiredError(LookupError):
+    def __init__(self, since: int, oldest: int):
+        super().__init__(f"Changes after {since} are no longer retained, the oldest retained change is {oldest}.")
+        self.since = since
+        self.oldest = oldest
+
+
+def _journal(conn: sqlite3.Connection, entries: List[Tuple[str, DataProductState]]) -> int:
+    """Append changes to the journal within the caller's write transaction and trim it to CHANGES_RETENTION.
+
+    Returns the last sequence number.
+    """
+    at = time.time()
+    conn.executemany(
+        "INSERT INTO changes (op, name, at, state) VALUES (?, ?, ?, ?)",
+        [(op, dp.name, at, dp.model_dump_json()) for op, dp in entries],
+    )
+    seq = conn.execute(READ_LAST_SEQ).fetchone()[0]
+    conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGES_RETENTION,))
+    return seq
+
+
+class ChangeNotifier:
+    """Wakes up the long-polling readers of the change journal of this process.
+
+    Writers of other processes do not notify, waiters also re-check the
+    journal every `poll_interval` seconds to see their changes.
+    """
+
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self._seq = 0
+        self._changed = threading.Condition()
+
+    def notify(self, seq: int):
+        with self._changed:
+            self._seq = max(self._seq, seq)
+            self._changed.notify_all()
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """Wait until a change after `since` is notified or the poll interval elapses."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._seq > since, timeout=min(timeout, self.poll_interval))
+
+
+CHANGES = ChangeNotifier(poll_interval=float(os.environ.get("CHANGES_POLL_INTERVAL", "1")))
+
+
+def _to_row(dp: DataProductState) -> tuple:
+    return (
+        dp.name,
+        dp.domain,
+        dp.description,
+        json.dumps(dp.admin_emails),
+        *(int(getattr(dp, flag)) for flag in FLAG_FIELDS),
+    )
+
+
+def _job_row(job: ProvisioningJob) -> tuple:
+    return job.id, job.data_product, job.model_dump_json(), int(job.status in ("succeeded", "failed")), os.getpid()
+
+
+def _to_column(field: str, value: Any) -> Any:
+    if field == "admin_emails":
+        return json.dumps(value)
+    if field in FLAG_FIELDS:
+        return int(value)
+    return value
+
+
+FLAG_BITS = {flag: 1 << i for i, flag in enumerate(FLAG_FIELDS)}
+
+
+def _encode_str(value: str) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class DataProductRecord:
+    """Compact read-only data product, the form records take in snapshots.
+
+    The state flags are packed in one int and admin_emails stays in its
+    stored JSON form. Fields read like on DataProductState; `state()`
+    builds the model and `encoded()` the NDJSON line, only when asked for,
+    the line is cached.
+    """
+    __slots__ = ("name", "domain", "description", "emails_json", "flags", "_encoded")
+
+    def __init__(self, name: str, domain: str, description: str, emails_json: str, flags: int):
+        self.name = name
+        # few distinct domains, share their strings
+        self.domain = sys.intern(domain)
+        self.description = description
+        self.emails_json = emails_json
+        self.flags = flags
+        self._encoded: Optional[bytes] = None
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "DataProductRecord":
+        name, domain, description, admin_emails, *flags = row
+        return cls(name, domain, description, admin_emails, sum(bit for bit, value in zip(FLAG_BITS.values(), flags) if value))
+
+    @classmethod
+    def from_state(cls, dp: DataProductState) -> "DataProductRecord":
+        return cls(dp.name, dp.domain, dp.description, json.dumps(dp.admin_emails), sum(bit for flag, bit in FLAG_BITS.items() if getattr(dp, flag)))
+
+    @property
+    def admin_emails(self) -> List[str]:
+        return json.loads(self.emails_json)
+
+    def state(self) -> DataProductState:
+        return DataProductState.model_construct(
+            name=self.name,
+            domain=self.domain,
+            description=self.description,
+            admin_emails=self.admin_emails,
+            **{flag: bool(self.flags & bit) for flag, bit in FLAG_BITS.items()},
+        )
+
+    def encoded(self) -> bytes:
+        """The record as one line of JSON, newline included."""
+        if self._encoded is None:
+            self._encoded = (
+                f'{{"name":{_encode_str(self.name)},"domain":{_encode_str(self.domain)},'
+                f'"description":{_encode_str(self.description)},"admin_emails":{self.emails_json}'
+                + "".join(f',"{flag}":{"true" if self.flags & bit else "false"}' for flag, bit in FLAG_BITS.items())
+                + "}\n"
+            ).encode()
+        return self._encoded
+
+
+for _flag, _bit in FLAG_BITS.items():
+    setattr(DataProductRecord, _flag, property(lambda self, bit=_bit: bool(self.flags & bit)))
+
+
+def _from_row(row: tuple) -> DataProductState:
+    name, domain, description, admin_emails, *flags = row
+    return DataProductState.model_construct(
+        name=name,
+        domain=domain,
+        description=description,
+        admin_emails=json.loads(admin_emails),
+        **{flag: bool(value) for flag, value in zip(FLAG_FIELDS, flags)},
+    )
+
+
+class DataProducts(Mapping[str, DataProductState]):
+    """Read-through view over the data_products table.
+
+    Point lookups hit the primary key index, records that were already read or
+    staged in the current session are served from memory.
+    """
+
+    def __init__(self, db: "LocalDB"):
+        self._db = db
+
+    def __getitem__(self, name: str) -> DataProductState:
+        dp = self._db._get(name)
+        if dp is None:
+            raise KeyError(name)
+        return dp
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self._db._get(name) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        names = [row[0] for row in self._db._conn.execute("SELECT name FROM data_products ORDER BY name")]
+        known = set(names)
+        pending = [name for name in self._db._dirty if name not in known]
+        return iter(sorted(names + pending) if pending else names)
+
+    def __len__(self) -> int:
+        count = self._db._conn.execute("SELECT COUNT(*) FROM data_products").fetchone()[0]
+        return count + sum(1 for name in self._db._dirty if name not in self._db._persisted)
+
+
+class LocalDB(pydantic.BaseModel):
+    """Data product registry stored in SQLite (WAL mode).
+
+    Keeps the insert / update / flush API of the former JSON file store:
+    records are read on demand and only the records touched since the last
+    flush are written back.
+
+    Several processes can share the store. A flush is one write transaction,
+    new records are plain inserts (a name taken by another writer raises
+    DataProductExistsError) and updated records only write the fields that
+    were changed, guarded by a per-record version: when another writer
+    updated the record in between, the changes are applied on top of its
+    state instead of overwriting it.
+    """
+    path: str = DEFAULT_DB_PATH
+    legacy_path: Optional[str] = DEFAULT_LEGACY_DB_PATH
+
+    _conn: Optional[sqlite3.Connection] = pydantic.PrivateAttr(default=None)
+    _cache: Dict[str, DataProductState] = pydantic.PrivateAttr(default_factory=dict)
+    _dirty: Dict[str, DataProductState] = pydantic.PrivateAttr(default_factory=dict)
+    _changes: Dict[str, Dict[str, Any]] = pydantic.PrivateAttr(default_factory=dict)
+    _versions: Dict[str, int] = pydantic.PrivateAttr(default_factory=dict)
+    _persisted: set = pydantic.PrivateAttr(default_factory=set)
+    _jobs: Dict[str, ProvisioningJob] = pydantic.PrivateAttr(default_factory=dict)
+
+    @property
+    def data_products(self) -> DataProducts:
+        return DataProducts(self)
+
+    def connect(self):
+        if self._conn is not None:
+            return
+        self._conn = _connect(self.path)
+
+    def close(self):
+        if self._conn is None:
+            return
+        self._conn.close()
+        self._conn = None
+        self._cache.clear()
+        self._versions.clear()
+        self._persisted.clear()
+
+    def load(self):
+        self.connect()
+        self._cache.clear()
+        self._dirty.clear()
+        self._changes.clear()
+        self._jobs.clear()
+        self._versions.clear()
+        self._persisted.clear()
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            self.migrate_from_json(self.legacy_path)
+        logger.debug("Opened database %s.", self.path)
+
+    def migrate_from_json(self, path: str):
+        """Import a products_db.json file written by the former JSON store.
+
+        Records already present in the database are left untouched. The JSON
+        file is renamed with a `.migrated` suffix so the import runs once.
+        """
+        with open(path, "r") as f:
+            raw = json.load(f).get("data_products", {})
+        rows = [_to_row(DataProductState(**dp)) for dp in raw.values()]
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO data_products ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+            self._conn.execute(BUMP_VERSION).fetchone()
+        os.replace(path, f"{path}.migrated")
+        logger.info("Migrated %s data products from %s to %s.", len(rows), path, self.path)
+
+    def save(self):
+        if not self._dirty:
+            return
+        versions, merged, journal = {}, 0, []
+        with DB_OPERATION_DURATION.time(operation="save"), self._conn:
+            # take the write lock up front, so the transaction cannot fail half way on a busy store
+            self._conn.execute("BEGIN IMMEDIATE")
+            for name, dp in self._dirty.items():
+                if name not in self._persisted:
+                    try:
+                        self._conn.execute(
+                            f"INSERT INTO data_products ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                            _to_row(dp),
+                        )
+                    except sqlite3.IntegrityError:
+                        # inserted by another writer since the in-memory check, drop it so the other records can be saved
+                        del self._dirty[name]
+                        self._changes.pop(name, None)
+                        self._jobs.pop(name, None)
+                        raise DataProductExistsError(name)
+                    versions[name] = 1
+                    journal.append(("insert", dp))
+                    continue
+                changes = self._changes.get(name, {})
+                assignments = ", ".join([f"{field} = ?" for field in changes] + ["version = version + 1"])
+                values = [_to_column(field, value) for field, value in changes.items()]
+                row = self._conn.execute(
+                    f"UPDATE data_products SET {assignments} WHERE name = ? AND version = ? RETURNING version",
+                    (*values, name, self._versions.get(name, 1)),
+                ).fetchone()
+                if row is None:
+                    # updated by another writer since it was read: apply our changes on top of its state
+                    merged += 1
+                    row = self._conn.execute(
+                        f"UPDATE data_products SET {assignments} WHERE name = ? RETURNING version, {', '.join(COLUMNS)}",
+                        (*values, name),
+                    ).fetchone()
+                    if row is None:
+                        raise KeyError(f"Data product {name} not found in database.")
+                    for field, value in _from_row(row[1:]):
+                        setattr(dp, field, value)
+                versions[name] = row[0]
+                journal.append(("update", dp))
+            self._conn.executemany(PUT_JOB, [_job_row(job) for job in self._jobs.values()])
+            seq = _journal(self._conn, journal)
+            version = self._conn.execute(BUMP_VERSION).fetchone()[0]
+        CHANGES.notify(seq)
+        DB_ROWS.observe(len(versions), operation="save")
+        SNAPSHOTS.write_through(self.path, version, self._dirty.values())
+        self._versions.update(versions)
+        self._persisted.update(self._dirty)
+        self._dirty.clear()
+        self._changes.clear()
+        self._jobs.clear()
+        if merged:
+            logger.info("Merged %s concurrent updates while saving to %s.", merged, self.path)
+        logger.debug("Saved %s data products to %s.", len(versions), self.path)
+
+    def _get(self, name: str) -> Optional[DataProductState]:
+        if name in self._dirty:
+            return self._dirty[name]
+        if name in self._cache:
+            return self._cache[name]
+        with DB_OPERATION_DURATION.time(operation="get"):
+            row = self._conn.execute(
+                f"SELECT version, {', '.join(COLUMNS)} FROM data_products WHERE name = ?",
+                (name,),
+            ).fetchone()
+        if row is None:
+            return None
+        dp = self._cache[name] = _from_row(row[1:])
+        self._versions[name] = row[0]
+        self._persisted.add(name)
+        return dp
+
+    def insert(self, dp: DataProductState, job: Optional[ProvisioningJob] = None):
+        """Stage a new data product, and optionally its provisioning job, both written by the next save."""
+        if dp.name in self.data_products:
+            raise DataProductExistsError(dp.name)
+        self._dirty[dp.name] = dp
+        if job is not None:
+            self._jobs[dp.name] = job
+        logger.debug("Inserted data product %s into database.", dp.name)
+
+    def update(self, dp: str, **kwargs):
+        state = self._get(dp)
+        if state is None:
+            raise KeyError(f"Data product {dp} not found in database.")
+        unknown = set(kwargs) - set(DataProductState.model_fields)
+        if unknown:
+            raise ValueError(f"Unknown data product fields {sorted(unknown)}.")
+        # records are read without validation, validate the ones that are changed
+        validated = DataProductState.model_validate({**state.__dict__, **kwargs})
+        for k in kwargs:
+            setattr(state, k, getattr(validated, k))
+        self._changes.setdefault(dp, {}).update(kwargs)
+        self._dirty[dp] = state
+        logger.debug("Updated data product %s with %s.", dp, kwargs)
+
+    def put_job(self, job: ProvisioningJob):
+        """Upsert a provisioning job, owned by this process. Unlike data products, jobs are written immediately."""
+        self._conn.execute(PUT_JOB, _job_row(job))
+
+    def claim_job(self, job_id: str) -> bool:
+        """Take ownership of an unfinished job unless another live process owns it.
+
+        Owners are process ids, the store being a local file all its writers
+        run on the same host.
+        """
+        row = self._conn.execute("SELECT owner FROM jobs WHERE id = ? AND finished = 0", (job_id,)).fetchone()
+        if row is None:
+            return False
+        owner = row[0]
+        if owner is not None and owner != os.getpid() and _process_alive(owner):
+            return False
+        claimed = self._conn.execute(
+            "UPDATE jobs SET owner = ? WHERE id = ? AND finished = 0 AND owner IS ?",
+            (os.getpid(), job_id, owner),
+        )
+        return claimed.rowcount == 1
+
+    def unfinished_job(self, data_product: str) -> Optional[ProvisioningJob]:
+        row = self._conn.execute(
+            "SELECT state FROM jobs WHERE finished = 0 AND data_product = ? ORDER BY rowid DESC LIMIT 1",
+            (data_product,),
+        ).fetchone()
+        return ProvisioningJob.model_validate_json(row[0]) if row else None
+
+    def get_job(self, job_id: str) -> Optional[ProvisioningJob]:
+        row = self._conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return ProvisioningJob.model_validate_json(row[0]) if row else None
+
+    def unfinished_jobs(self) -> List[ProvisioningJob]:
+        rows = self._conn.execute("SELECT state FROM jobs WHERE finished = 0 ORDER BY rowid").fetchall()
+        return [ProvisioningJob.model_validate_json(row[0]) for row in rows]
+
+    def snapshot(self) -> "Snapshot":
+        """Process-wide read-only view of the registry, see `SnapshotCache`."""
+        return SNAPSHOTS.get(self)
+
+    def export(self, batch_size: int = 1000) -> Tuple[int, int, Iterator[List[DataProductRecord]]]:
+        """Every saved record, in name order, read from one consistent state of the store.
+
+        Runs in a read transaction on a dedicated connection, so writes
+        committed while the batches are consumed are not seen, and only
+        `batch_size` records are in memory at a time. When the shared
+        snapshot is at the same version, its records are streamed instead,
+        reusing their cached encoding. Returns the store version being
+        exported, the last change journal sequence number it includes (read
+        `changes(since=seq)` to follow it) and the batches.
+        """
+        conn = _connect(self.path, check_same_thread=False)
+        try:
+            conn.execute("BEGIN")
+            version = conn.execute(READ_VERSION).fetchone()[0]
+            seq = conn.execute(READ_LAST_SEQ).fetchone()[0]
+            snapshot = SNAPSHOTS.peek(self.path)
+            if snapshot is not None and snapshot.version == version:
+                conn.close()
+        except BaseException:
+            conn.close()
+            raise
+
+        def snapshot_batches() -> Iterator[List[DataProductRecord]]:
+            for start in range(0, len(snapshot.names), batch_size):
+                yield [snapshot.data_products[name] for name in snapshot.names[start:start + batch_size]]
+
+        def batches() -> Iterator[List[DataProductRecord]]:
+            try:
+                cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM data_products ORDER BY name")
+                while rows := cursor.fetchmany(batch_size):
+                    yield [DataProductRecord.from_row(row) for row in rows]
+            finally:
+                conn.close()
+        if snapshot is not None and snapshot.version == version:
+            return version, seq, snapshot_batches()
+        return version, seq, batches()
+
+    def upsert_many(self, data_products: List[DataProductState]) -> int:
+        """Insert or overwrite `data_products` in one transaction, written immediately.
+
+        Returns the new store version.
+        """
+        assignments = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[1:])
+        journal = []
+        with DB_OPERATION_DURATION.time(operation="upsert"), self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for dp in data_products:
+                row_version = self._conn.execute(
+                    f"INSERT INTO data_products ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                    f"ON CONFLICT (name) DO UPDATE SET {assignments}, version = version + 1 RETURNING version",
+                    _to_row(dp),
+                ).fetchone()[0]
+                journal.append(("insert" if row_version == 1 else "update", dp))
+            seq = _journal(self._conn, journal)
+            version = self._conn.execute(BUMP_VERSION).fetchone()[0]
+        CHANGES.notify(seq)
+        DB_ROWS.observe(len(data_products), operation="upsert")
+        SNAPSHOTS.write_through(self.path, version, data_products)
+        for dp in data_products:
+            self._cache.pop(dp.name, None)
+            self._versions.pop(dp.name, None)
+        return version
+
+    def changes(self, since: int = 0, limit: int = 1000) -> Tuple[List[DataProductChange], int]:
+        """Journal entries after sequence number `since`, oldest first, and the last sequence number.
+
+        Raises ChangesExpiredError when entries after `since` were already
+        trimmed: the reader missed changes and has to start over from an
+        `export`.
+        """
+        with DB_OPERATION_DURATION.time(operation="changes"), self._conn:
+            self._conn.execute("BEGIN")
+            oldest, last = self._conn.execute("SELECT MIN(seq), COALESCE(MAX(seq), 0) FROM changes").fetchone()
+            if oldest is not None and since < oldest - 1:
+                raise ChangesExpiredError(since, oldest)
+            rows = self._conn.execute(
+                "SELECT seq, op, name, at, state FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        return [
+            DataProductChange(seq=seq, op=op, name=name, at=at, data_product=DataProductState.model_validate_json(state))
+            for seq, op, name, at, state in rows
+        ], last
+
+    def find(
+        self,
+        after: Optional[str] = None,
+        limit: Optional[int] = None,
+        **filters: Any,
+    ) -> Tuple[int, List[str], Optional[str]]:
+        """Same as `Snapshot.find` on the saved records, but answered by one query.
+
+        Meant for one-shot callers that would not reuse a snapshot. Returns
+        the store version along with the page and the next cursor.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}.")
+        clauses, params = [], []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if field not in COLUMNS:
+                raise ValueError(f"Unknown data product field {field}.")
+            clauses.append(f"{field} = ?")
+            params.append(_to_column(field, value))
+        if after is not None:
+            clauses.append("name > ?")
+            params.append(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._conn:
+            self._conn.execute("BEGIN")
+            version = self._conn.execute(READ_VERSION).fetchone()[0]
+            names = [row[0] for row in self._conn.execute(
+                f"SELECT name FROM data_products {where} ORDER BY name LIMIT ?",
+                (*params, -1 if limit is None else limit + 1),
+            )]
+        if limit is not None and len(names) > limit:
+            return version, names[:limit], names[limit - 1]
+        return version, names, None
+
+    def flush(self):
+        self.save()
+        logger.debug("Flushed database to %s.", self.path)
+
+    def __enter__(self):
+        self.load()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.save()
+        finally:
+            self.close()
+
+
+def _index_keys(dp: DataProductState) -> List[Tuple[str, Any]]:
+    return [("domain", dp.domain), *((flag, getattr(dp, flag)) for flag in FLAG_FIELDS)]
+
+
+class Snapshot:
+    """Immutable copy of the registry at a given store version, as DataProductRecord.
+
+    Besides the records, a snapshot holds secondary indexes mapping
+    `("domain", <domain>)` and `(<flag>, <bool>)` to the sorted list of
+    matching product names, so filtered listings never scan the registry.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        data_products: Dict[str, DataProductRecord],
+        names: Optional[List[str]] = None,
+        index: Optional[Dict[Tuple[str, Any], List[str]]] = None,
+    ):
+        self.version = version
+        self.data_products = data_products
+        if names is None or index is None:
+            names, index = sorted(data_products), {}
+            for name in names:
+                for key in _index_keys(data_products[name]):
+                    index.setdefault(key, []).append(name)
+        self.names = names
+        self.index = index
+
+    def apply(self, version: int, data_products: Iterable[DataProductState]) -> "Snapshot":
+        """New snapshot with `data_products` upserted, indexes updated in place of a rebuild."""
+        records = dict(self.data_products)
+        names = list(self.names)
+        index = {key: list(values) for key, values in self.index.items()}
+        for dp in data_products:
+            previous = records.get(dp.name)
+            if previous is None:
+                bisect.insort(names, dp.name)
+            else:
+                for key in _index_keys(previous):
+                    values = index[key]
+                    del values[bisect.bisect_left(values, dp.name)]
+            for key in _index_keys(dp):
+                bisect.insort(index.setdefault(key, []), dp.name)
+            records[dp.name] = DataProductRecord.from_state(dp)
+        return Snapshot(version, records, names, index)
+
+    def find(
+        self,
+        after: Optional[str] = None,
+        limit: Optional[int] = None,
+        **filters: Any,
+    ) -> Tuple[List[str], Optional[str]]:
+        """Names matching every `filters` item (domain or flag), in name order.
+
+        Walks the shortest matching index from the `after` cursor and checks
+        the remaining filters on each candidate. Returns the page and the
+        cursor of the next page, if any.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}.")
+        filters = {k: v for k, v in filters.items() if v is not None}
+        candidates = min(
+            (self.index.get(item, []) for item in filters.items()),
+            key=len,
+            default=self.names,
+        )
+        start = bisect.bisect_right(candidates, after) if after is not None else 0
+        page = []
+        for name in itertools.islice(candidates, start, None):
+            dp = self.data_products[name]
+            if all(getattr(dp, k) == v for k, v in filters.items()):
+                if limit is not None and len(page) == limit:
+                    return page, page[-1]
+                page.append(name)
+        return page, None
+
+
+class SnapshotCache:
+    """Registry snapshots shared by every request of the process.
+
+    A snapshot is reused as long as the store version counter has not moved.
+    Writes made through `LocalDB.save` are applied to the cached snapshot
+    directly, so only writes from other processes cause a full reload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns: Dict[str, sqlite3.Connection] = {}
+        self._snapshots: Dict[str, Snapshot] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self, db: LocalDB) -> sqlite3.Connection:
+        conn = self._conns.get(db.path)
+        if conn is None:
+            # first use of this store in the process: let LocalDB run the legacy migration,
+            # in a session of its own so an open session of `db` is left as it is
+            with LocalDB(path=db.path, legacy_path=db.legacy_path):
+                pass
+            conn = self._conns[db.path] = _connect(db.path, check_same_thread=False)
+        return conn
+
+    def get(self, db: LocalDB) -> Snapshot:
+        with self._lock:
+            conn = self._conn(db)
+            version = conn.execute(READ_VERSION).fetchone()[0]
+            snapshot = self._snapshots.get(db.path)
+            if snapshot is not None and snapshot.version == version:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            with DB_OPERATION_DURATION.time(operation="snapshot"), conn:
+                conn.execute("BEGIN")
+                version = conn.execute(READ_VERSION).fetchone()[0]
+                rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM data_products ORDER BY name").fetchall()
+            DB_ROWS.observe(len(rows), operation="snapshot")
+            snapshot = self._snapshots[db.path] = Snapshot(version, {row[0]: DataProductRecord.from_row(row) for row in rows})
+            logger.debug("Reloaded snapshot of %s at version %s with %s data products.", db.path, version, len(rows))
+            return snapshot
+
+    def peek(self, path: str) -> Optional[Snapshot]:
+        """The cached snapshot of `path`, without checking that it is current."""
+        with self._lock:
+            return self._snapshots.get(path)
+
+    def invalidate(self, path: str):
+        """Drop the cached snapshot of `path`, the next read reloads it."""
+        with self._lock:
+            self._snapshots.pop(path, None)
+
+    def write_through(self, path: str, version: int, data_products: Iterable[DataProductState]):
+        with self._lock:
+            snapshot = self._snapshots.get(path)
+            if snapshot is None:
+                return
+            if snapshot.version != version - 1:
+                # another writer committed in between, reload on next read
+                del self._snapshots[path]
+                return
+            self._snapshots[path] = snapshot.apply(version, data_products)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "snapshots": len(self._snapshots),
+            }
+
+    def file_sizes(self) -> Dict[Tuple[str, ...], int]:
+        """On-disk size of each store used by the process, WAL included."""
+        with self._lock:
+            paths = list(self._conns)
+        sizes = {}
+        for path in paths:
+            sizes[(path,)] = sum(
+                os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p)
+            )
+        return sizes
+
+
+SNAPSHOTS = SnapshotCache()
+
+Gauge(
+    "dpm_db_size_bytes", "On-disk size of the registry store, WAL included.",
+    SNAPSHOTS.file_sizes, ("path",),
+)
+Gauge(
+    "dpm_snapshot_cache", "Registry snapshot cache counters.",
+    lambda: {(k,): v for k, v in SNAPSHOTS.stats().items()}, ("counter",),
+)
@@ -0,0 +1,101 @@
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Optional
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, encoded with a single `json.dumps`.
+
+    Messages logged as a plain object (e.g. a dict) without arguments are
+    embedded as JSON values, other messages as strings.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, str) or record.args:
+            message = record.getMessage()
+        else:
+            message = record.msg
+        entry = {
+            "asctime": self.formatTime(record),
+            "levelname": record.levelname,
+            "logger": record.name,
+            "funcName": record.funcName,
+            "pathname": record.pathname,
+            "lineno": record.lineno,
+            "message": message,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps only a `rate` fraction of the records at DEBUG level or below."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records as they are, leaving message formatting to the listener thread.
+
+    The stock `prepare` renders the message on the calling thread; here the
+    record (with its arguments) is handed over untouched, so log call sites
+    must not mutate arguments after logging them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def stop_logging():
+    """Write out the records still queued and stop the listener thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def configure_logging(level: str = "INFO", debug_sample_rate: float = 1.0, stream=None) -> logging.handlers.QueueListener:
+    """Route every log record through a queue to a background writer thread.
+
+    Request threads only filter and enqueue records; formatting and writing
+    to `stream` (stderr by default) happen on the listener thread. The
+    `app.*` loggers have no handler of their own and propagate to the root;
+    handlers are swapped in place on the root handler list, which the
+    uvicorn loggers share.
+    """
+    global _listener
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+    handler = DeferredQueueHandler(queue.SimpleQueue())
+    if debug_sample_rate < 1.0:
+        handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers[:] = [handler]
+    # loggers holding the root handler list would otherwise emit each record twice
+    for logger in logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger) and logger.handlers is root.handlers:
+            logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
+    return _listener
@@ -0,0 +1,13 @@
+import os
+import logging
+
+from data_product_manager.api import app
+from data_product_manager.logging_config import configure_logging
+
+
+logging.getLogger("uvicorn").handlers = logging.getLogger().handlers
+logging.getLogger("uvicorn.access").handlers = logging.getLogger().handlers
+configure_logging(
+    level=os.getenv('LOG_LEVEL', 'DEBUG'),
+    debug_sample_rate=float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0')),
+)
@@ -0,0 +1,159 @@
+"""Process-wide metrics in the Prometheus text exposition format.
+
+A small stdlib implementation of counters, gauges and histograms with
+labels, enough for the `/metrics` endpoint without adding a dependency.
+"""
+import time
+import threading
+import contextlib
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[k]) for k in self.labelnames)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    """Gauge whose samples are computed at scrape time by `collect`."""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Dict[Tuple[str, ...], float]], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in self.collect().items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            # per label set: one count per bucket, then +Inf count, then sum
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str):
+        """Observe the duration of the block, with `outcome` set to ok or error if it is a label."""
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            if "outcome" in self.labelnames:
+                labels["outcome"] = outcome
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in values:
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {counts[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {counts[-2]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {counts[-1]}"
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+HTTP_REQUESTS = Counter(
+    "dpm_http_requests_total", "HTTP requests handled, by route template and status code.",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "dpm_http_request_duration_seconds", "HTTP request latency, by route template and status code.",
+    ("method", "route", "status"),
+)
+PROVISIONING_STEP_DURATION = Histogram(
+    "dpm_provisioning_step_duration_seconds", "Duration of provisioning steps.",
+    ("step", "outcome"),
+)
+DB_OPERATION_DURATION = Histogram(
+    "dpm_db_operation_duration_seconds", "Duration of registry store operations.",
+    ("operation",),
+)
+DB_ROWS = Histogram(
+    "dpm_db_rows", "Rows read or written per registry store operation.",
+    ("operation",), buckets=SIZE_BUCKETS,
+)
+OUTBOUND_CALL_DURATION = Histogram(
+    "dpm_outbound_call_duration_seconds", "Duration of calls to external systems, by target and operation.",
+    ("target", "operation", "outcome"),
+)
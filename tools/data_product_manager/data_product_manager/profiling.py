@@ -0,0 +1,223 @@
+"""Opt-in sampling profiler for single requests, stdlib only.
+
+A request is profiled when it carries the PROFILE_TOKEN in the X-Profile
+header or the `profile` query parameter, and continuously for a
+PROFILE_SAMPLE_RATE fraction of all requests. While a request is profiled,
+a sampler thread records the Python stack of the threads running it every
+PROFILE_INTERVAL seconds: the threadpool thread of a sync endpoint, or the
+event loop thread while an async endpoint runs. The loop also runs every
+other request in flight, so its samples are labelled as shared. The
+stacks are written to PROFILE_DIR, as
+speedscope JSON (https://www.speedscope.app) or as collapsed stacks for
+flamegraph.pl, depending on PROFILE_FORMAT.
+
+Nothing runs when no request is profiled, the cost for the others is one
+header lookup and one random draw.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import logging
+import functools
+import threading
+import contextlib
+import contextvars
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("app.profiling")
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+PROFILE_FORMAT = os.environ.get("PROFILE_FORMAT", "speedscope")  # speedscope | collapsed
+PROFILE_MAX_CONCURRENT = int(os.environ.get("PROFILE_MAX_CONCURRENT", "4"))
+
+FORMATS = {"speedscope": ".speedscope.json", "collapsed": ".collapsed.txt"}
+# leaf frames of threads that are waiting, not working
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+}
+
+_slots = threading.BoundedSemaphore(PROFILE_MAX_CONCURRENT)
+# profiler of the request being handled, copied into its threadpool calls
+_current: contextvars.ContextVar[Optional["SamplingProfiler"]] = contextvars.ContextVar("profiler", default=None)
+
+
+def requested(token: Optional[str]) -> bool:
+    """Whether a request carrying `token` (None if it has none) should be profiled."""
+    if token is not None and PROFILE_TOKEN:
+        return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def acquire() -> bool:
+    """Take one of the PROFILE_MAX_CONCURRENT profiling slots, without waiting."""
+    return _slots.acquire(blocking=False)
+
+
+def release():
+    _slots.release()
+
+
+@contextlib.contextmanager
+def profile_thread(shared: bool = False):
+    """Have the profiler of the current request, if any, sample this thread for the duration of the block.
+
+    `shared` marks a thread that also runs other requests, the event loop:
+    its samples are labelled as such.
+    """
+    profiler = _current.get()
+    if profiler is None:
+        yield
+        return
+    ident = threading.get_ident()
+    profiler.threads.add(ident)
+    if shared:
+        profiler.shared.add(ident)
+    try:
+        yield
+    finally:
+        profiler.threads.discard(ident)
+        profiler.shared.discard(ident)
+
+
+def profiled(func: Callable) -> Callable:
+    """Wrap a sync endpoint so the threadpool thread running it is sampled."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with profile_thread():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def profiled_async(func: Callable) -> Callable:
+    """Wrap an async endpoint so the event loop thread is sampled while it runs, as a shared thread."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with profile_thread(shared=True):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads of one request until stopped.
+
+    Only threads that join with `profile_thread` while they work on the
+    request are sampled, not the thread starting the profiler.
+
+    Samples are aggregated by thread name and stack, so memory grows with
+    the number of distinct stacks, not with the duration.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.started_at = 0.0
+        self.duration = 0.0
+        self.threads: Set[int] = set()
+        self.shared: Set[int] = set()
+        self._labels: Dict[object, Tuple[str, str, int]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._token = _current.set(self)
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        _current.reset(self._token)
+        self.duration = time.perf_counter() - self.started_at
+
+    def _label(self, code) -> Tuple[str, str, int]:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (code.co_qualname, code.co_filename, code.co_firstlineno)
+        return label
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            shared = set(self.shared)
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is None or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                thread = names.get(ident, str(ident))
+                if ident in shared:
+                    thread = f"{thread} (event loop, shared with concurrent requests)"
+                self.samples[(thread, *stack)] += 1
+
+    def collapsed(self) -> str:
+        """One `thread;outer;...;inner count` line per stack, the input of flamegraph.pl."""
+        lines = []
+        for (thread, *stack), count in self.samples.most_common():
+            frames = [thread] + [f"{name} ({os.path.basename(file)}:{line})" for name, file, line in stack]
+            lines.append(f"{';'.join(frame.replace(';', ':') for frame in frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """A speedscope file with one sampled profile per thread."""
+        frames: List[dict] = []
+        index: Dict[Tuple[str, str, int], int] = {}
+        profiles: Dict[str, dict] = {}
+        for (thread, *stack), count in self.samples.items():
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    frames.append({"name": label[0], "file": label[1], "line": label[2]})
+            profile = profiles.setdefault(thread, {
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(self.duration, 6),
+                "samples": [],
+                "weights": [],
+            })
+            profile["samples"].append([index[label] for label in stack])
+            profile["weights"].append(round(count * self.interval, 6))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "data-product-manager",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+    def write(self, name: str, directory: str = PROFILE_DIR, fmt: str = PROFILE_FORMAT) -> str:
+        """Write the profile to `directory` and return the path of the file."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}{FORMATS[fmt]}")
+        with open(path, "w") as f:
+            if fmt == "speedscope":
+                json.dump(self.speedscope(name), f)
+            else:
+                f.write(self.collapsed())
+        logger.info("Wrote profile of %s (%.3fs, %s samples) to %s.", name, self.duration, sum(self.samples.values()), path)
+        return path
@@ -0,0 +1,311 @@
+import time
+import uuid
+import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from data_product_manager.db import LocalDB, DataProductExistsError, DataProductState, ProvisioningJob, DEFAULT_DB_PATH
+from data_product_manager.metrics import PROVISIONING_STEP_DURATION
+
+logger = logging.getLogger("app.provisioning")
+
+
+class ProvisioningStep:
+    """One provisioning step, checkpointed by a DataProductState flag.
+
+    `run` must be idempotent: after a crash it may be called again for a
+    product whose step already took effect but whose flag was not saved yet.
+    `observe`, when given, returns the names of every product for which the
+    step's resource actually exists; the reconciler calls it once per pass.
+    """
+
+    def __init__(
+        self,
+        flag: str,
+        run: Callable[[DataProductState], None],
+        observe: Optional[Callable[[], Set[str]]] = None,
+    ):
+        self.flag = flag
+        self.run = run
+        self.observe = observe
+
+
+class ProvisioningRunner:
+    """Runs provisioning jobs on a background worker pool.
+
+    A job walks through `steps` in order, skipping steps whose flag is already
+    set and saving each flag as soon as its step is done, so a job interrupted
+    by a crash is picked up by `resume` from the first unfinished step. At
+    most `per_domain` jobs of the same domain run at the same time, the
+    others wait in a per-domain queue without holding a worker.
+    """
+
+    def __init__(
+        self,
+        steps: List[ProvisioningStep],
+        db_path: str = DEFAULT_DB_PATH,
+        max_workers: int = 8,
+        per_domain: int = 2,
+    ):
+        self.steps = steps
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.per_domain = per_domain
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._active: Dict[str, str] = {}
+        self._running: Dict[str, int] = collections.defaultdict(int)
+        self._waiting: Dict[str, Deque[ProvisioningJob]] = collections.defaultdict(collections.deque)
+
+    def _db(self) -> LocalDB:
+        return LocalDB(path=self.db_path)
+
+    def create(self, dp: DataProductState) -> Tuple[ProvisioningJob, bool]:
+        """Register `dp` and queue its provisioning.
+
+        Returns the job and whether it was coalesced with a job already
+        provisioning a product of the same name, possibly in another process.
+        Raises KeyError if the product exists and is not being provisioned.
+        """
+        created = self.create_many([dp])[0]
+        if created is None:
+            raise DataProductExistsError(dp.name)
+        return created
+
+    def create_many(self, dps: List[DataProductState]) -> List[Optional[Tuple[ProvisioningJob, bool]]]:
+        """Register many products, and their jobs, in one store transaction, then queue their provisioning.
+
+        Returns what `create` would for each product, with None in place of
+        the KeyError of a product that exists and is not being provisioned.
+        Names are expected to be unique.
+        """
+        results: List[Optional[Tuple[ProvisioningJob, bool]]] = []
+        created: Dict[str, int] = {}
+        with self._lock:
+            with self._db() as db:
+                for dp in dps:
+                    job_id = self._active.get(dp.name)
+                    if job_id is not None:
+                        results.append((db.get_job(job_id), True))
+                        continue
+                    if dp.name in db.data_products:
+                        results.append(self._coalesce(db, dp.name))
+                        continue
+                    now = time.time()
+                    job = ProvisioningJob(id=uuid.uuid4().hex, data_product=dp.name, domain=dp.domain, created_at=now, updated_at=now)
+                    db.insert(dp, job=job)
+                    created[dp.name] = len(results)
+                    results.append((job, False))
+                while True:
+                    try:
+                        db.flush()
+                        break
+                    except DataProductExistsError as exc:
+                        # inserted by another process since it was checked: the save dropped it, retry with the others
+                        results[created.pop(exc.name)] = self._coalesce(db, exc.name)
+            for index in created.values():
+                self._schedule(results[index][0])
+        return results
+
+    def _coalesce(self, db: LocalDB, name: str) -> Optional[Tuple[ProvisioningJob, bool]]:
+        running = db.unfinished_job(name)
+        return None if running is None else (running, True)
+
+    def get(self, job_id: str) -> Optional[Tuple[ProvisioningJob, Optional[DataProductState]]]:
+        with self._db() as db:
+            job = db.get_job(job_id)
+            if job is None:
+                return None
+            dp = db.data_products.get(job.data_product)
+            return job, dp
+
+    def progress(self, dp: Optional[DataProductState]) -> List[Dict[str, object]]:
+        return [{"step": step.flag, "done": bool(dp and getattr(dp, step.flag))} for step in self.steps]
+
+    def resume(self):
+        """Queue again every job left queued or running by a process that is gone."""
+        with self._db() as db:
+            jobs = [job for job in db.unfinished_jobs() if db.claim_job(job.id)]
+        with self._lock:
+            self._closed = False
+            for job in jobs:
+                if job.data_product not in self._active:
+                    logger.info("Resuming provisioning job %s of data product %s.", job.id, job.data_product)
+                    self._schedule(job)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no job is queued or running. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._active, timeout)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers. Jobs still waiting for a slot stay queued until the next `resume`."""
+        with self._lock:
+            self._closed = True
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _schedule(self, job: ProvisioningJob):
+        # caller holds self._lock
+        if self._closed:
+            return
+        self._active[job.data_product] = job.id
+        if self._running[job.domain] >= self.per_domain:
+            self._waiting[job.domain].append(job)
+            return
+        self._running[job.domain] += 1
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="provisioning")
+        self._pool.submit(self._run, job)
+
+    def is_active(self, name: str) -> bool:
+        with self._lock:
+            return name in self._active
+
+    def _finished(self, job: ProvisioningJob):
+        with self._lock:
+            self._active.pop(job.data_product, None)
+            self._running[job.domain] -= 1
+            if self._waiting[job.domain]:
+                self._schedule(self._waiting[job.domain].popleft())
+            if not self._active:
+                self._idle.notify_all()
+
+    def _save(self, db: LocalDB, job: ProvisioningJob, **kwargs):
+        for k, v in kwargs.items():
+            setattr(job, k, v)
+        job.updated_at = time.time()
+        db.put_job(job)
+
+    def _run(self, job: ProvisioningJob):
+        try:
+            with self._db() as db:
+                self._save(db, job, status="running")
+                for step in self.steps:
+                    dp = db.data_products[job.data_product]
+                    if getattr(dp, step.flag):
+                        continue
+                    self._save(db, job, step=step.flag)
+                    logger.info("Provisioning job %s: running step %s of data product %s.", job.id, step.flag, job.data_product)
+                    with PROVISIONING_STEP_DURATION.time(step=step.flag):
+                        step.run(dp)
+                    db.update(job.data_product, **{step.flag: True})
+                    db.flush()
+                self._save(db, job, status="succeeded", step=None)
+            logger.info("Provisioning job %s of data product %s succeeded.", job.id, job.data_product)
+        except Exception as exc:
+            logger.error("Provisioning job %s of data product %s failed at step %s: %s", job.id, job.data_product, job.step, exc)
+            with self._db() as db:
+                self._save(db, job, status="failed", error=str(exc))
+        finally:
+            self._finished(job)
+
+
+class Reconciler:
+    """Converges every product's state flags with what actually exists.
+
+    A pass reads the registry from the shared snapshot, observes each step's
+    resources once for all products, and only touches products that drifted:
+    a flag set without its resource re-runs the step, a resource present
+    without its flag just sets the flag. Products being provisioned by a job
+    are left alone. Repairs run concurrently, at most `max_workers` at once.
+    """
+
+    def __init__(self, runner: ProvisioningRunner, max_workers: int = 8):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._pass_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _plan(self, dp: DataProductState, observed: Dict[str, Optional[Set[str]]]) -> Tuple[List[ProvisioningStep], Dict[str, bool]]:
+        to_run, to_flag = [], {}
+        for step in self.runner.steps:
+            flagged = getattr(dp, step.flag)
+            exists = observed[step.flag]
+            if exists is None:
+                if not flagged:
+                    to_run.append(step)
+            elif dp.name in exists:
+                if not flagged:
+                    to_flag[step.flag] = True
+            else:
+                to_run.append(step)
+        return to_run, to_flag
+
+    def _repair(self, name: str, to_run: List[ProvisioningStep], to_flag: Dict[str, bool]):
+        with self.runner._db() as db:
+            if to_flag:
+                db.update(name, **to_flag)
+                db.flush()
+            for step in to_run:
+                logger.info("Reconciling data product %s: running step %s.", name, step.flag)
+                with PROVISIONING_STEP_DURATION.time(step=step.flag):
+                    step.run(db.data_products[name])
+                db.update(name, **{step.flag: True})
+                db.flush()
+
+    def reconcile(self) -> Dict[str, Any]:
+        with self._pass_lock:
+            started_at = time.time()
+            start = time.perf_counter()
+            snapshot = self.runner._db().snapshot()
+            observed = {step.flag: step.observe() if step.observe else None for step in self.runner.steps}
+            work = {}
+            for dp in snapshot.data_products.values():
+                if self.runner.is_active(dp.name):
+                    continue
+                to_run, to_flag = self._plan(dp, observed)
+                if to_run or to_flag:
+                    work[dp.name] = (to_run, to_flag)
+            plan_s = time.perf_counter() - start
+
+            repaired, failed = [], {}
+            if work:
+                with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="reconcile") as pool:
+                    futures = {name: pool.submit(self._repair, name, *todo) for name, todo in work.items()}
+                for name, future in futures.items():
+                    if future.exception() is not None:
+                        logger.error("Failed to reconcile data product %s: %s", name, future.exception())
+                        failed[name] = str(future.exception())
+                    else:
+                        repaired.append(name)
+
+            self.last_report = {
+                "started_at": started_at,
+                "duration_s": round(time.perf_counter() - start, 6),
+                "plan_duration_s": round(plan_s, 6),
+                "data_products": len(snapshot.data_products),
+                "converged": len(snapshot.data_products) - len(work),
+                "repaired": repaired,
+                "failed": failed,
+            }
+            logger.info(
+                "Reconciliation pass over %s data products took %ss: %s repaired, %s failed.",
+                len(snapshot.data_products), self.last_report["duration_s"], len(repaired), len(failed),
+            )
+            return self.last_report
+
+    def start(self, interval: float):
+        """Run a pass every `interval` seconds on a daemon thread."""
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.reconcile()
+                except Exception as exc:
+                    logger.error("Reconciliation pass failed: %s", exc)
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, name="reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
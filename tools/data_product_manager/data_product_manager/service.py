@@ -0,0 +1,584 @@
+"""Data product operations shared by the HTTP API and the `dpm` command line.
+
+Route functions and CLI commands only translate their inputs and outputs,
+the work happens here. python-keycloak is imported by the Keycloak
+operations only, so commands that do not talk to Keycloak start faster.
+"""
+import os
+import json
+import time
+import logging
+from typing import Annotated, Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+import pydantic
+
+from data_product_manager.db import CHANGES, LocalDB, DataProductChange, DataProductState, ProvisioningJob
+from data_product_manager.provisioning import ProvisioningRunner, ProvisioningStep
+from data_product_manager.componants.code_repository import CodeRepository, ForkMode
+from data_product_manager.componants.opa_bundle import OpaBundle
+from data_product_manager.componants.trino_catalog import CatalogDirectory, CatalogSettings, catalog_name, render_catalogs, warehouse_location
+
+DEFAULT_REPO_URL = "data_products"
+DEFAULT_CONFIG_DIR = "config"
+FORK_MODE = ForkMode(os.environ.get("FORK_MODE", ForkMode.AUTO.value))
+TRANSFER_BATCH_SIZE = int(os.environ.get("TRANSFER_BATCH_SIZE", "1000"))
+MAX_IMPORT_LINE = 1024 * 1024
+MAX_IMPORT_ERRORS = 100
+MAX_CHANGES_WAIT = 30.0
+DBT_INDEX_PATH = os.environ.get("DBT_INDEX_PATH", "./dbt_index.json")
+DBT_INDEX_REFRESH_INTERVAL = float(os.environ.get("DBT_INDEX_REFRESH_INTERVAL", "2.0"))
+
+logger = logging.getLogger("app.service")
+
+
+class DataProductCreateData(pydantic.BaseModel):
+    domain: Annotated[str, pydantic.Field(
+        pattern="^[a-z0-9_]+$",
+        description="Data domain name, e.g., marketing, sales, finance",
+    )]
+    name: Annotated[str, pydantic.Field(
+        pattern="^[a-z0-9_]+$",
+        description="Data product name, e.g., customer_360, sales_reporting",
+    )]
+    description: Annotated[str, pydantic.Field(
+        min_length=10,
+        max_length=200,
+        description="Description of the data product",
+    )]
+    admin_emails: Annotated[List[
+        Annotated[str, pydantic.Field(
+            pattern="^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\\.[a-zA-Z]{2,}$",
+            description="Admin email address",
+        )]
+    ], pydantic.Field(
+        min_length=1,
+        description="List of admin email addresses for the data product",
+    )]
+
+
+class DataProductBatchCreateData(pydantic.BaseModel):
+    data_products: Annotated[List[Any], pydantic.Field(
+        min_length=1,
+        max_length=500,
+        description="Data products to create, validated one by one",
+    )]
+
+
+class DataProductListQuery(pydantic.BaseModel):
+    domain: Annotated[Optional[str], pydantic.Field(
+        description="Only list data products of this domain",
+    )] = None
+    code_repository: Optional[bool] = None
+    keycloak_group: Optional[bool] = None
+    keycloak_domain_group: Optional[bool] = None
+    keycloak_product_group: Optional[bool] = None
+    trino_dev_catalog: Optional[bool] = None
+    trino_prd_catalog: Optional[bool] = None
+    cursor: Annotated[Optional[str], pydantic.Field(
+        description="next_cursor of the previous page",
+    )] = None
+    limit: Annotated[int, pydantic.Field(
+        ge=1,
+        le=1000,
+        description="Maximum number of data products per page",
+    )] = 100
+
+
+class KeycloakMasterBootstrapData(pydantic.BaseModel):
+    keycloak_base_url: Annotated[str, pydantic.Field(
+        description="Base URL of the Keycloak server, e.g., https://auth.example.com/",
+    )] = "https://auth.127.0.0.1.nip.io/"
+    admin_username: Annotated[str, pydantic.Field(
+        description="Keycloak admin username",
+    )] = "admin"
+    admin_password: Annotated[str, pydantic.Field(
+        description="Keycloak admin password",
+    )] = "admin"
+    master_realm: Annotated[str, pydantic.Field(
+        description="Keycloak master realm name",
+    )] = "master"
+    verify_tls: Annotated[bool, pydantic.Field(
+        description="Whether to verify TLS certificates",
+    )] = True
+    trino_client_secret: Annotated[str, pydantic.Field(
+        description="Client secret for the Trino client",
+    )] = "REPLACE_WITH_SECURE_SECRET"
+    trino_redirect_uris: Annotated[Optional[List[str]], pydantic.Field(
+        description="List of redirect URIs for the Trino client",
+    )] = ["https://trino.127.0.0.1.nip.io/oauth2/callback"]
+    trino_post_logout_uris: Annotated[str, pydantic.Field(
+        description="Post-logout redirect URIs for the Trino client",
+    )] = "https://trino.127.0.0.1.nip.io/*"
+    dry_run: Annotated[bool, pydantic.Field(
+        description="Only compute and return the change plan, do not apply it",
+    )] = False
+
+
+def code_repository_url() -> str:
+    """CODE_REPOSITORY_URL (`dpm --repo-url`), the repository's `data_products/` directory by default."""
+    return os.environ.get("CODE_REPOSITORY_URL", DEFAULT_REPO_URL)
+
+
+def _fork_code_repository(dp: DataProductState):
+    with CodeRepository(url=code_repository_url(), fork_mode=FORK_MODE) as code_repo:
+        if code_repo.repository_exists(f"dp-{dp.name}"):
+            logger.info("Repository dp-%s already exists, skipping fork.", dp.name)
+            return
+        code_repo.create_repository(
+            name=f"dp-{dp.name}",
+            description=f"Data product repository for {dp.name}",
+            fork="_template",
+        )
+
+
+def _observe_code_repositories() -> Set[str]:
+    with os.scandir(code_repository_url()) as entries:
+        return {
+            entry.name[len("dp-"):] for entry in entries
+            if entry.name.startswith("dp-") and not entry.name.endswith(".partial") and entry.is_dir()
+        }
+
+
+def config_path(*parts: str) -> str:
+    """Path under the `config/` directory of the repository.
+
+    The directory is CONFIG_DIR (`dpm --config-dir`), `./config` by default:
+    processes run from the repository root. Raises FileNotFoundError when
+    it does not exist, rather than writing a new tree somewhere else.
+    """
+    config_dir = os.environ.get("CONFIG_DIR", DEFAULT_CONFIG_DIR)
+    if not os.path.isdir(config_dir):
+        raise FileNotFoundError(
+            f"Config directory {os.path.abspath(config_dir)} does not exist: "
+            "run from the repository root or set CONFIG_DIR (dpm --config-dir)."
+        )
+    return os.path.join(config_dir, *parts)
+
+
+_trino_catalogs = None
+TRINO_CATALOG_SETTINGS = CatalogSettings.from_env()
+
+
+def trino_catalogs() -> CatalogDirectory:
+    """The generated catalogs directory, TRINO_CATALOG_DIR or `trino/catalog` of the config directory."""
+    global _trino_catalogs
+    if _trino_catalogs is None:
+        _trino_catalogs = CatalogDirectory(os.environ.get("TRINO_CATALOG_DIR") or config_path("trino", "catalog"))
+    return _trino_catalogs
+
+
+def _trino_catalog_step(env: str) -> ProvisioningStep:
+    def write(dp: DataProductState):
+        trino_catalogs().sync(render_catalogs(TRINO_CATALOG_SETTINGS, [(dp.domain, dp.name)], environments=[env]))
+    return ProvisioningStep(f"trino_{env}_catalog", write, observe=lambda: trino_catalogs().existing(env))
+
+
+def provisioning_steps() -> List[ProvisioningStep]:
+    return [
+        ProvisioningStep("code_repository", _fork_code_repository, observe=_observe_code_repositories),
+        _trino_catalog_step("dev"),
+        _trino_catalog_step("prd"),
+    ]
+
+
+def create_data_product(runner: ProvisioningRunner, data: DataProductCreateData) -> Tuple[ProvisioningJob, bool]:
+    """Register a data product and queue its provisioning on `runner`.
+
+    Returns the job and whether it was coalesced with a running one. Raises
+    KeyError if the data product already exists.
+    """
+    logger.info("Creating data product %s.", data.name)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug({
+            "command": "create",
+            "domain": data.domain,
+            "name": data.name,
+            "description": data.description,
+            "admin_emails": data.admin_emails,
+        })
+    job, coalesced = runner.create(DataProductState(
+        name=data.name,
+        domain=data.domain,
+        description=data.description,
+        admin_emails=data.admin_emails,
+    ))
+    if coalesced:
+        logger.info("Data product %s is already being provisioned by job %s.", data.name, job.id)
+    return job, coalesced
+
+
+def create_data_products(runner: ProvisioningRunner, data: DataProductBatchCreateData) -> Dict[str, Any]:
+    """
+    Create many data products at once.
+
+    Every item is validated on its own, then the valid ones are registered
+    with their jobs in a single store transaction and queued on `runner`,
+    so the batch gets job records, the per-domain limits and resumption,
+    and a product's flags are only set by the steps that succeeded. Items
+    fail independently: the result reports the outcome of each one.
+    """
+    logger.info("Creating %s data products in batch.", len(data.data_products))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(data.data_products)
+    valid: Dict[str, Tuple[int, DataProductCreateData]] = {}
+    for index, raw in enumerate(data.data_products):
+        try:
+            item = DataProductCreateData.model_validate(raw)
+        except pydantic.ValidationError as exc:
+            results[index] = {
+                "index": index,
+                "name": raw.get("name") if isinstance(raw, dict) else None,
+                "status": "invalid",
+                "errors": exc.errors(include_url=False, include_context=False),
+            }
+            continue
+        if item.name in valid:
+            results[index] = {"index": index, "name": item.name, "status": "rejected", "error": "duplicate in batch"}
+            continue
+        valid[item.name] = index, item
+
+    created = runner.create_many([
+        DataProductState(name=item.name, domain=item.domain, description=item.description, admin_emails=item.admin_emails)
+        for _, item in valid.values()
+    ])
+    for (index, item), outcome in zip(valid.values(), created):
+        if outcome is None:
+            results[index] = {"index": index, "name": item.name, "status": "rejected", "error": "data product already exists"}
+            continue
+        job, coalesced = outcome
+        if coalesced:
+            logger.info("Data product %s is already being provisioned by job %s.", item.name, job.id)
+        results[index] = {
+            "index": index,
+            "name": item.name,
+            "status": job.status,
+            "job_id": job.id,
+            "coalesced": coalesced,
+            "status_url": f"/data-product/jobs/{job.id}",
+        }
+
+    statuses = [result["status"] for result in results]
+    return {
+        "queued": len(statuses) - statuses.count("invalid") - statuses.count("rejected"),
+        "invalid": statuses.count("invalid"),
+        "rejected": statuses.count("rejected"),
+        "results": results,
+    }
+
+
+def list_data_products(query: DataProductListQuery, use_snapshot: bool = True) -> Tuple[int, List[str], Optional[str]]:
+    """One page of data product names matching `query`.
+
+    Returns the store version, the names and the cursor of the next page.
+    Long-lived processes should use the shared snapshot, one-shot callers
+    save loading the whole registry with `use_snapshot=False`.
+    """
+    filters = query.model_dump(exclude={"cursor", "limit"})
+    if use_snapshot:
+        snapshot = LocalDB().snapshot()
+        names, next_cursor = snapshot.find(after=query.cursor, limit=query.limit, **filters)
+        return snapshot.version, names, next_cursor
+    with LocalDB() as db:
+        return db.find(after=query.cursor, limit=query.limit, **filters)
+
+
+def export_data_products(batch_size: int = TRANSFER_BATCH_SIZE) -> Tuple[int, int, Iterator[bytes]]:
+    """Every data product as NDJSON, one chunk per batch, from a consistent state of the store.
+
+    Returns the exported store version, the last change journal sequence
+    number included in the export and the chunks.
+    """
+    version, seq, batches = LocalDB().export(batch_size=batch_size)
+
+    def chunks() -> Iterator[bytes]:
+        exported = 0
+        for batch in batches:
+            exported += len(batch)
+            yield b"".join(record.encoded() for record in batch)
+        logger.info("Exported %s data products at version %s.", exported, version)
+    return version, seq, chunks()
+
+
+def read_changes(since: int = 0, limit: int = 1000, wait: float = 0.0) -> Tuple[List[DataProductChange], int]:
+    """Change journal entries after `since` and the last sequence number.
+
+    With `wait`, block up to that many seconds (at most MAX_CHANGES_WAIT)
+    until there is at least one entry. New readers bootstrap from an export
+    and follow the journal from the sequence number it returns. Raises
+    ChangesExpiredError when `since` is older than the retained journal.
+    """
+    deadline = time.monotonic() + min(wait, MAX_CHANGES_WAIT)
+    with LocalDB() as db:
+        while True:
+            changes, last = db.changes(since=since, limit=limit)
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                return changes, last
+            CHANGES.wait(since, remaining)
+
+
+class DataProductImporter:
+    """Streaming NDJSON import of data products, as written by `export_data_products`.
+
+    Feed it the raw bytes in chunks of any size: complete lines are validated
+    as they arrive and upserted every `batch_size` valid records, so memory
+    stays bounded by one batch and one line whatever the input size. Invalid
+    lines are reported and skipped, they do not stop the import.
+    """
+
+    def __init__(self, batch_size: int = TRANSFER_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.imported = 0
+        self.batches = 0
+        self.invalid = 0
+        self.errors: List[Dict[str, Any]] = []
+        self._line = 0
+        self._partial = b""
+        self._oversized = False
+        self._pending: List[DataProductState] = []
+
+    def _error(self, message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({"line": self._line, "error": message})
+
+    def _parse(self, line: bytes):
+        self._line += 1
+        if not line.strip():
+            return
+        try:
+            self._pending.append(DataProductState.model_validate_json(line))
+        except pydantic.ValidationError as exc:
+            self._error(str(exc.errors(include_url=False, include_input=False)))
+            return
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        # one session per batch: feed() may be called from different threads
+        with LocalDB() as db:
+            db.upsert_many(self._pending)
+        self.imported += len(self._pending)
+        self.batches += 1
+        self._pending = []
+
+    def feed(self, chunk: bytes):
+        lines = chunk.split(b"\n")
+        for i, piece in enumerate(lines):
+            last = i == len(lines) - 1
+            if self._oversized:
+                # skip the rest of a line that was too long
+                if not last:
+                    self._oversized = False
+                continue
+            if last:
+                self._partial += piece
+                if len(self._partial) > MAX_IMPORT_LINE:
+                    self._line += 1
+                    self._error(f"line longer than {MAX_IMPORT_LINE} bytes")
+                    self._partial, self._oversized = b"", True
+                continue
+            line, self._partial = self._partial + piece, b""
+            self._parse(line)
+
+    def close(self) -> Dict[str, Any]:
+        if self._partial:
+            self._parse(self._partial)
+            self._partial = b""
+        self._flush()
+        logger.info("Imported %s data products in %s batches, %s invalid lines.", self.imported, self.batches, self.invalid)
+        return {
+            "imported": self.imported,
+            "batches": self.batches,
+            "invalid": self.invalid,
+            "errors": self.errors,
+        }
+
+
+def generate_trino_catalogs(prune: bool = False) -> Dict[str, Any]:
+    """
+    Generate the dev and prd Trino catalogs of every data product.
+
+    Only catalogs whose content changed are rewritten. With `prune`,
+    generated catalogs of data products that no longer exist are removed.
+    """
+    snapshot = LocalDB().snapshot()
+    files = render_catalogs(TRINO_CATALOG_SETTINGS, ((dp.domain, dp.name) for dp in snapshot.data_products.values()))
+    report = trino_catalogs().sync(files, prune=prune)
+
+    missing = [
+        dp.name for dp in snapshot.data_products.values()
+        if not (dp.trino_dev_catalog and dp.trino_prd_catalog)
+    ]
+    if missing:
+        with LocalDB() as db:
+            for name in missing:
+                db.update(name, trino_dev_catalog=True, trino_prd_catalog=True)
+    return {
+        "written": report["written"],
+        "removed": report["removed"],
+        "unchanged": len(report["unchanged"]),
+    }
+
+
+def product_seeds_dir(name: str) -> str:
+    """Seeds directory of a data product repository, dbt project at the root (older layout) or under dbt/."""
+    repository = os.path.join(code_repository_url(), f"dp-{name}")
+    nested = os.path.join(repository, "dbt", "seeds")
+    return nested if os.path.isdir(nested) else os.path.join(repository, "seeds")
+
+
+def load_seeds(
+    name: str,
+    env: str = "dev",
+    namespace: str = "dbt",
+    seeds: Optional[List[str]] = None,
+    catalog_db: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Load the seed CSVs of a data product as Iceberg tables of its `env`
+    Trino catalog, written straight to its warehouse prefix. `seeds`
+    defaults to every CSV of the product's seeds directory, `catalog_db` to
+    SEED_CATALOG_DB or else the catalog database of the generated catalogs.
+    Columns are typed by the seeds' `column_types` in the dbt project.
+    """
+    from data_product_manager.componants.iceberg import JdbcCatalog
+    from data_product_manager.componants.seed_loader import SeedLoader, catalog_url, connect_catalog, open_warehouse
+
+    with LocalDB() as db:
+        dp = db.data_products.get(name)
+    if dp is None:
+        raise KeyError(f"Data product {name} not found in database.")
+    if seeds is None:
+        seeds_dir = product_seeds_dir(name)
+        seeds = sorted(os.path.join(seeds_dir, f) for f in os.listdir(seeds_dir) if f.endswith(".csv"))
+
+    project = dbt_models(name)
+    column_types = {seed["name"]: seed["column_types"] for seed in project["seeds"]} if project else {}
+
+    location = warehouse_location(TRINO_CATALOG_SETTINGS, dp.domain, dp.name, env)
+    conn = connect_catalog(catalog_db or os.environ.get("SEED_CATALOG_DB") or catalog_url(TRINO_CATALOG_SETTINGS))
+    try:
+        catalog = JdbcCatalog(conn, catalog_name(name, env))
+        catalog.ensure_schema()
+        loader = SeedLoader(open_warehouse(TRINO_CATALOG_SETTINGS, location), location, catalog, namespace=namespace)
+        return [
+            loader.load(path, column_types=column_types.get(os.path.splitext(os.path.basename(path))[0]))
+            for path in seeds
+        ]
+    finally:
+        conn.close()
+
+
+_dbt_index = None
+
+
+def dbt_index():
+    """The dbt index of the code repository, loaded from DBT_INDEX_PATH and refreshed at most every DBT_INDEX_REFRESH_INTERVAL seconds."""
+    global _dbt_index
+    if _dbt_index is None:
+        from data_product_manager.componants.dbt_index import DbtIndex
+
+        _dbt_index = DbtIndex(code_repository_url(), DBT_INDEX_PATH, refresh_interval=DBT_INDEX_REFRESH_INTERVAL)
+    _dbt_index.refresh()
+    return _dbt_index
+
+
+def dbt_models(name: str) -> Optional[Dict[str, Any]]:
+    """Models, seeds and sources of the dbt project of a data product, None if it has none."""
+    return dbt_index().product(name)
+
+
+def dbt_lineage(name: str, model: str, direction: str = "both", depth: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Upstream and/or downstream lineage of a model of a data product, None if either is unknown."""
+    return dbt_index().lineage(name, model, direction=direction, depth=depth)
+
+
+def ingest_airbyte(
+    source: BinaryIO,
+    catalog_path: str,
+    location: str,
+    batch_rows: Optional[int] = None,
+    batch_seconds: Optional[float] = None,
+    state_output=None,
+) -> Dict[str, Any]:
+    """
+    Write the records of Airbyte protocol messages read from `source`
+    (e.g. stdin, piped from a source's `read`) as Parquet files of the streams of the configured
+    catalog at `catalog_path`, under `location`: a local directory or an
+    s3:// prefix of the warehouse. Returns the ingestion report.
+    """
+    from data_product_manager.componants.airbyte_ingest import AirbyteIngest
+    from data_product_manager.componants.seed_loader import open_warehouse
+
+    with open(catalog_path, "r") as f:
+        catalog = json.load(f)
+    fs = open_warehouse(TRINO_CATALOG_SETTINGS, location)
+    path = location.split("://", 1)[1] if "://" in location else os.path.abspath(location)
+    options = {"batch_rows": batch_rows, "batch_seconds": batch_seconds}
+    ingest = AirbyteIngest(catalog, fs, path, state_output=state_output, **{k: v for k, v in options.items() if v is not None})
+    return ingest.run(source)
+
+
+_opa_bundle = None
+
+
+def opa_bundle() -> OpaBundle:
+    """The OPA bundle of the policies of OPA_POLICY_DIR or `opa/policies` of the config directory."""
+    global _opa_bundle
+    if _opa_bundle is None:
+        _opa_bundle = OpaBundle(os.environ.get("OPA_POLICY_DIR") or config_path("opa", "policies"))
+    return _opa_bundle
+
+
+def build_opa_bundle() -> Dict[str, Any]:
+    """
+    Bring the OPA bundle up to date with the registry and the dbt index:
+    only data products whose dbt project changed are recomputed, and the
+    tarball is only rebuilt when the policies or their data changed.
+    """
+    index = dbt_index()
+    snapshot = LocalDB().snapshot()
+    return opa_bundle().update({name: index.product(name) for name in snapshot.data_products})
+
+
+def bootstrap_keycloak_master(data: KeycloakMasterBootstrapData) -> Dict[str, Any]:
+    """
+    Read the realm state once, plan the missing changes and apply them.
+    With `dry_run`, only plan them. Returns the plan summary.
+    """
+    from data_product_manager.componants.keycloak_bootstrap import BootstrapPlan
+    from data_product_manager.componants.keycloak_client import get_keycloak_client
+
+    # defaults
+    if data.trino_redirect_uris is None:
+        data.trino_redirect_uris = ["https://trino.127.0.0.1.nip.io/oauth2/callback"]
+
+    # ----------------------
+    # Connect (scoped to master), shared with every request using the same credentials
+    # ----------------------
+    kc = get_keycloak_client(
+        server_url=data.keycloak_base_url,
+        username=data.admin_username,
+        password=data.admin_password,
+        realm_name=data.master_realm,      # ALL ops in master
+        verify=data.verify_tls,
+    )
+    logger.info("Using Keycloak client. Realm context: '%s'", data.master_realm)
+
+    plan = BootstrapPlan.build(
+        kc,
+        realm_name=data.master_realm,
+        trino_client_secret=data.trino_client_secret,
+        trino_redirect_uris=data.trino_redirect_uris,
+        trino_post_logout_uris=data.trino_post_logout_uris,
+    )
+    summary = plan.summary()
+    logger.info("Bootstrap plan for realm '%s': %d change(s), %d call(s) saved.", data.master_realm, len(plan.changes), summary["calls_saved"])
+    if data.dry_run:
+        return summary
+
+    plan.execute()
+    logger.info("✅ Done. All entities ensured in realm '%s'.", data.master_realm)
+    return summary
@@ -0,0 +1,24 @@
+import functools
+
+import pytest
+
+from data_product_manager import service
+from data_product_manager.db import LocalDB
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """Path of the store the service layer uses, in tmp_path."""
+    path = str(tmp_path / "products_db.sqlite")
+    monkeypatch.setattr(service, "LocalDB", functools.partial(LocalDB, path=path, legacy_path=None))
+    return path
+
+
+@pytest.fixture
+def client(registry):
+    from fastapi.testclient import TestClient
+
+    from data_product_manager import api
+
+    # outside of a `with` block the lifespan, and so the provisioning runner, is not started
+    return TestClient(api.app)
@@ -0,0 +1,95 @@
+import io
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.fs as pa_fs
+import pyarrow.parquet as pq
+
+from data_product_manager.componants.airbyte_ingest import CHECKPOINT_NAME, AirbyteIngest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "airbyte")
+CATALOG = os.path.join(FIXTURES, "catalog.json")
+MESSAGES = os.path.join(FIXTURES, "messages.jsonl")
+
+
+def fixture_messages() -> bytes:
+    with open(MESSAGES, "rb") as f:
+        return f.read()
+
+
+def fixture_states() -> list:
+    return [message["state"] for message in map(json.loads, fixture_messages().splitlines()[1:]) if message["type"] == "STATE"]
+
+
+def ingest(location, content: bytes, **kwargs) -> dict:
+    with open(CATALOG) as f:
+        catalog = json.load(f)
+    return AirbyteIngest(catalog, pa_fs.LocalFileSystem(), str(location), **kwargs).run(io.BytesIO(content))
+
+
+def read_stream(location, stream: str) -> list:
+    paths = sorted(str(path) for path in (location / stream).glob("*.parquet"))
+    return pa.concat_tables([pq.read_table(path) for path in paths]).to_pylist() if paths else []
+
+
+def test_fast_path(tmp_path):
+    report = ingest(tmp_path, fixture_messages(), batch_rows=2)
+    assert report["slow_chunks"] == 0
+    assert report["records"] == 9
+    # the purchases stream is not in the catalog
+    assert report["skipped"] == 1
+    assert report["states"] == 3
+    users = read_stream(tmp_path, "users")
+    assert [user["name"] for user in users] == ["Ada", "Grace", "Linus", "Barbara", "Ken", "Margaret"]
+    assert users[0]["age"] == 30 and users[0]["active"] is True and users[3]["age"] is None
+    assert users[0]["_airbyte_emitted_at"].timestamp() == 1760774400.0
+    assert [product["price"] for product in read_stream(tmp_path, "products")] == [19.99, 20.99, 21.99]
+    # 3 users before the first state and 3 after it, in batches of 2 rows
+    assert len(list((tmp_path / "users").glob("*.parquet"))) == 4
+
+
+def test_slow_path_for_values_not_matching_the_schema(tmp_path):
+    address = {"city": "Paris", "zip": "75001"}
+    line = {"type": "RECORD", "record": {"stream": "users", "data": {"id": 7, "name": "Alan", "address": address}, "emitted_at": 1760774400007}}
+    report = ingest(tmp_path, fixture_messages() + json.dumps(line).encode() + b"\n")
+    assert report["slow_chunks"] == 1
+    assert report["records"] == 10
+    assert report["states"] == 3
+    users = read_stream(tmp_path, "users")
+    assert [user["id"] for user in users] == [1, 2, 3, 4, 5, 6, 7]
+    # objects are kept as JSON strings
+    assert json.loads(users[-1]["address"]) == address
+
+
+def test_checkpoint(tmp_path):
+    ingest(tmp_path, fixture_messages())
+    with open(tmp_path / CHECKPOINT_NAME) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["state"] == fixture_states()[-1]
+    assert {stream: entry["records"] for stream, entry in checkpoint["streams"].items()} == {"users": 6, "products": 3}
+    for stream, entry in checkpoint["streams"].items():
+        assert sorted(entry["files"]) == sorted(str(path) for path in (tmp_path / stream).glob("*.parquet"))
+    assert "at" in checkpoint
+
+    # a second run appends to users and replaces the products of the overwrite stream
+    ingest(tmp_path, fixture_messages())
+    assert len(read_stream(tmp_path, "users")) == 12
+    assert len(read_stream(tmp_path, "products")) == 3
+
+
+def test_emit_state(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "-m", "data_product_manager.cli", "ingest", MESSAGES, "--catalog", CATALOG, "--output", str(tmp_path), "--emit-state"],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        check=True,
+    )
+    emitted = [json.loads(line) for line in result.stdout.splitlines()]
+    assert emitted == [{"type": "STATE", "state": state} for state in fixture_states()]
+    assert json.loads(result.stderr)["records"] == 9
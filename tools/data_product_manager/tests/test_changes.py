@@ -0,0 +1,71 @@
+import time
+import threading
+
+from data_product_manager import db as registry_db
+from data_product_manager.db import CHANGES, DataProductState, LocalDB
+
+
+def product(name: str, domain: str = "sales", **flags) -> DataProductState:
+    return DataProductState(name=name, domain=domain, description=f"{name} data", admin_emails=[f"{name}@example.com"], **flags)
+
+
+def test_follow_changes_from_an_export(registry, client):
+    with LocalDB(path=registry, legacy_path=None) as db:
+        db.insert(product("orders"))
+        db.insert(product("users"))
+    exported = client.get("/data-product/export")
+    seq = int(exported.headers["x-changes-seq"])
+    assert client.get("/changes", params={"since": seq}).json() == {"changes": [], "next_since": seq, "last_seq": seq}
+
+    with LocalDB(path=registry, legacy_path=None) as db:
+        db.update("orders", code_repository=True)
+        db.insert(product("stocks", domain="supply"))
+    feed = client.get("/changes", params={"since": seq}).json()
+    assert [(change["op"], change["name"]) for change in feed["changes"]] == [("update", "orders"), ("insert", "stocks")]
+    assert feed["changes"][0]["data_product"]["code_repository"] is True
+    assert feed["next_since"] == feed["last_seq"] == seq + 2
+
+    page = client.get("/changes", params={"since": 0, "limit": 3}).json()
+    assert [change["seq"] for change in page["changes"]] == [1, 2, 3]
+    assert page["next_since"] == 3 and page["last_seq"] == 4
+
+
+def test_expired_changes(registry, client, monkeypatch):
+    monkeypatch.setattr(registry_db, "CHANGES_RETENTION", 3)
+    for i in range(6):
+        with LocalDB(path=registry, legacy_path=None) as db:
+            db.insert(product(f"p{i}"))
+    response = client.get("/changes", params={"since": 1})
+    assert response.status_code == 410
+    assert response.json()["detail"]["oldest_seq"] == 4
+    # readers that kept up are still served
+    assert [change["seq"] for change in client.get("/changes", params={"since": 3}).json()["changes"]] == [4, 5, 6]
+
+
+def test_wait_returns_on_write(registry, client, monkeypatch):
+    # the poll interval is longer than the test: only the write can wake the reader up
+    monkeypatch.setattr(CHANGES, "poll_interval", 30)
+    # sequence numbers notified by the stores of other tests
+    monkeypatch.setattr(CHANGES, "_seq", 0)
+    with LocalDB(path=registry, legacy_path=None) as db:
+        db.insert(product("orders"))
+
+    def write():
+        time.sleep(0.3)
+        with LocalDB(path=registry, legacy_path=None) as db:
+            db.update("orders", keycloak_group=True)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    start = time.monotonic()
+    feed = client.get("/changes", params={"since": 1, "wait": 20}).json()
+    elapsed = time.monotonic() - start
+    writer.join()
+    assert [change["name"] for change in feed["changes"]] == ["orders"]
+    assert 0.2 < elapsed < 5
+
+    # without a write, the wait runs to its end
+    monkeypatch.setattr(CHANGES, "poll_interval", 0.1)
+    start = time.monotonic()
+    assert client.get("/changes", params={"since": 2, "wait": 0.5}).json()["changes"] == []
+    assert time.monotonic() - start >= 0.5
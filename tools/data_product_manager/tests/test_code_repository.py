@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from data_product_manager.componants.code_repository import ForkMode, IgnoreRules, LocalRepositoryConnector, template_manifest
+
+
+def write(path, content: str = ""):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def touch_later(path):
+    # mtimes may not move within the filesystem timestamp granularity
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def template(tmp_path):
+    root = tmp_path / "_template"
+    write(root / ".gitignore", "*.log\n!keep.log\nbuild/\n/top.txt\ndocs/*.tmp\n")
+    write(root / "app.log")
+    write(root / "keep.log")
+    write(root / "top.txt")
+    write(root / "build" / "out.bin")
+    write(root / "src" / "build")
+    write(root / "src" / "top.txt")
+    write(root / "src" / "debug.log")
+    write(root / "docs" / "notes.tmp")
+    write(root / "docs" / "nested" / "notes.tmp")
+    write(root / "dbt" / ".gitignore", "target/\n!*.log\n")
+    write(root / "dbt" / "target" / "manifest.json")
+    write(root / "dbt" / "run.log")
+    write(root / "dbt" / "models" / "orders.sql", "select 1")
+    return root
+
+
+def test_ignore_rules(template):
+    rules = IgnoreRules().extend("", str(template / ".gitignore"))
+    # globs match at any depth, negations win when they come later
+    assert rules.ignored("app.log", False) and rules.ignored("src/debug.log", False)
+    assert not rules.ignored("keep.log", False) and not rules.ignored("src/keep.log", False)
+    # directory only patterns
+    assert rules.ignored("build", True) and rules.ignored("src/build", True)
+    assert not rules.ignored("src/build", False)
+    # patterns with a slash are anchored to the .gitignore directory
+    assert rules.ignored("top.txt", False) and not rules.ignored("src/top.txt", False)
+    assert rules.ignored("docs/notes.tmp", False) and not rules.ignored("docs/nested/notes.tmp", False)
+
+    write(template / "more.gitignore", "logs/**/*.gz\nv[!0-9].sql\n")
+    more = IgnoreRules().extend("", str(template / "more.gitignore"))
+    assert more.ignored("logs/a.gz", False) and more.ignored("logs/2024/01/a.gz", False)
+    assert not more.ignored("src/logs/a.gz", False)
+    assert more.ignored("models/vx.sql", False) and not more.ignored("models/v2.sql", False)
+
+    nested = rules.extend("dbt", str(template / "dbt" / ".gitignore"))
+    assert nested.ignored("dbt/target", True) and not nested.ignored("target", True)
+    assert not nested.ignored("dbt/run.log", False) and nested.ignored("src/debug.log", False)
+
+
+def test_manifest(template):
+    manifest = template_manifest(str(template))
+    assert sorted(manifest.dirs) == ["dbt", "dbt/models", "docs", "docs/nested", "src"]
+    assert sorted(manifest.files) == [
+        ".gitignore", "dbt/.gitignore", "dbt/models/orders.sql", "dbt/run.log",
+        "docs/nested/notes.tmp", "keep.log", "src/build", "src/top.txt",
+    ]
+    assert template_manifest(str(template)) is manifest
+
+    # editing a .gitignore invalidates the cached manifest, even without any directory change
+    (template / "dbt" / ".gitignore").write_text("target/\n")
+    touch_later(template / "dbt" / ".gitignore")
+    rescanned = template_manifest(str(template))
+    assert rescanned is not manifest
+    assert "dbt/run.log" not in rescanned.files
+
+    write(template / "src" / "new.sql")
+    touch_later(template / "src")
+    assert "src/new.sql" in template_manifest(str(template)).files
+
+
+def test_fork(tmp_path, template):
+    connector = LocalRepositoryConnector(str(tmp_path), ForkMode.COPY)
+    connector.create("dp-sales", "sales", fork="_template")
+    repo = tmp_path / "dp-sales"
+    assert (repo / "dbt" / "models" / "orders.sql").read_text() == "select 1"
+    assert not (repo / "app.log").exists() and not (repo / "dbt" / "target").exists()
+    assert not (tmp_path / "dp-sales.partial").exists()
+
+    # the fork does not share its files with the template
+    (repo / "dbt" / "models" / "orders.sql").write_text("select 2")
+    assert (template / "dbt" / "models" / "orders.sql").read_text() == "select 1"
+
+    with pytest.raises(FileExistsError):
+        connector.create("dp-sales", "sales", fork="_template")
+
+
+def test_partial_fork_is_cleaned_up(tmp_path, template, monkeypatch):
+    connector = LocalRepositoryConnector(str(tmp_path), ForkMode.COPY)
+    # leftover of an interrupted fork
+    write(tmp_path / "dp-sales.partial" / "stale.txt")
+
+    copied = []
+
+    def copy_file(src, dst):
+        if len(copied) == 3:
+            raise OSError("disk full")
+        copied.append(dst)
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fdst.write(fsrc.read())
+
+    monkeypatch.setattr(connector, "_copy_file", copy_file)
+    with pytest.raises(OSError):
+        connector.create("dp-sales", "sales", fork="_template")
+    assert not (tmp_path / "dp-sales.partial").exists()
+    assert not connector.exists("dp-sales")
+
+    monkeypatch.undo()
+    write(tmp_path / "dp-sales.partial" / "stale.txt")
+    connector.create("dp-sales", "sales", fork="_template")
+    assert connector.exists("dp-sales")
+    assert not (tmp_path / "dp-sales" / "stale.txt").exists()
+    assert not (tmp_path / "dp-sales.partial").exists()
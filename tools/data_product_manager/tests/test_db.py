@@ -0,0 +1,114 @@
+import json
+import time
+import multiprocessing
+
+import pytest
+
+from data_product_manager.db import FLAG_FIELDS, DataProductExistsError, DataProductState, LocalDB
+
+
+def product(name: str, domain: str = "sales", **flags) -> DataProductState:
+    return DataProductState(name=name, domain=domain, description=f"{name} data", admin_emails=[f"{name}@example.com"], **flags)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "products_db.sqlite")
+
+
+def open_db(path: str) -> LocalDB:
+    return LocalDB(path=path, legacy_path=None)
+
+
+def test_migrate_legacy_json(tmp_path, db_path):
+    legacy = tmp_path / "products_db.json"
+    legacy.write_text(json.dumps({"data_products": {
+        "orders": product("orders", code_repository=True).model_dump(),
+        "stocks": product("stocks", domain="supply").model_dump(),
+    }}))
+    with LocalDB(path=db_path, legacy_path=str(legacy)) as db:
+        assert sorted(db.data_products) == ["orders", "stocks"]
+        assert db.data_products["orders"].code_repository
+        assert db.data_products["stocks"].domain == "supply"
+    assert not legacy.exists()
+    assert (tmp_path / "products_db.json.migrated").exists()
+
+    # the import runs once, a new legacy file does not overwrite existing records
+    legacy.write_text(json.dumps({"data_products": {"orders": product("orders", domain="other").model_dump()}}))
+    with LocalDB(path=db_path, legacy_path=str(legacy)) as db:
+        assert db.data_products["orders"].domain == "sales"
+
+
+def test_insert_existing(db_path):
+    with open_db(db_path) as db:
+        db.insert(product("orders"))
+    with open_db(db_path) as db:
+        with pytest.raises(DataProductExistsError):
+            db.insert(product("orders"))
+
+    # inserted by another writer after the in-memory check
+    first, second = open_db(db_path), open_db(db_path)
+    first.load()
+    second.load()
+    try:
+        first.insert(product("stocks"))
+        second.insert(product("stocks", domain="supply"))
+        first.save()
+        with pytest.raises(DataProductExistsError):
+            second.save()
+    finally:
+        first.close()
+        second.close()
+    with open_db(db_path) as db:
+        assert db.data_products["stocks"].domain == "sales"
+
+
+def test_merge_concurrent_updates(db_path):
+    with open_db(db_path) as db:
+        db.insert(product("orders"))
+    first, second = open_db(db_path), open_db(db_path)
+    first.load()
+    second.load()
+    try:
+        # both read the record at the same version
+        assert not first.data_products["orders"].code_repository
+        assert not second.data_products["orders"].keycloak_group
+        first.update("orders", code_repository=True)
+        first.save()
+        second.update("orders", keycloak_group=True, description="merged")
+        second.save()
+        # the second writer sees the changes of the first one once merged
+        assert second.data_products["orders"].code_repository
+    finally:
+        first.close()
+        second.close()
+    with open_db(db_path) as db:
+        merged = db.data_products["orders"]
+        assert merged.code_repository and merged.keycloak_group
+        assert merged.description == "merged"
+
+
+def set_flag(args):
+    path, flag = args
+    db = open_db(path)
+    db.load()
+    try:
+        db.insert(product(f"own-{flag}"))
+        db.update("shared", **{flag: True})
+        # let the other workers read the record before this one saves
+        time.sleep(0.2)
+        db.save()
+    finally:
+        db.close()
+    return flag
+
+
+def test_concurrent_writers(db_path):
+    with open_db(db_path) as db:
+        db.insert(product("shared"))
+    with multiprocessing.get_context("spawn").Pool(len(FLAG_FIELDS)) as pool:
+        assert sorted(pool.map(set_flag, [(db_path, flag) for flag in FLAG_FIELDS])) == sorted(FLAG_FIELDS)
+    with open_db(db_path) as db:
+        shared = db.data_products["shared"]
+        assert all(getattr(shared, flag) for flag in FLAG_FIELDS)
+        assert sorted(db.data_products) == sorted(["shared", *(f"own-{flag}" for flag in FLAG_FIELDS)])
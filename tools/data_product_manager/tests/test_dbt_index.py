@@ -0,0 +1,190 @@
+import os
+import json
+
+import pytest
+
+from data_product_manager.componants import dbt_index
+from data_product_manager.componants.dbt_index import INDEX_FORMAT, DbtIndex
+
+PROJECT = """
+name: sales
+models:
+  sales:
+    +materialized: view
+    marts:
+      +materialized: table
+seeds:
+  sales:
+    +column_types:
+      amount: decimal(10, 2)
+"""
+SCHEMA = """
+version: 2
+sources:
+  - name: raw
+    tables:
+      - name: orders
+models:
+  - name: stats
+    latest_version: 1
+    versions:
+      - v: 1
+      - v: 2
+"""
+MODELS = {
+    "staging/stg_orders.sql": "select * from {{ source('raw', 'orders') }}",
+    "staging/stg_rates.sql": "select * from {{ ref('rates') }}",
+    "marts/orders.sql": "select * from {{ ref('stg_orders') }} join {{ ref('stg_rates') }} using (currency)",
+    "marts/stats_v1.sql": "select count(*) as total from {{ ref('orders') }}",
+    "marts/stats_v2.sql": "{{ config(materialized='incremental') }} select count(*) as total from {{ ref('orders') }}",
+    "report.sql": "select * from {{ ref('stats') }} union all select * from {{ ref('stats', v=2) }}",
+}
+
+
+def write(path, content: str = ""):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def touch_later(path):
+    # mtimes may not move within the filesystem timestamp granularity
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "repos"
+    project = root / "dp-sales" / "dbt"
+    write(project / "dbt_project.yml", PROJECT)
+    write(project / "models" / "schema.yml", SCHEMA)
+    for path, sql in MODELS.items():
+        write(project / "models" / path, sql)
+    write(project / "seeds" / "rates.csv", "currency,amount\nEUR,1.0\n")
+    write(root / "dp-hr" / "dbt_project.yml", "name: hr\n")
+    write(root / "_template" / "dbt" / "dbt_project.yml", "name: template\n")
+    return root
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Kinds of the files parsed, in order."""
+    calls = []
+    for kind, parser in dbt_index.PARSERS.items():
+        def counting(content, parser=parser, kind=kind):
+            calls.append(kind)
+            return parser(content)
+
+        monkeypatch.setitem(dbt_index.PARSERS, kind, counting)
+    return calls
+
+
+def test_only_changed_files_are_parsed(root, tmp_path, parsed):
+    index = DbtIndex(str(root), str(tmp_path / "index.json"), refresh_interval=0)
+    report = index.refresh(force=True)
+    assert report["files"] == 10 and report["changed_products"] == ["hr", "sales"]
+    assert len(parsed) == 10
+    assert index.products() == ["hr", "sales"]
+    product = index.product("sales")
+
+    parsed.clear()
+    assert index.refresh(force=True)["changed_products"] == []
+    assert parsed == []
+    assert index.product("sales") is product
+
+    # a touched file with the same content is re-read but not re-parsed
+    touch_later(root / "dp-sales" / "dbt" / "models" / "report.sql")
+    assert index.refresh(force=True)["changed_products"] == []
+    assert parsed == []
+
+    model = root / "dp-sales" / "dbt" / "models" / "marts" / "orders.sql"
+    model.write_text("select * from {{ ref('stg_orders') }}")
+    touch_later(model)
+    report = index.refresh(force=True)
+    assert report["changed_products"] == ["sales"]
+    assert parsed == ["sql"]
+    rebuilt = index.product("sales")
+    assert rebuilt is not product
+    assert next(m for m in rebuilt["models"] if m["id"] == "orders")["upstream"] == ["stg_orders"]
+
+    (root / "dp-hr" / "dbt_project.yml").unlink()
+    report = index.refresh(force=True)
+    assert (report["changed_products"], report["removed_files"]) == (["hr"], 1)
+    assert index.products() == ["sales"] and index.product("hr") is None
+
+
+def test_refresh_interval(root, tmp_path, parsed):
+    index = DbtIndex(str(root), str(tmp_path / "index.json"), refresh_interval=3600)
+    assert index.refresh() != {"skipped": True}
+    write(root / "dp-sales" / "dbt" / "models" / "new.sql", "select 1")
+    assert index.refresh() == {"skipped": True}
+    assert "new" not in {m["id"] for m in index.product("sales")["models"]}
+    assert index.refresh(force=True)["changed_products"] == ["sales"]
+
+
+def test_persisted_index(root, tmp_path, parsed):
+    path = tmp_path / "index.json"
+    DbtIndex(str(root), str(path), refresh_interval=0).refresh(force=True)
+    with open(path) as f:
+        persisted = json.load(f)
+    assert persisted["format"] == INDEX_FORMAT and persisted["root"] == os.path.abspath(root)
+    entry = persisted["files"][str(root / "dp-sales" / "dbt" / "seeds" / "rates.csv")]
+    assert (entry["product"], entry["kind"], entry["data"]) == ("sales", "seed", {"columns": ["currency", "amount"]})
+
+    # a restart parses nothing
+    parsed.clear()
+    restarted = DbtIndex(str(root), str(path), refresh_interval=0)
+    assert restarted.refresh(force=True)["changed_products"] == []
+    assert parsed == []
+    assert restarted.product("sales")["seeds"][0]["column_types"] == {"amount": "decimal(10, 2)"}
+
+    # an index of another format, or of another root, is rebuilt
+    for stale in ({"format": INDEX_FORMAT - 1}, {"root": str(tmp_path / "other")}):
+        with open(path, "w") as f:
+            json.dump({**persisted, **stale}, f)
+        parsed.clear()
+        DbtIndex(str(root), str(path), refresh_interval=0).refresh(force=True)
+        assert len(parsed) == 10
+
+    path.write_text("{not json")
+    assert DbtIndex(str(root), str(path), refresh_interval=0).refresh(force=True)["changed_products"] == ["hr", "sales"]
+
+
+def test_models(root, tmp_path):
+    index = DbtIndex(str(root), str(tmp_path / "index.json"), refresh_interval=0)
+    index.refresh(force=True)
+    product = index.product("sales")
+    models = {m["id"]: m for m in product["models"]}
+    assert sorted(models) == ["orders", "report", "stats.v1", "stats.v2", "stg_orders", "stg_rates"]
+    assert {i: m["materialized"] for i, m in models.items()} == {
+        "orders": "table", "report": "view", "stats.v1": "table", "stats.v2": "incremental", "stg_orders": "view", "stg_rates": "view",
+    }
+    assert models["stats.v2"]["relation"] == "stats_v2"
+    # a ref without a version resolves to the latest version, not the highest
+    assert models["report"]["upstream"] == ["stats.v1", "stats.v2"]
+    assert models["stg_rates"]["upstream"] == ["seed:rates"]
+    assert models["stg_orders"]["upstream"] == ["source:raw.orders"]
+    assert product["sources"] == ["raw.orders"]
+
+
+def test_lineage(root, tmp_path):
+    index = DbtIndex(str(root), str(tmp_path / "index.json"), refresh_interval=0)
+    index.refresh(force=True)
+
+    lineage = index.lineage("sales", "stats")
+    assert lineage["model"] == "stats.v1"
+    assert lineage["nodes"] == ["orders", "report", "seed:rates", "source:raw.orders", "stats.v1", "stg_orders", "stg_rates"]
+
+    upstream = index.lineage("sales", "stats.v2", direction="upstream", depth=1)
+    assert upstream["nodes"] == ["orders", "stats.v2"]
+    assert upstream["edges"] == [{"from": "orders", "to": "stats.v2"}]
+    upstream = index.lineage("sales", "stats.v2", direction="upstream", depth=2)
+    assert upstream["nodes"] == ["orders", "stats.v2", "stg_orders", "stg_rates"]
+
+    downstream = index.lineage("sales", "stg_orders", direction="downstream")
+    assert downstream["nodes"] == ["orders", "report", "stats.v1", "stats.v2", "stg_orders"]
+    assert {"from": "stats.v2", "to": "report"} in downstream["edges"]
+    assert index.lineage("sales", "stg_orders", direction="downstream", depth=0)["nodes"] == ["stg_orders"]
+
+    assert index.lineage("sales", "missing") is None
+    assert index.lineage("missing", "orders") is None
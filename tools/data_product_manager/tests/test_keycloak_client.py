@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from bench.fake_keycloak import FakeKeycloak
+from data_product_manager.componants import keycloak_client
+from data_product_manager.componants.keycloak_client import KeycloakClient, get_keycloak_client
+
+
+@pytest.fixture
+def fake_keycloak():
+    with FakeKeycloak(token_lifetime=2) as kc:
+        yield kc
+
+
+def test_token_is_reused_across_calls(fake_keycloak):
+    client = KeycloakClient(fake_keycloak.url, "admin", "admin")
+    for _ in range(20):
+        client.get_groups()
+    assert fake_keycloak.token_requests == 1
+    assert client.stats()["calls"] == 20
+    client.close()
+    with pytest.raises(RuntimeError):
+        client.get_groups()
+
+
+def test_token_is_refreshed_before_expiry(fake_keycloak):
+    client = KeycloakClient(fake_keycloak.url, "admin", "admin", refresh_margin=30)
+    client.get_groups()
+    # 2s tokens are refreshed half way through their lifetime
+    time.sleep(1.1)
+    client.get_groups()
+    client.get_groups()
+    assert fake_keycloak.token_requests == 2
+    client.close()
+
+
+def test_clients_are_shared_and_replaced_on_new_credentials():
+    with FakeKeycloak(password="s3cret") as kc:
+        try:
+            first = get_keycloak_client(kc.url, "admin", "s3cret")
+            assert get_keycloak_client(kc.url, "admin", "s3cret") is first
+            assert not any("s3cret" in key for key in keycloak_client._clients)
+
+            first.get_groups()
+            replaced = get_keycloak_client(kc.url, "admin", "rotated")
+            assert replaced is not first
+            assert len(keycloak_client._clients) == 1
+            # the replaced client is left open for the callers still holding it
+            first.get_groups()
+        finally:
+            keycloak_client.close_keycloak_clients()
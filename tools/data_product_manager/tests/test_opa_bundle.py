@@ -0,0 +1,186 @@
+import io
+import os
+import json
+import gzip
+import tarfile
+
+import pytest
+
+from data_product_manager.componants.dbt_index import DbtIndex
+from data_product_manager.componants.opa_bundle import OpaBundle, product_policies
+
+POLICY_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..", "config", "opa", "policies")
+
+PROJECT = "name: sales\nmodel-paths: [models]\n"
+MODELS = """
+version: 2
+models:
+  - name: orders
+    config:
+      meta:
+        row_filter: "region = current_region()"
+    columns:
+      - name: id
+      - name: email
+        meta:
+          mask: "'***'"
+  - name: customers
+    config:
+      schema: marts
+    meta:
+      row_filter:
+        - "active"
+        - "country <> 'XX'"
+  - name: stats
+    latest_version: 2
+    columns:
+      - name: total
+        meta:
+          mask: "0"
+    versions:
+      - v: 1
+      - v: 2
+  - name: plain
+"""
+
+
+def write_project(root: str, name: str, models: str = MODELS):
+    project = os.path.join(root, f"dp-{name}", "dbt")
+    os.makedirs(os.path.join(project, "models"), exist_ok=True)
+    with open(os.path.join(project, "dbt_project.yml"), "w") as f:
+        f.write(PROJECT)
+    with open(os.path.join(project, "models", "schema.yml"), "w") as f:
+        f.write(models)
+    for model in ("orders", "customers", "stats_v1", "stats_v2", "plain"):
+        with open(os.path.join(project, "models", f"{model}.sql"), "w") as f:
+            f.write("select 1 as id")
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / "repos"
+    root.mkdir()
+    write_project(str(root), "sales")
+    write_project(str(root), "finance", models="version: 2\nmodels:\n  - name: orders\n")
+    index = DbtIndex(str(root), str(tmp_path / "index.json"), refresh_interval=0)
+    index.refresh(force=True)
+    return index
+
+
+@pytest.fixture
+def policy_dir(tmp_path):
+    directory = tmp_path / "policies"
+    (directory / "rls").mkdir(parents=True)
+    (directory / "rls" / "default.rego").write_text("package trino\n")
+    (directory / "notes.md").write_text("not packed")
+    return directory
+
+
+def read_bundle(content: bytes) -> dict:
+    with tarfile.open(fileobj=io.BytesIO(gzip.decompress(content))) as tar:
+        return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+
+
+def test_product_policies(index):
+    policies = product_policies("sales", index.product("sales"))
+    tables = {
+        "dbt": {
+            "orders": {
+                "row_filters": [{"expression": "region = current_region()"}],
+                "columns": {"email": {"expression": "'***'"}},
+            },
+            "stats_v1": {"row_filters": [], "columns": {"total": {"expression": "0"}}},
+            "stats_v2": {"row_filters": [], "columns": {"total": {"expression": "0"}}},
+        },
+        "dbt_marts": {
+            "customers": {
+                "row_filters": [{"expression": "active"}, {"expression": "country <> 'XX'"}],
+                "columns": {},
+            },
+        },
+    }
+    assert policies == {"dp_sales_dev": tables, "dp_sales_prd": tables}
+    assert product_policies("finance", index.product("finance")) == {}
+
+
+def test_update_rebuilds_only_changed_products(index, policy_dir):
+    bundle = OpaBundle(str(policy_dir))
+    projects = {"sales": index.product("sales"), "finance": index.product("finance")}
+    first = bundle.update(projects)
+    assert first["changed"] == ["finance", "sales"]
+    assert first["policies_changed"]
+    revision, content = bundle.current()
+
+    again = bundle.update(projects)
+    assert again["changed"] == [] and not again["policies_changed"]
+    assert bundle.current() == (revision, content)
+
+    # a new view with the same policies leaves the bundle as it is
+    again = bundle.update({**projects, "finance": json.loads(json.dumps(projects["finance"]))})
+    assert again["changed"] == []
+    assert bundle.current() == (revision, content)
+
+    masked = json.loads(json.dumps(projects["sales"]))
+    masked["models"][0]["column_masks"]["name"] = "NULL"
+    changed = bundle.update({**projects, "sales": masked})
+    assert changed["changed"] == ["sales"]
+    assert changed["revision"] != revision
+
+    removed = bundle.update({"sales": masked})
+    assert removed["changed"] == ["finance"]
+
+    (policy_dir / "rls" / "default.rego").write_text("package trino\n\ndefault allow := true\n")
+    edited = bundle.update({"sales": masked})
+    assert edited["changed"] == [] and edited["policies_changed"]
+    assert edited["revision"] != removed["revision"]
+
+
+def test_revision_and_content_are_stable(index, policy_dir):
+    projects = {"sales": index.product("sales"), "finance": index.product("finance")}
+    first, second = OpaBundle(str(policy_dir)), OpaBundle(str(policy_dir))
+    first.update(projects)
+    second.update(dict(reversed(projects.items())))
+    assert first.current() == second.current()
+
+
+def test_tarball_layout(index, policy_dir):
+    bundle = OpaBundle(str(policy_dir))
+    bundle.update({"sales": index.product("sales"), "finance": index.product("finance")})
+    revision, content = bundle.current()
+    files = read_bundle(content)
+    assert list(files) == ["/.manifest", "/rls/default.rego", "/trino/policies/data.json"]
+    assert json.loads(files["/.manifest"]) == {"revision": revision, "roots": ["trino"]}
+    assert json.loads(files["/trino/policies/data.json"]) == product_policies("sales", index.product("sales"))
+
+
+def test_rego_looks_up_row_filters_and_column_masks(index):
+    regopy = pytest.importorskip("regopy")
+    bundle = OpaBundle(POLICY_DIR)
+    bundle.update({"sales": index.product("sales")})
+    files = read_bundle(bundle.current()[1])
+
+    def query(rule: str, resource: dict, user: str = "analyst"):
+        interpreter = regopy.Interpreter()
+        for path, content in files.items():
+            if path.endswith(".rego"):
+                interpreter.add_module(path, content.decode())
+        interpreter.add_data_json(json.dumps({"trino": {"policies": json.loads(files["/trino/policies/data.json"])}}))
+        interpreter.set_input_term(json.dumps({
+            "context": {"identity": {"user": user}},
+            "action": {"operation": "GetRowFilters", "resource": resource},
+        }))
+        output = str(interpreter.query(f"data.trino.{rule}"))
+        return None if output == "undefined" else json.loads(output)["expressions"][0]
+
+    customers = {"table": {"catalogName": "dp_sales_prd", "schemaName": "dbt_marts", "tableName": "customers"}}
+    assert sorted(query("rowFilters", customers), key=lambda f: f["expression"]) == [
+        {"expression": "active"},
+        {"expression": "country <> 'XX'"},
+    ]
+    assert query("rowFilters", customers, user="admin") == []
+    assert query("rowFilters", {"table": {"catalogName": "dp_sales_prd", "schemaName": "dbt", "tableName": "plain"}}) == []
+
+    email = {"column": {"catalogName": "dp_sales_dev", "schemaName": "dbt", "tableName": "orders", "columnName": "email", "columnType": "varchar"}}
+    assert query("columnMask", email) == {"expression": "'***'"}
+    assert query("columnMask", email, user="admin") is None
+    assert query("columnMask", {"column": {**email["column"], "columnName": "id"}}) is None
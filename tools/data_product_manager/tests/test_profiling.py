@@ -0,0 +1,70 @@
+import json
+import time
+import asyncio
+import threading
+
+from data_product_manager import profiling, service
+
+
+def spin(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def frame_names(profile: dict, document: dict) -> set:
+    frames = document["shared"]["frames"]
+    # qualified names, keep the function name
+    return {frames[i]["name"].rsplit(".", 1)[-1] for sample in profile["samples"] for i in sample}
+
+
+def test_profiled_sync_endpoint(registry, client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+
+    def slow_listing(query, use_snapshot=True):
+        spin(0.3)
+        return 1, ["orders"], None
+
+    monkeypatch.setattr(service, "list_data_products", slow_listing)
+    assert "x-profile-file" not in client.get("/data-product").headers
+    assert "x-profile-file" not in client.get("/data-product", headers={"X-Profile": "wrong"}).headers
+
+    response = client.get("/data-product", headers={"X-Profile": "s3cret"})
+    assert response.json()["data_products"] == ["orders"]
+    path = tmp_path / "profiles" / response.headers["x-profile-file"]
+    assert path.name.endswith(".speedscope.json")
+    with open(path) as f:
+        document = json.load(f)
+    # only the threadpool thread running the endpoint is sampled, not the event loop
+    (profile,) = document["profiles"]
+    assert "shared" not in profile["name"]
+    assert {"slow_listing", "_list"} <= frame_names(profile, document)
+    assert sum(profile["weights"]) > 0.1
+
+
+def test_only_joined_threads_are_sampled():
+    other = threading.Thread(target=spin, args=(0.3,), name="unrelated")
+    with profiling.SamplingProfiler(interval=0.002) as profiler:
+        other.start()
+        spin(0.1)
+        with profiling.profile_thread():
+            spin(0.2)
+    other.join()
+    threads = {thread for thread, *_ in profiler.samples}
+    assert threads == {threading.current_thread().name}
+    assert all(stack[-1][0] == "spin" for _, *stack in profiler.samples)
+
+
+def test_event_loop_samples_are_marked_shared():
+    @profiling.profiled_async
+    async def busy_endpoint():
+        spin(0.2)
+
+    with profiling.SamplingProfiler(interval=0.002) as profiler:
+        asyncio.run(busy_endpoint())
+    document = profiler.speedscope("async")
+    (profile,) = document["profiles"]
+    assert profile["name"].endswith("(event loop, shared with concurrent requests)")
+    assert "busy_endpoint" in frame_names(profile, document)
+    assert "(event loop, shared with concurrent requests)" in profiler.collapsed().split(";")[0]
@@ -0,0 +1,199 @@
+import time
+import sqlite3
+import threading
+
+import pytest
+
+from data_product_manager import service
+from data_product_manager.db import READ_VERSION, DataProductState, LocalDB
+from data_product_manager.provisioning import ProvisioningRunner, ProvisioningStep, Reconciler
+from data_product_manager.service import DataProductBatchCreateData
+
+
+def product(name: str, domain: str = "sales", **flags) -> DataProductState:
+    return DataProductState(name=name, domain=domain, description=f"{name} data", admin_emails=[f"{name}@example.com"], **flags)
+
+
+def item(name: str, domain: str = "sales") -> dict:
+    return {"name": name, "domain": domain, "description": f"the {name} data product", "admin_emails": [f"{name}@example.com"]}
+
+
+def store_version(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(READ_VERSION).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def runner(registry):
+    runner = ProvisioningRunner(steps=[], db_path=registry)
+    yield runner
+    runner.shutdown()
+
+
+def test_batch_items_fail_independently(registry, runner):
+    with LocalDB(path=registry, legacy_path=None) as db:
+        db.insert(product("stocks"))
+    version = store_version(registry)
+
+    report = service.create_data_products(runner, DataProductBatchCreateData(data_products=[
+        item("orders"),
+        {"name": "bad", "domain": "sales"},
+        "users",
+        item("orders", domain="supply"),
+        item("stocks"),
+        item("users"),
+    ]))
+    assert runner.join(timeout=10)
+
+    assert (report["queued"], report["invalid"], report["rejected"]) == (2, 2, 2)
+    results = report["results"]
+    assert [result["index"] for result in results] == list(range(6))
+    # the jobs of queued items may already be running
+    statuses = [result["status"] for result in results]
+    assert statuses[1:5] == ["invalid", "invalid", "rejected", "rejected"]
+    assert "job_id" in results[0] and "job_id" in results[5]
+    assert results[1]["name"] == "bad"
+    assert {error["loc"][0] for error in results[1]["errors"]} == {"description", "admin_emails"}
+    assert results[2]["name"] is None
+    assert results[3]["error"] == "duplicate in batch"
+    assert results[4]["error"] == "data product already exists"
+    # the valid items and their jobs are written by one transaction
+    assert store_version(registry) == version + 1
+
+    with LocalDB(path=registry, legacy_path=None) as db:
+        assert sorted(db.data_products) == ["orders", "stocks", "users"]
+        assert db.data_products["orders"].domain == "sales"
+        for result in (results[0], results[5]):
+            job = db.get_job(result["job_id"])
+            assert job.data_product == result["name"] and job.status == "succeeded"
+        assert db.unfinished_jobs() == []
+
+
+def test_batch_coalesces_with_running_jobs(registry):
+    release = threading.Event()
+    runner = ProvisioningRunner(steps=[ProvisioningStep("code_repository", lambda dp: release.wait(10))], db_path=registry)
+    try:
+        (job, coalesced), = runner.create_many([product("orders")])
+        assert not coalesced
+        again = runner.create_many([product("orders"), product("users")])
+        assert again[0][0].id == job.id and again[0][1]
+        assert not again[1][1]
+        assert runner.create(product("orders"))[0].id == job.id
+        release.set()
+        assert runner.join(timeout=10)
+        assert runner.create_many([product("orders")]) == [None]
+        with pytest.raises(KeyError):
+            runner.create(product("orders"))
+    finally:
+        release.set()
+        runner.shutdown()
+
+
+class FlakyStep:
+    """Step failing on its first `failures` calls, recording the products it ran for."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, dp: DataProductState):
+        self.calls.append(dp.name)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError(f"{dp.name} failed")
+
+
+def test_failed_job_resumes_from_its_failed_step(registry):
+    repository, group, catalog = FlakyStep(), FlakyStep(failures=1), FlakyStep()
+    runner = ProvisioningRunner(steps=[
+        ProvisioningStep("code_repository", repository),
+        ProvisioningStep("keycloak_group", group),
+        ProvisioningStep("trino_dev_catalog", catalog),
+    ], db_path=registry)
+    try:
+        job, _ = runner.create(product("orders"))
+        assert runner.join(timeout=10)
+        job, dp = runner.get(job.id)
+        assert (job.status, job.step, job.error) == ("failed", "keycloak_group", "orders failed")
+        assert dp.code_repository and not dp.keycloak_group and not dp.trino_dev_catalog
+        assert runner.progress(dp) == [
+            {"step": "code_repository", "done": True},
+            {"step": "keycloak_group", "done": False},
+            {"step": "trino_dev_catalog", "done": False},
+        ]
+
+        # a job left running by a process that died is resumed from its first unfinished step
+        with LocalDB(path=registry, legacy_path=None) as db:
+            db.put_job(job.model_copy(update={"status": "running", "error": None}))
+        runner.resume()
+        assert runner.join(timeout=10)
+        job, dp = runner.get(job.id)
+        assert job.status == "succeeded" and job.step is None
+        assert dp.keycloak_group and dp.trino_dev_catalog
+        assert repository.calls == ["orders"]
+        assert group.calls == ["orders", "orders"]
+        assert catalog.calls == ["orders"]
+    finally:
+        runner.shutdown()
+
+
+def test_per_domain_concurrency(registry):
+    lock = threading.Lock()
+    running, peak = {}, {}
+
+    def step(dp: DataProductState):
+        with lock:
+            running[dp.domain] = running.get(dp.domain, 0) + 1
+            peak[dp.domain] = max(peak.get(dp.domain, 0), running[dp.domain])
+        time.sleep(0.05)
+        with lock:
+            running[dp.domain] -= 1
+
+    runner = ProvisioningRunner(steps=[ProvisioningStep("code_repository", step)], db_path=registry, max_workers=8, per_domain=2)
+    try:
+        runner.create_many([product(f"sales_{i}") for i in range(6)] + [product(f"hr_{i}", domain="hr") for i in range(3)])
+        assert runner.join(timeout=10)
+    finally:
+        runner.shutdown()
+    assert peak == {"sales": 2, "hr": 2}
+    with LocalDB(path=registry, legacy_path=None) as db:
+        assert all(db.data_products[name].code_repository for name in db.data_products)
+        assert db.unfinished_jobs() == []
+
+
+def test_reconciler_only_repairs_drifted_flags(registry):
+    existing = {"converged", "unflagged"}
+    repository = FlakyStep()
+    group = FlakyStep()
+    runner = ProvisioningRunner(steps=[
+        ProvisioningStep("code_repository", repository, observe=lambda: set(existing)),
+        ProvisioningStep("keycloak_group", group),
+    ], db_path=registry)
+    with LocalDB(path=registry, legacy_path=None) as db:
+        db.insert(product("converged", code_repository=True, keycloak_group=True))
+        # flagged, but its repository is gone
+        db.insert(product("missing", code_repository=True, keycloak_group=True))
+        # repository present, flag never saved
+        db.insert(product("unflagged", keycloak_group=True))
+        # never provisioned by the step without observe
+        db.insert(product("ungrouped", code_repository=False))
+    existing.add("ungrouped")
+
+    report = Reconciler(runner).reconcile()
+    assert sorted(report["repaired"]) == ["missing", "unflagged", "ungrouped"]
+    assert report["failed"] == {}
+    assert (report["data_products"], report["converged"]) == (4, 1)
+    assert repository.calls == ["missing"]
+    assert group.calls == ["ungrouped"]
+    with LocalDB(path=registry, legacy_path=None) as db:
+        for name in db.data_products:
+            assert db.data_products[name].code_repository and db.data_products[name].keycloak_group, name
+
+    # converged: the next pass has nothing to do
+    existing.add("missing")
+    report = Reconciler(runner).reconcile()
+    assert report["repaired"] == [] and report["converged"] == 4
+    assert repository.calls == ["missing"] and group.calls == ["ungrouped"]
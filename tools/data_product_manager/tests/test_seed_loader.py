@@ -0,0 +1,203 @@
+import io
+import os
+import json
+import datetime
+from decimal import Decimal
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.fs as pa_fs
+import pyarrow.parquet as pq
+
+from data_product_manager.componants import iceberg
+from data_product_manager.componants.seed_loader import SeedLoader, connect_catalog
+
+COLUMN_TYPES = {"amount": "decimal(10, 2)", "paid_at": "timestamp(6) with time zone"}
+
+
+# --- Avro object container files, decoded independently of iceberg.write_avro ---
+
+def read_long(f: io.BytesIO) -> int:
+    shift = value = 0
+    while True:
+        byte = f.read(1)[0]
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (value >> 1) ^ -(value & 1)
+
+
+def read_bytes(f: io.BytesIO) -> bytes:
+    return f.read(read_long(f))
+
+
+def decode(schema, f: io.BytesIO):
+    if isinstance(schema, list):
+        return decode(schema[read_long(f)], f)
+    kind = schema if isinstance(schema, str) else schema["type"]
+    if kind == "null":
+        return None
+    if kind in ("int", "long"):
+        return read_long(f)
+    if kind == "string":
+        return read_bytes(f).decode()
+    if kind == "bytes":
+        return read_bytes(f)
+    if kind == "boolean":
+        return f.read(1) == b"\x01"
+    if kind == "record":
+        return {field["name"]: decode(field["type"], f) for field in schema["fields"]}
+    if kind == "array":
+        items = []
+        while (count := read_long(f)) != 0:
+            if count < 0:
+                count = -count
+                read_long(f)
+            items += [decode(schema["items"], f) for _ in range(count)]
+        if schema.get("logicalType") == "map":
+            return {item["key"]: item["value"] for item in items}
+        return items
+    raise ValueError(f"Unsupported Avro type {kind}.")
+
+
+def read_avro(path: str):
+    """Header metadata, schema and records of an Avro object container file."""
+    with open(path, "rb") as fh:
+        f = io.BytesIO(fh.read())
+    assert f.read(4) == b"Obj\x01"
+    metadata = {}
+    while (count := read_long(f)) != 0:
+        for _ in range(count):
+            key = read_bytes(f).decode()
+            metadata[key] = read_bytes(f).decode()
+    sync = f.read(16)
+    schema = json.loads(metadata["avro.schema"])
+    assert metadata["avro.codec"] == "null"
+    records = []
+    while f.tell() < len(f.getvalue()):
+        count = read_long(f)
+        block = io.BytesIO(read_bytes(f))
+        records += [decode(schema, block) for _ in range(count)]
+        assert f.read(16) == sync
+    return metadata, schema, records
+
+
+def field_ids(schema: dict) -> dict:
+    return {field["name"]: field["field-id"] for field in schema["fields"]}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = iceberg.JdbcCatalog(connect_catalog(f"sqlite:///{tmp_path / 'catalog.db'}"), "dp_orders_dev")
+    catalog.ensure_schema()
+    return catalog
+
+
+@pytest.fixture
+def loader(tmp_path, catalog):
+    return SeedLoader(pa_fs.LocalFileSystem(), str(tmp_path / "warehouse"), catalog)
+
+
+def read_metadata(location: str) -> dict:
+    with open(location) as f:
+        return json.load(f)
+
+
+def table_files(metadata: dict) -> list:
+    return sorted(
+        os.path.join(directory, name)
+        for directory in ("data", "metadata")
+        for name in os.listdir(os.path.join(metadata["location"], directory))
+    )
+
+
+def test_load_and_reload(tmp_path, catalog, loader):
+    seed = tmp_path / "payments.csv"
+    seed.write_text("id,amount,paid_at\n1,10.50,2024-01-01T10:00:00+02:00\n2,,2024-01-02T00:00:00Z\n3,0.01,\n")
+    first = loader.load(str(seed), column_types=COLUMN_TYPES)
+    assert (first["table"], first["rows"], first["files"]) == ("dbt.payments", 3, 1)
+    assert catalog.metadata_location("dbt", "payments") == first["metadata_location"]
+
+    metadata = read_metadata(first["metadata_location"])
+    assert [(f["id"], f["name"], f["type"]) for f in iceberg.current_schema(metadata)["fields"]] == [
+        (1, "id", "long"), (2, "amount", "decimal(10,2)"), (3, "paid_at", "timestamptz"),
+    ]
+    (snapshot,) = metadata["snapshots"]
+    assert snapshot["summary"]["operation"] == "append" and "parent-snapshot-id" not in snapshot
+
+    # manifest list and manifest
+    header, schema, (manifest,) = read_avro(snapshot["manifest-list"])
+    assert header["snapshot-id"] == str(snapshot["snapshot-id"]) and header["parent-snapshot-id"] == "None"
+    assert field_ids(schema)["added_rows_count"] == 512
+    assert (manifest["added_snapshot_id"], manifest["added_files_count"], manifest["added_rows_count"]) == (snapshot["snapshot-id"], 1, 3)
+    assert manifest["manifest_length"] == os.path.getsize(manifest["manifest_path"])
+    header, schema, (entry,) = read_avro(manifest["manifest_path"])
+    assert json.loads(header["schema"]) == iceberg.current_schema(metadata)
+    assert field_ids(schema) == {"status": 0, "snapshot_id": 1, "sequence_number": 3, "file_sequence_number": 4, "data_file": 2}
+    data_file = entry["data_file"]
+    assert (entry["status"], entry["sequence_number"], data_file["record_count"]) == (1, 1, 3)
+    assert data_file["value_counts"] == {1: 3, 2: 3, 3: 3}
+    assert data_file["null_value_counts"] == {1: 0, 2: 1, 3: 1}
+    assert data_file["file_size_in_bytes"] == os.path.getsize(data_file["file_path"])
+
+    # Parquet, typed by column_types, with the field ids of the schema
+    parquet = pq.read_table(data_file["file_path"])
+    assert [field.metadata[b"PARQUET:field_id"] for field in parquet.schema] == [b"1", b"2", b"3"]
+    assert parquet.schema.field("amount").type == pa.decimal128(10, 2)
+    assert parquet.column("amount").to_pylist() == [Decimal("10.50"), None, Decimal("0.01")]
+    assert parquet.column("paid_at").to_pylist()[:2] == [
+        datetime.datetime(2024, 1, 1, 8, tzinfo=datetime.timezone.utc),
+        datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc),
+    ]
+
+    # a new column is added with a new field id, existing ones keep theirs
+    seed.write_text("id,note,amount\n1,first,1.00\n2,second,2.00\n")
+    second = loader.load(str(seed), column_types=COLUMN_TYPES)
+    metadata = read_metadata(second["metadata_location"])
+    assert metadata["location"] == read_metadata(first["metadata_location"])["location"]
+    assert [(f["id"], f["name"]) for f in iceberg.current_schema(metadata)["fields"]] == [(1, "id"), (4, "note"), (2, "amount")]
+    assert (metadata["current-schema-id"], metadata["last-column-id"], len(metadata["schemas"])) == (1, 4, 2)
+    assert metadata["metadata-log"][-1]["metadata-file"] == first["metadata_location"]
+    parent, current = metadata["snapshots"]
+    assert current["parent-snapshot-id"] == parent["snapshot-id"] == snapshot["snapshot-id"]
+    assert (current["sequence-number"], metadata["last-sequence-number"]) == (2, 2)
+    assert current["summary"]["operation"] == "overwrite"
+    assert (current["summary"]["deleted-records"], current["summary"]["added-records"]) == ("3", "2")
+
+    header, _, (manifest,) = read_avro(current["manifest-list"])
+    assert header["parent-snapshot-id"] == str(parent["snapshot-id"])
+    assert (manifest["sequence_number"], manifest["added_rows_count"]) == (2, 2)
+    _, _, (entry,) = read_avro(manifest["manifest_path"])
+    assert entry["data_file"]["value_counts"] == {1: 2, 4: 2, 2: 2}
+    parquet = pq.read_table(entry["data_file"]["file_path"])
+    assert [field.metadata[b"PARQUET:field_id"] for field in parquet.schema] == [b"1", b"4", b"2"]
+    assert parquet.column("note").to_pylist() == ["first", "second"]
+
+
+def test_changed_column_type(tmp_path, loader):
+    seed = tmp_path / "payments.csv"
+    seed.write_text("id,amount\n1,10.50\n")
+    loader.load(str(seed), column_types=COLUMN_TYPES)
+    with pytest.raises(ValueError, match="amount"):
+        loader.load(str(seed))
+    with pytest.raises(ValueError, match="Unsupported seed column type"):
+        loader.load(str(seed), column_types={"amount": "money"})
+
+
+def test_lost_commit_race(tmp_path, catalog, loader, monkeypatch):
+    seed = tmp_path / "payments.csv"
+    seed.write_text("id,amount\n1,10.50\n")
+    first = loader.load(str(seed), table="payments")
+    second = loader.load(str(seed), table="payments")
+    metadata = read_metadata(second["metadata_location"])
+    before = table_files(metadata)
+
+    # another writer committed since the metadata this load is based on was read
+    monkeypatch.setattr(catalog, "metadata_location", lambda namespace, table: first["metadata_location"])
+    with pytest.raises(iceberg.CommitConflictError):
+        loader.load(str(seed), table="payments")
+    monkeypatch.undo()
+    assert catalog.metadata_location("dbt", "payments") == second["metadata_location"]
+    # the Parquet, manifests and metadata written for the lost commit are removed
+    assert table_files(metadata) == before
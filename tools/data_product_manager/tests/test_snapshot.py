@@ -0,0 +1,179 @@
+import json
+import random
+import sqlite3
+import itertools
+
+import pytest
+
+from data_product_manager.db import FLAG_FIELDS, SNAPSHOTS, DataProductRecord, DataProductState, LocalDB, Snapshot, _to_row
+
+DOMAINS = ["sales", "supply", "finance", "hr"]
+
+
+def product(name: str, domain: str = "sales", **flags) -> DataProductState:
+    return DataProductState(name=name, domain=domain, description=f"{name} data", admin_emails=[f"{name}@example.com"], **flags)
+
+
+def random_products(rng: random.Random, count: int, prefix: str = "p"):
+    return [
+        product(f"{prefix}{i:03d}", domain=rng.choice(DOMAINS), **{flag: rng.random() < 0.5 for flag in FLAG_FIELDS})
+        for i in range(count)
+    ]
+
+
+def scan(records, **filters):
+    filters = {k: v for k, v in filters.items() if v is not None}
+    return sorted(name for name, dp in records.items() if all(getattr(dp, k) == v for k, v in filters.items()))
+
+
+def combinations():
+    for domain, flag, value in itertools.product([None, *DOMAINS], [None, *FLAG_FIELDS], [True, False]):
+        filters = {"domain": domain}
+        if flag is not None:
+            filters[flag] = value
+        yield filters
+
+
+def pages(find, limit, **filters):
+    names, cursor = [], None
+    while True:
+        page, cursor = find(after=cursor, limit=limit, **filters)
+        names.extend(page)
+        if cursor is None:
+            return names
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "products_db.sqlite")
+
+
+def test_find_rejects_empty_pages(db_path):
+    snapshot = Snapshot(1, {"orders": DataProductRecord.from_state(product("orders"))})
+    with LocalDB(path=db_path, legacy_path=None) as db:
+        db.insert(product("orders"))
+    with pytest.raises(ValueError):
+        snapshot.find(limit=0)
+    with LocalDB(path=db_path, legacy_path=None) as db:
+        with pytest.raises(ValueError):
+            db.find(limit=0)
+        assert db.find(limit=1)[1:] == (["orders"], None)
+
+
+def test_index_matches_full_scan(db_path):
+    rng = random.Random(0)
+    with LocalDB(path=db_path, legacy_path=None) as db:
+        for dp in random_products(rng, 120):
+            db.insert(dp)
+    with LocalDB(path=db_path, legacy_path=None) as db:
+        snapshot = db.snapshot()
+        records = {name: db.data_products[name] for name in db.data_products}
+        # flip flags and move records between domains, the cached snapshot is updated in place of a reload
+        for name in rng.sample(sorted(records), 40):
+            db.update(name, domain=rng.choice(DOMAINS), **{flag: rng.random() < 0.5 for flag in FLAG_FIELDS})
+        db.save()
+        records = {name: db.data_products[name] for name in db.data_products}
+        updated = SNAPSHOTS.peek(db_path)
+        assert updated is not snapshot and updated.version == snapshot.version + 1
+
+        rebuilt = Snapshot(updated.version, updated.data_products)
+        assert updated.names == rebuilt.names
+        assert {k: v for k, v in updated.index.items() if v} == {k: v for k, v in rebuilt.index.items() if v}
+        for filters in combinations():
+            expected = scan(records, **filters)
+            assert updated.find(**filters) == (expected, None), filters
+            assert db.find(**filters)[1] == expected, filters
+            assert pages(updated.find, 7, **filters) == expected, filters
+            assert pages(lambda **kwargs: db.find(**kwargs)[1:], 7, **filters) == expected, filters
+
+
+def test_write_through(db_path):
+    with LocalDB(path=db_path, legacy_path=None) as db:
+        db.insert(product("orders"))
+    db = LocalDB(path=db_path, legacy_path=None)
+    snapshot = db.snapshot()
+    assert snapshot.names == ["orders"]
+    misses = SNAPSHOTS.misses
+    assert db.snapshot() is snapshot
+
+    # writes of this process are applied to the cached snapshot
+    with LocalDB(path=db_path, legacy_path=None) as writer:
+        writer.insert(product("stocks", domain="supply"))
+        writer.update("orders", code_repository=True)
+    snapshot = db.snapshot()
+    assert snapshot.names == ["orders", "stocks"]
+    assert snapshot.data_products["orders"].code_repository
+    assert snapshot.find(domain="supply") == (["stocks"], None)
+    assert SNAPSHOTS.misses == misses
+
+    # writes of another process only move the store version: reload
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("UPDATE data_products SET domain = 'finance' WHERE name = 'orders'")
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+    conn.close()
+    reloaded = db.snapshot()
+    assert reloaded.version == snapshot.version + 1
+    assert reloaded.find(domain="finance") == (["orders"], None)
+    assert SNAPSHOTS.misses == misses + 1
+
+    # a save that does not follow the cached version drops the snapshot
+    SNAPSHOTS.write_through(db_path, reloaded.version + 2, [product("other")])
+    assert SNAPSHOTS.peek(db_path) is None
+    assert "other" not in db.snapshot().data_products
+
+
+def test_cursor_is_stable_across_inserts(db_path):
+    with LocalDB(path=db_path, legacy_path=None) as db:
+        for i in range(0, 40, 2):
+            db.insert(product(f"p{i:03d}"))
+    for find in ("snapshot", "store"):
+        names, cursor, inserted = [], None, []
+        with LocalDB(path=db_path, legacy_path=None) as db:
+            while True:
+                if find == "snapshot":
+                    page, cursor = db.snapshot().find(after=cursor, limit=5)
+                else:
+                    _, page, cursor = db.find(after=cursor, limit=5)
+                names.extend(page)
+                if cursor is None:
+                    break
+                # one record before the cursor, missed by this listing, and one right after it
+                db.insert(product(f"a-{find}-{len(inserted)}"))
+                if not cursor.endswith(f"-{find}"):
+                    inserted.append(f"{cursor}-{find}")
+                    db.insert(product(inserted[-1]))
+                db.save()
+        assert len(names) == len(set(names))
+        assert names == sorted(names)
+        assert {f"p{i:03d}" for i in range(0, 40, 2)} | set(inserted) <= set(names)
+        assert inserted and not any(name.startswith(f"a-{find}") for name in names)
+
+
+def test_list_etag(registry, client):
+    with LocalDB(path=registry, legacy_path=None) as db:
+        db.insert(product("orders"))
+    response = client.get("/data-product", params={"limit": 10})
+    assert response.status_code == 200
+    assert response.json() == {"data_products": ["orders"], "next_cursor": None}
+    etag = response.headers["etag"]
+
+    response = client.get("/data-product", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    with LocalDB(path=registry, legacy_path=None) as db:
+        db.update("orders", code_repository=True)
+    response = client.get("/data-product", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_record_reads_like_the_state():
+    dp = product("orders \"eu\"", domain="sales", code_repository=True, trino_prd_catalog=True)
+    for record in (DataProductRecord.from_state(dp), DataProductRecord.from_row(_to_row(dp))):
+        assert record.state() == dp
+        assert json.loads(record.encoded()) == dp.model_dump()
+        assert record.encoded().endswith(b"\n")
+        assert [getattr(record, flag) for flag in FLAG_FIELDS] == [getattr(dp, flag) for flag in FLAG_FIELDS]
+        assert record.admin_emails == dp.admin_emails
@@ -0,0 +1,66 @@
+import json
+import random
+import functools
+
+from data_product_manager import service
+from data_product_manager.db import FLAG_FIELDS, DataProductState, LocalDB
+
+
+def product(name: str, domain: str = "sales", **fields) -> DataProductState:
+    return DataProductState(**{"name": name, "domain": domain, "description": f"{name} data", "admin_emails": [f"{name}@example.com"], **fields})
+
+
+def registry_state(path: str) -> dict:
+    with LocalDB(path=path, legacy_path=None) as db:
+        return {name: db.data_products[name].model_dump() for name in db.data_products}
+
+
+def test_export_import_round_trip(registry, client, tmp_path, monkeypatch):
+    rng = random.Random(0)
+    with LocalDB(path=registry, legacy_path=None) as db:
+        for i in range(50):
+            db.insert(product(f"p{i:02d}", domain=rng.choice(["sales", "hr"]), **{flag: rng.random() < 0.5 for flag in FLAG_FIELDS}))
+        db.insert(product("quoted", description='a "quoted" \\ descriptioné'))
+    exported = client.get("/data-product/export", params={"batch_size": 7})
+    assert exported.status_code == 200
+    assert exported.headers["content-type"] == "application/x-ndjson"
+    assert int(exported.headers["x-registry-version"]) >= 1
+    assert int(exported.headers["x-changes-seq"]) == 51
+    lines = exported.content.splitlines()
+    assert [json.loads(line)["name"] for line in lines] == sorted(registry_state(registry))
+
+    # import into an empty registry holding one stale record
+    target = str(tmp_path / "target.sqlite")
+    monkeypatch.setattr(service, "LocalDB", functools.partial(LocalDB, path=target, legacy_path=None))
+    with LocalDB(path=target, legacy_path=None) as db:
+        db.insert(product("p00", domain="stale"))
+    report = client.post("/data-product/import", params={"batch_size": 8}, content=exported.content).json()
+    assert report == {"imported": 51, "batches": 7, "invalid": 0, "errors": []}
+    assert registry_state(target) == registry_state(registry)
+
+
+def test_invalid_lines_are_reported(registry, client):
+    body = b"\n".join([
+        product("orders").model_dump_json().encode(),
+        b"not json",
+        b'{"name": "missing"}',
+        b"",
+        product("users").model_dump_json().encode(),
+    ])
+    report = client.post("/data-product/import", content=body).json()
+    assert (report["imported"], report["invalid"], report["batches"]) == (2, 2, 1)
+    assert [error["line"] for error in report["errors"]] == [2, 3]
+    assert sorted(registry_state(registry)) == ["orders", "users"]
+
+
+def test_import_in_arbitrary_chunks(registry, monkeypatch):
+    monkeypatch.setattr(service, "MAX_IMPORT_LINE", 400)
+    lines = [product(f"p{i}").model_dump_json().encode() for i in range(5)]
+    body = b"\n".join([lines[0], b'{"name": "' + b"x" * 1000 + b'"}', *lines[1:]])
+    importer = service.DataProductImporter(batch_size=2)
+    for i in range(0, len(body), 3):
+        importer.feed(body[i:i + 3])
+    report = importer.close()
+    assert (report["imported"], report["batches"], report["invalid"]) == (5, 3, 1)
+    assert report["errors"][0]["line"] == 2
+    assert sorted(registry_state(registry)) == [f"p{i}" for i in range(5)]
@@ -0,0 +1,104 @@
+import os
+import json
+
+import pytest
+
+from data_product_manager.componants.trino_catalog import MANIFEST_NAME, CatalogDirectory, CatalogSettings, render_catalogs
+
+PRODUCTS = [("sales", "orders"), ("sales", "customers"), ("hr", "people")]
+
+
+def mtimes(path) -> dict:
+    return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(path)}
+
+
+@pytest.fixture
+def catalogs(tmp_path):
+    directory = tmp_path / "catalog"
+    directory.mkdir()
+    # hand-written catalogs, never generated
+    (directory / "mydata.properties").write_text("connector.name=iceberg\n")
+    (directory / "dp_legacy_dev.properties").write_text("connector.name=hive\n")
+    return directory
+
+
+def test_unchanged_products_are_not_rewritten(catalogs):
+    directory = CatalogDirectory(str(catalogs))
+    files = render_catalogs(CatalogSettings(), PRODUCTS)
+    report = directory.sync(files)
+    assert report == {"written": sorted(files), "unchanged": [], "removed": []}
+    assert (catalogs / "dp_orders_prd.properties").read_text() == files["dp_orders_prd.properties"]
+    assert "iceberg.jdbc-catalog.default-warehouse-dir=s3://warehouse/hr/people/dev" in files["dp_people_dev.properties"]
+    before = mtimes(catalogs)
+
+    report = directory.sync(render_catalogs(CatalogSettings(), PRODUCTS))
+    assert report == {"written": [], "unchanged": sorted(files), "removed": []}
+    # neither the catalogs nor the manifest are rewritten
+    assert mtimes(catalogs) == before
+
+    # a new product only writes its own catalogs
+    report = directory.sync(render_catalogs(CatalogSettings(), [*PRODUCTS, ("hr", "payroll")]))
+    assert report["written"] == ["dp_payroll_dev.properties", "dp_payroll_prd.properties"]
+
+
+def test_changed_settings_rewrite_affected_files(catalogs):
+    directory = CatalogDirectory(str(catalogs))
+    directory.sync(render_catalogs(CatalogSettings(), PRODUCTS))
+
+    # a product moved to another domain only changes its warehouse location
+    moved = [("sales", "orders"), ("sales", "customers"), ("finance", "people")]
+    report = directory.sync(render_catalogs(CatalogSettings(), moved))
+    assert report["written"] == ["dp_people_dev.properties", "dp_people_prd.properties"]
+    assert len(report["unchanged"]) == 4
+
+    report = directory.sync(render_catalogs(CatalogSettings(jdbc_password="rotated"), moved))
+    assert len(report["written"]) == 6
+    assert "connection-password=rotated" in (catalogs / "dp_orders_dev.properties").read_text()
+
+    # a file edited by hand is detected, whatever the manifest says, and regenerated
+    (catalogs / "dp_orders_dev.properties").write_text("edited")
+    report = directory.sync(render_catalogs(CatalogSettings(jdbc_password="rotated"), moved))
+    assert report["written"] == ["dp_orders_dev.properties"]
+    with open(catalogs / MANIFEST_NAME) as f:
+        assert sorted(json.load(f)) == sorted(render_catalogs(CatalogSettings(), moved))
+
+
+def test_prune_keeps_hand_written_catalogs(catalogs):
+    directory = CatalogDirectory(str(catalogs))
+    directory.sync(render_catalogs(CatalogSettings(), PRODUCTS))
+    assert directory.existing("dev") == {"orders", "customers", "people", "legacy"}
+
+    remaining = render_catalogs(CatalogSettings(), PRODUCTS[:1])
+    assert directory.sync(remaining)["removed"] == []
+    report = directory.sync(remaining, prune=True)
+    assert report["removed"] == [
+        "dp_customers_dev.properties", "dp_customers_prd.properties",
+        "dp_people_dev.properties", "dp_people_prd.properties",
+    ]
+    assert sorted(os.listdir(catalogs)) == sorted([
+        MANIFEST_NAME, "dp_legacy_dev.properties", "dp_orders_dev.properties", "dp_orders_prd.properties", "mydata.properties",
+    ])
+    assert (catalogs / "dp_legacy_dev.properties").read_text() == "connector.name=hive\n"
+
+
+def test_existing_without_directory(tmp_path):
+    assert CatalogDirectory(str(tmp_path / "missing")).existing("dev") == set()
+
+
+def test_catalog_directory_comes_from_the_config_directory(tmp_path, monkeypatch):
+    from data_product_manager import service
+
+    monkeypatch.delenv("TRINO_CATALOG_DIR", raising=False)
+    monkeypatch.delenv("CONFIG_DIR", raising=False)
+    monkeypatch.setattr(service, "_trino_catalogs", None)
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError, match="CONFIG_DIR"):
+        service.trino_catalogs()
+
+    (tmp_path / "config").mkdir()
+    assert service.trino_catalogs().path == os.path.join("config", "trino", "catalog")
+
+    monkeypatch.setattr(service, "_trino_catalogs", None)
+    monkeypatch.setenv("CONFIG_DIR", str(tmp_path / "elsewhere"))
+    with pytest.raises(FileNotFoundError, match="elsewhere"):
+        service.trino_catalogs()